@@ -2,6 +2,7 @@
 ### Script for importing courseware from XML format
 ###
 
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from xmodule.modulestore.xml_importer import import_from_xml
 from xmodule.modulestore.django import modulestore
@@ -27,4 +28,5 @@ class Command(BaseCommand):
             data=data_dir,
             courses=course_dirs)
         import_from_xml(modulestore('direct'), data_dir, course_dirs, load_error_modules=False,
-                        static_content_store=contentstore(), verbose=True)
+                        static_content_store=contentstore(), verbose=True,
+                        course_load_processes=settings.XML_COURSE_LOAD_PROCESSES)
@@ -145,6 +145,19 @@ DATABASES = AUTH_TOKENS['DATABASES']
 MODULESTORE = AUTH_TOKENS['MODULESTORE']
 CONTENTSTORE = AUTH_TOKENS['CONTENTSTORE']
 
+# The number of processes that the import command loads courses from xml in
+XML_COURSE_LOAD_PROCESSES = ENV_TOKENS.get('XML_COURSE_LOAD_PROCESSES', XML_COURSE_LOAD_PROCESSES)
+
+# The split mongo modulestore keeps the course structures it loads in each process, and
+# each course's index entry for SPLIT_INDEX_CACHE_TTL seconds (which bounds how long a
+# change made by another process can take to be seen)
+SPLIT_STRUCTURE_CACHE_SIZE = ENV_TOKENS.get('SPLIT_STRUCTURE_CACHE_SIZE', 50 * 1024 * 1024)
+SPLIT_INDEX_CACHE_TTL = ENV_TOKENS.get('SPLIT_INDEX_CACHE_TTL', 5)
+for store in MODULESTORE.values():
+    if store['ENGINE'] == 'xmodule.modulestore.split_mongo.SplitMongoModuleStore':
+        store.setdefault('OPTIONS', {}).setdefault('structure_cache_size', SPLIT_STRUCTURE_CACHE_SIZE)
+        store['OPTIONS'].setdefault('index_cache_ttl', SPLIT_INDEX_CACHE_TTL)
+
 # Datadog for events!
 DATADOG_API = AUTH_TOKENS.get("DATADOG_API")
 
@@ -74,6 +74,9 @@ ENV_ROOT = REPO_ROOT.dirname()  # virtualenv dir /mitx is in
 
 GITHUB_REPO_ROOT = ENV_ROOT / "data"
 
+# The number of processes that the import command loads courses from xml in
+XML_COURSE_LOAD_PROCESSES = 1
+
 sys.path.append(REPO_ROOT)
 sys.path.append(PROJECT_ROOT / 'djangoapps')
 sys.path.append(PROJECT_ROOT / 'lib')
@@ -36,7 +36,7 @@ MODULESTORE = {
     },
     'split': {
         'ENGINE': 'xmodule.modulestore.split_mongo.SplitMongoModuleStore',
-        'OPTIONS': modulestore_options
+        'OPTIONS': dict(modulestore_options, structure_cache_size=50 * 1024 * 1024, index_cache_ttl=5)
     }
 }
 
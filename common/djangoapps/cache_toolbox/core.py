@@ -119,3 +119,16 @@ def get_cached_content(location):
 
 def del_cached_content(location):
     cache.delete(str(location))
+
+
+def _content_chunk_key(location, content_digest, index):
+    # the digest is part of the key, so chunks of replaced content are never served
+    return '{0}:{1}:{2}'.format(location, content_digest, index)
+
+
+def get_cached_content_chunk(location, content_digest, index):
+    return cache.get(_content_chunk_key(location, content_digest, index))
+
+
+def set_cached_content_chunk(location, content_digest, index, chunk):
+    cache.set(_content_chunk_key(location, content_digest, index), chunk)
@@ -1,11 +1,58 @@
+import calendar
+import re
+
+from django.conf import settings
 from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
 
 from xmodule.contentstore.django import contentstore
-from xmodule.contentstore.content import StaticContent, XASSET_LOCATION_TAG
+from xmodule.contentstore.content import StaticContent, StaticContentStream, XASSET_LOCATION_TAG
 from xmodule.modulestore import InvalidLocationError
-from cache_toolbox.core import get_cached_content, set_cached_content
+from cache_toolbox.core import (get_cached_content, set_cached_content,
+                                get_cached_content_chunk, set_cached_content_chunk)
 from xmodule.exceptions import NotFoundError
 
+# content smaller than this is cached whole; larger content is cached chunk by chunk
+MAX_CACHED_CONTENT_SIZE = 1048576
+# content larger than this isn't cached at all, so that it doesn't push everything else out
+# of the cache; it's streamed from the contentstore every time
+MAX_CHUNK_CACHED_CONTENT_SIZE = 4 * 1048576
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range_header(header, length):
+    """
+    Returns the (first_byte, last_byte) pair, inclusive, that the Range header asks
+    for out of length bytes of content.  Returns None if the header should be
+    ignored (because it's malformed, or asks for multiple ranges), and raises
+    ValueError if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if length == 0:
+        raise ValueError(header)
+    if first == '':
+        if last == '':
+            return None
+        # a suffix range: the last N bytes
+        suffix_length = int(last)
+        if suffix_length == 0:
+            raise ValueError(header)
+        return max(length - suffix_length, 0), length - 1
+
+    first = int(first)
+    last = length - 1 if last == '' else min(int(last), length - 1)
+    if first > last:
+        if first < length:
+            # last < first: a malformed range
+            return None
+        raise ValueError(header)
+    return first, last
+
 
 class StaticContentServer(object):
     def process_request(self, request):
@@ -31,9 +78,9 @@ class StaticContentServer(object):
                     return response
 
                 # since we fetched it from DB, let's cache it going forward, but only if it's < 1MB
-                # this is because I haven't been able to find a means to stream data out of memcached
+                # larger content is cached a chunk at a time as it's served (up to 4MB), below
                 if content.length is not None:
-                    if content.length < 1048576:
+                    if content.length < MAX_CACHED_CONTENT_SIZE:
                         # since we've queried as a stream, let's read in the stream into memory to set in cache
                         content = content.copy_to_in_mem()
                         set_cached_content(content)
@@ -41,20 +88,111 @@ class StaticContentServer(object):
                 # NOP here, but we may wish to add a "cache-hit" counter in the future
                 pass
 
-            # see if the last-modified at hasn't changed, if not return a 302 (Not Modified)
+            last_modified_at = calendar.timegm(content.last_modified_at.utctimetuple())
+            last_modified_at_str = http_date(last_modified_at)
+            # content cached before digests were recorded doesn't have one
+            content_digest = getattr(content, 'content_digest', None)
+            etag = '"{0}"'.format(content_digest) if content_digest is not None else None
 
-            # convert over the DB persistent last modified timestamp to a HTTP compatible
-            # timestamp, so we can simply compare the strings
-            last_modified_at_str = content.last_modified_at.strftime("%a, %d-%b-%Y %H:%M:%S GMT")
+            # see if the client has cached this content, if so then return a 304 (Not Modified)
+            if self._is_not_modified(request, etag, last_modified_at):
+                response = HttpResponseNotModified()
+                self._set_caching_headers(response, etag, last_modified_at_str)
+                return response
 
-            # see if the client has cached this content, if so then compare the
-            # timestamps, if they are the same then just return a 304 (Not Modified)
-            if 'HTTP_IF_MODIFIED_SINCE' in request.META:
-                if_modified_since = request.META['HTTP_IF_MODIFIED_SINCE']
-                if if_modified_since == last_modified_at_str:
-                    return HttpResponseNotModified()
+            length = content.length
+            if length is None:
+                length = len(content.data)
 
-            response = HttpResponse(content.stream_data(), content_type=content.content_type)
-            response['Last-Modified'] = last_modified_at_str
+            byte_range = None
+            if 'HTTP_RANGE' in request.META and self._if_range_matches(request, etag, last_modified_at_str):
+                try:
+                    byte_range = parse_range_header(request.META['HTTP_RANGE'], length)
+                except ValueError:
+                    response = HttpResponse(status=416)
+                    response['Content-Range'] = 'bytes */{0}'.format(length)
+                    return response
+
+            first_byte, last_byte = byte_range if byte_range is not None else (0, length - 1)
+            if self._is_chunk_cached(content):
+                data = self._stream_cached_chunks(content, content_digest, first_byte, last_byte)
+            elif byte_range is not None:
+                data = content.stream_data_in_range(first_byte, last_byte)
+            else:
+                data = content.stream_data()
+
+            response = HttpResponse(data, content_type=content.content_type)
+            if byte_range is not None:
+                response.status_code = 206
+                response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(first_byte, last_byte, length)
+            response['Content-Length'] = str(last_byte - first_byte + 1)
+            response['Accept-Ranges'] = 'bytes'
+            self._set_caching_headers(response, etag, last_modified_at_str)
 
             return response
+
+    def _is_not_modified(self, request, etag, last_modified_at):
+        """
+        Returns whether the conditional headers on request say that the client's
+        copy of the content is current.  If-None-Match takes precedence over
+        If-Modified-Since.
+        """
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            if etag is None:
+                return False
+            if_none_match = [tag.strip() for tag in request.META['HTTP_IF_NONE_MATCH'].split(',')]
+            return '*' in if_none_match or etag in if_none_match
+
+        if 'HTTP_IF_MODIFIED_SINCE' in request.META:
+            if_modified_since = parse_http_date_safe(request.META['HTTP_IF_MODIFIED_SINCE'])
+            return if_modified_since is not None and last_modified_at <= if_modified_since
+
+        return False
+
+    def _if_range_matches(self, request, etag, last_modified_at_str):
+        """
+        Returns whether a Range header on request should be honored: it's only
+        honored if the If-Range header, if there is one, matches the content.
+        """
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None:
+            return True
+        return if_range in (etag, last_modified_at_str)
+
+    def _set_caching_headers(self, response, etag, last_modified_at_str):
+        """
+        Sets the headers that let clients cache and revalidate the content
+        """
+        response['Last-Modified'] = last_modified_at_str
+        if etag is not None:
+            response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age={0}'.format(
+            getattr(settings, 'STATIC_CONTENT_MAX_AGE', 0))
+
+    def _is_chunk_cached(self, content):
+        """
+        Returns whether content is served, and cached, a chunk at a time
+        """
+        return (
+            isinstance(content, StaticContentStream) and
+            content.chunk_size is not None and
+            content.content_digest is not None and
+            content.length is not None and
+            content.length <= MAX_CHUNK_CACHED_CONTENT_SIZE
+        )
+
+    def _stream_cached_chunks(self, content, content_digest, first_byte, last_byte):
+        """
+        Streams the bytes from first_byte to last_byte of content, reading the
+        chunks they're in from the cache, or from the content's stream (and then
+        caching them) if they're not there.
+        """
+        chunk_size = content.chunk_size
+        for index in xrange(first_byte // chunk_size, last_byte // chunk_size + 1):
+            chunk = get_cached_content_chunk(content.location, content_digest, index)
+            if chunk is None:
+                chunk = content.read_chunk(index)
+                set_cached_content_chunk(content.location, content_digest, index, chunk)
+
+            chunk_start = index * chunk_size
+            yield chunk[max(first_byte - chunk_start, 0):last_byte - chunk_start + 1]
@@ -0,0 +1,202 @@
+"""
+Tests for the StaticContentServer's handling of Range and conditional headers
+"""
+import calendar
+import datetime
+from StringIO import StringIO
+
+from mock import patch
+from pytz import UTC
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils.http import http_date
+
+from contentserver.middleware import parse_range_header, StaticContentServer
+from xmodule.contentstore.content import StaticContentStream
+from xmodule.modulestore import Location
+
+
+class ParseRangeHeaderTest(TestCase):
+    """
+    Tests for parse_range_header
+    """
+    def test_ranges(self):
+        self.assertEqual((0, 99), parse_range_header('bytes=0-99', 1000))
+        self.assertEqual((500, 999), parse_range_header('bytes=500-', 1000))
+        self.assertEqual((900, 999), parse_range_header('bytes=-100', 1000))
+        # ranges past the end are truncated
+        self.assertEqual((900, 999), parse_range_header('bytes=900-5000', 1000))
+        self.assertEqual((0, 999), parse_range_header('bytes=-5000', 1000))
+
+    def test_ignored_ranges(self):
+        self.assertIsNone(parse_range_header('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range_header('bytes=-', 1000))
+        self.assertIsNone(parse_range_header('bytes=50-10', 1000))
+        self.assertIsNone(parse_range_header('lines=0-10', 1000))
+
+    def test_unsatisfiable_ranges(self):
+        self.assertRaises(ValueError, parse_range_header, 'bytes=1000-', 1000)
+        self.assertRaises(ValueError, parse_range_header, 'bytes=-0', 1000)
+        self.assertRaises(ValueError, parse_range_header, 'bytes=0-10', 0)
+
+
+class StaticContentServerTest(TestCase):
+    """
+    Tests of the responses the StaticContentServer makes, with the content served from a
+    mocked contentstore and the caches replaced by dicts
+    """
+    PATH = '/c4x/edX/toy/asset/file.txt'
+    DATA = ''.join(chr(ord('a') + i % 26) for i in xrange(100))
+    DIGEST = 'abc123'
+    ETAG = '"abc123"'
+    LAST_MODIFIED = datetime.datetime(2013, 1, 1, tzinfo=UTC)
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.server = StaticContentServer()
+        self.cached_chunks = {}
+        self.read_chunks = []
+
+        patches = [
+            patch('contentserver.middleware.contentstore'),
+            patch('contentserver.middleware.get_cached_content', return_value=None),
+            patch('contentserver.middleware.set_cached_content'),
+            patch('contentserver.middleware.get_cached_content_chunk',
+                  side_effect=lambda location, digest, index: self.cached_chunks.get((digest, index))),
+            patch('contentserver.middleware.set_cached_content_chunk',
+                  side_effect=lambda location, digest, index, chunk: self.cached_chunks.__setitem__((digest, index), chunk)),
+        ]
+        mocks = [started.start() for started in patches]
+        for started in patches:
+            self.addCleanup(started.stop)
+        mocks[0].return_value.find.side_effect = lambda location, as_stream: self.make_content()
+
+    def make_content(self):
+        """
+        Returns the content at PATH, as the contentstore streams it
+        """
+        content = StaticContentStream(
+            Location(self.PATH[1:].split('/')), 'file.txt', 'text/plain', StringIO(self.DATA),
+            last_modified_at=self.LAST_MODIFIED, length=len(self.DATA), content_digest=self.DIGEST, chunk_size=16
+        )
+        read_chunk = content.read_chunk
+
+        def record_read_chunk(index):
+            """
+            Reads a chunk of the content, noting that it was read
+            """
+            self.read_chunks.append(index)
+            return read_chunk(index)
+        content.read_chunk = record_read_chunk
+        return content
+
+    def get(self, **headers):
+        """
+        Returns the server's response to a GET of PATH with headers
+        """
+        return self.server.process_request(self.factory.get(self.PATH, **headers))
+
+    def test_full_response(self):
+        response = self.get()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.DATA, response.content)
+        self.assertEqual('100', response['Content-Length'])
+        self.assertEqual('bytes', response['Accept-Ranges'])
+        self.assertEqual(self.ETAG, response['ETag'])
+        self.assertEqual(http_date(calendar.timegm(self.LAST_MODIFIED.utctimetuple())), response['Last-Modified'])
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual('bytes 10-19/100', response['Content-Range'])
+        self.assertEqual('10', response['Content-Length'])
+        self.assertEqual(self.DATA[10:20], response.content)
+
+        response = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual('bytes 95-99/100', response['Content-Range'])
+        self.assertEqual('5', response['Content-Length'])
+        self.assertEqual(self.DATA[95:], response.content)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE='bytes=100-')
+        self.assertEqual(416, response.status_code)
+        self.assertEqual('bytes */100', response['Content-Range'])
+        self.assertEqual('', response.content)
+
+    def test_if_none_match(self):
+        response = self.get(HTTP_IF_NONE_MATCH=self.ETAG)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(self.ETAG, response['ETag'])
+        self.assertEqual('', response.content)
+
+        response = self.get(HTTP_IF_NONE_MATCH='"other", *')
+        self.assertEqual(304, response.status_code)
+
+        response = self.get(HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.DATA, response.content)
+
+    def test_if_modified_since(self):
+        last_modified_at = calendar.timegm(self.LAST_MODIFIED.utctimetuple())
+        response = self.get(HTTP_IF_MODIFIED_SINCE=http_date(last_modified_at))
+        self.assertEqual(304, response.status_code)
+        self.assertEqual('', response.content)
+
+        response = self.get(HTTP_IF_MODIFIED_SINCE=http_date(last_modified_at - 60))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.DATA, response.content)
+
+        # If-None-Match takes precedence
+        response = self.get(HTTP_IF_MODIFIED_SINCE=http_date(last_modified_at), HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(200, response.status_code)
+
+    def test_if_range(self):
+        response = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=self.ETAG)
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(self.DATA[10:20], response.content)
+
+        # the content has changed since the client got its part, so it gets the whole
+        response = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"other"')
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn('Content-Range', response)
+        self.assertEqual('100', response['Content-Length'])
+        self.assertEqual(self.DATA, response.content)
+
+    @patch('contentserver.middleware.MAX_CACHED_CONTENT_SIZE', 0)
+    def test_stream_cached_chunks(self):
+        response = self.get(HTTP_RANGE='bytes=10-40')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual('bytes 10-40/100', response['Content-Range'])
+        self.assertEqual('31', response['Content-Length'])
+        self.assertEqual(self.DATA[10:41], response.content)
+        # the chunks the range is in are read from the content, and cached
+        self.assertEqual([0, 1, 2], self.read_chunks)
+        self.assertEqual([(self.DIGEST, 0), (self.DIGEST, 1), (self.DIGEST, 2)], sorted(self.cached_chunks))
+
+        # and then served from the cache, with only the uncached ones read
+        self.read_chunks = []
+        response = self.get()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.DATA, response.content)
+        self.assertEqual([3, 4, 5, 6], self.read_chunks)
+
+    @patch('contentserver.middleware.MAX_CACHED_CONTENT_SIZE', 0)
+    @patch('contentserver.middleware.MAX_CHUNK_CACHED_CONTENT_SIZE', 50)
+    def test_large_content_not_cached(self):
+        response = self.get(HTTP_RANGE='bytes=10-40')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(self.DATA[10:41], response.content)
+        response = self.get()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.DATA, response.content)
+        # the content is streamed from the contentstore, rather than cached
+        self.assertEqual({}, self.cached_chunks)
+
+    def test_stream_cached_chunks_bounds(self):
+        content = self.make_content()
+        self.assertEqual(self.DATA[15:17], ''.join(self.server._stream_cached_chunks(content, self.DIGEST, 15, 16)))
+        self.assertEqual(self.DATA[16:32], ''.join(self.server._stream_cached_chunks(content, self.DIGEST, 16, 31)))
+        self.assertEqual(self.DATA[99:], ''.join(self.server._stream_cached_chunks(content, self.DIGEST, 99, 99)))
+        self.assertEqual([0, 1, 6], self.read_chunks)
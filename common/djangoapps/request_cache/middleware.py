@@ -2,6 +2,7 @@ import threading
 
 _request_cache_threadlocal = threading.local()
 _request_cache_threadlocal.data = {}
+_request_cache_threadlocal.in_request = False
 
 class RequestCache(object):
     @classmethod
@@ -13,8 +14,10 @@ class RequestCache(object):
 
     def process_request(self, request):
         self.clear_request_cache()
+        _request_cache_threadlocal.in_request = True
         return None
 
     def process_response(self, request, response):
         self.clear_request_cache()
+        _request_cache_threadlocal.in_request = False
         return response
\ No newline at end of file
@@ -1,5 +1,8 @@
 import logging
 import re
+import threading
+
+from collections import OrderedDict
 
 from staticfiles.storage import staticfiles_storage
 from staticfiles import finders
@@ -11,6 +14,12 @@ from xmodule.contentstore.content import StaticContent
 
 log = logging.getLogger(__name__)
 
+# The number of resolved urls each UrlRewriter remembers
+URL_CACHE_SIZE = 2000
+
+# The number of UrlRewriters that get_url_rewriter keeps around
+REWRITER_CACHE_SIZE = 200
+
 
 def _url_replace_regex(prefix):
     """
@@ -59,7 +68,7 @@ def replace_course_urls(text, course_id):
         rest = match.group('rest')
         return "".join([quote, '/courses/' + course_id + '/', rest, quote])
 
-    return re.sub(_url_replace_regex('/course/'), replace_course_url, text)
+    return _compiled_regex('/course/').sub(replace_course_url, text)
 
 
 def replace_static_urls(text, data_directory, course_namespace=None):
@@ -84,38 +93,148 @@ def replace_static_urls(text, data_directory, course_namespace=None):
         if rest.endswith('?raw'):
             return original
 
-        # In debug mode, if we can find the url as is,
-        if settings.DEBUG and finders.find(rest, True):
+        url = _resolve_static_url(prefix, rest, data_directory, course_namespace)
+        if url is None:
             return original
-        # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
-        elif  course_namespace is not None and not isinstance(modulestore(), XMLModuleStore):
-            # first look in the static file pipeline and see if we are trying to reference
-            # a piece of static content which is in the mitx repo (e.g. JS associated with an xmodule)
+        return "".join([quote, url, quote])
+
+    return _compiled_regex('/static/(?!{data_dir})'.format(data_dir=data_directory)).sub(
+        replace_static_url,
+        text
+    )
+
+
+def _resolve_static_url(prefix, rest, data_directory, course_namespace):
+    """
+    Returns the url that the static url prefix + rest should be replaced with, or
+    None if it should be left alone.  See replace_static_urls.
+    """
+    # In debug mode, if we can find the url as is,
+    if settings.DEBUG and finders.find(rest, True):
+        return None
+    # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
+    elif  course_namespace is not None and not isinstance(modulestore(), XMLModuleStore):
+        # first look in the static file pipeline and see if we are trying to reference
+        # a piece of static content which is in the mitx repo (e.g. JS associated with an xmodule)
+        if staticfiles_storage.exists(rest):
+            url = staticfiles_storage.url(rest)
+        else:
+            # if not, then assume it's courseware specific content and then look in the
+            # Mongo-backed database
+            url = StaticContent.convert_legacy_static_url(rest, course_namespace)
+    # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
+    else:
+        course_path = "/".join((data_directory, rest))
+
+        try:
             if staticfiles_storage.exists(rest):
                 url = staticfiles_storage.url(rest)
             else:
-                # if not, then assume it's courseware specific content and then look in the
-                # Mongo-backed database
-                url = StaticContent.convert_legacy_static_url(rest, course_namespace)
-        # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
-        else:
-            course_path = "/".join((data_directory, rest))
-
-            try:
-                if staticfiles_storage.exists(rest):
-                    url = staticfiles_storage.url(rest)
-                else:
-                    url = staticfiles_storage.url(course_path)
-            # And if that fails, assume that it's course content, and add manually data directory
-            except Exception as err:
-                log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
-                    rest, str(err)))
-                url = "".join([prefix, course_path])
+                url = staticfiles_storage.url(course_path)
+        # And if that fails, assume that it's course content, and add manually data directory
+        except Exception as err:
+            log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
+                rest, str(err)))
+            url = "".join([prefix, course_path])
+
+    return url
+
+
+_regex_cache = {}
+
+
+def _compiled_regex(prefix):
+    """
+    Returns the compiled _url_replace_regex for prefix.  The patterns only vary
+    by data directory, so there are few enough of them to keep them all.
+    """
+    regex = _regex_cache.get(prefix)
+    if regex is None:
+        regex = _regex_cache[prefix] = re.compile(_url_replace_regex(prefix))
+    return regex
+
+
+class UrlRewriter(object):
+    """
+    Does the work of replace_static_urls and, if it's given a course_id,
+    replace_course_urls for one course, in a single pass over the text.
+
+    Since the rendered html of a page links to the same few static files over
+    and over, resolved urls are remembered (up to URL_CACHE_SIZE of them),
+    rather than asking staticfiles_storage about each one every time.
+    """
+    def __init__(self, data_directory, course_namespace=None, course_id=None):
+        """
+        data_directory, course_namespace: as for replace_static_urls
+        course_id: if not None, /course/ urls are replaced as by replace_course_urls
+        """
+        self.data_directory = data_directory
+        self.course_namespace = course_namespace
+        self.course_id = course_id
+
+        prefix = '/static/(?!{data_dir})'.format(data_dir=data_directory)
+        if course_id is not None:
+            prefix += '|/course/'
+        self._regex = _compiled_regex(prefix)
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, text):
+        """
+        Returns text with its static (and course) urls replaced
+        """
+        return self._regex.sub(self._replace_url, text)
+
+    def _replace_url(self, match):
+        """
+        Returns the replacement for a single _url_replace_regex match
+        """
+        original = match.group(0)
+        prefix = match.group('prefix')
+        quote = match.group('quote')
+        rest = match.group('rest')
+
+        if prefix == '/course/':
+            return "".join([quote, '/courses/', self.course_id, '/', rest, quote])
+
+        # Don't mess with things that end in '?raw'
+        if rest.endswith('?raw'):
+            return original
+
+        # Files can appear while developing, so don't remember anything in debug mode
+        if settings.DEBUG:
+            url = _resolve_static_url(prefix, rest, self.data_directory, self.course_namespace)
+            return original if url is None else "".join([quote, url, quote])
+
+        with self._lock:
+            url = self._urls.pop(rest, None)
+        if url is None:
+            url = _resolve_static_url(prefix, rest, self.data_directory, self.course_namespace)
+
+        with self._lock:
+            self._urls[rest] = url
+            while len(self._urls) > URL_CACHE_SIZE:
+                self._urls.popitem(last=False)
 
         return "".join([quote, url, quote])
 
-    return re.sub(
-        _url_replace_regex('/static/(?!{data_dir})'.format(data_dir=data_directory)),
-        replace_static_url,
-        text
-    )
+
+_rewriters = OrderedDict()
+_rewriters_lock = threading.Lock()
+
+
+def get_url_rewriter(data_directory, course_namespace=None, course_id=None):
+    """
+    Returns the UrlRewriter for these arguments, so that the urls it has resolved
+    are shared by all the modules in a course, and from one request to the next.
+    The REWRITER_CACHE_SIZE most recently used rewriters are kept.
+    """
+    key = (data_directory, course_namespace, course_id)
+    with _rewriters_lock:
+        rewriter = _rewriters.pop(key, None)
+        if rewriter is None:
+            rewriter = UrlRewriter(data_directory, course_namespace, course_id)
+        _rewriters[key] = rewriter
+        while len(_rewriters) > REWRITER_CACHE_SIZE:
+            _rewriters.popitem(last=False)
+    return rewriter
@@ -2,7 +2,7 @@ import re
 
 from nose.tools import assert_equals, assert_true, assert_false
 from static_replace import (replace_static_urls, replace_course_urls,
-                            _url_replace_regex)
+                            _url_replace_regex, UrlRewriter, get_url_rewriter)
 from mock import patch, Mock
 from xmodule.modulestore import Location
 from xmodule.modulestore.mongo import MongoModuleStore
@@ -109,3 +109,28 @@ def test_regex():
     for s in no:
         print 'Should not match: {0!r}'.format(s)
         assert_false(re.match(regex, s))
+
+
+@patch('static_replace.settings', Mock(DEBUG=False))
+@patch('static_replace.staticfiles_storage')
+def test_url_rewriter(mock_storage):
+    mock_storage.exists.return_value = False
+    mock_storage.url.return_value = '/static/data_dir/file.png'
+    rewriter = UrlRewriter(DATA_DIRECTORY, course_id=COURSE_ID)
+
+    text = STATIC_SOURCE + ' "/course/file.png" ' + STATIC_SOURCE + ' "/static/foo.png?raw"'
+    expected = '"/static/data_dir/file.png" "/courses/org/course/run/file.png" "/static/data_dir/file.png" "/static/foo.png?raw"'
+    assert_equals(expected, rewriter(text))
+    assert_equals(replace_course_urls(replace_static_urls(text, DATA_DIRECTORY), COURSE_ID), rewriter(text))
+
+    # each url is only resolved once
+    mock_storage.exists.assert_called_once_with('file.png')
+
+    # without a course_id, /course/ urls are left alone
+    assert_equals('"/course/file.png"', UrlRewriter(DATA_DIRECTORY)('"/course/file.png"'))
+
+
+def test_get_url_rewriter():
+    rewriter = get_url_rewriter(DATA_DIRECTORY, NAMESPACE, COURSE_ID)
+    assert_true(rewriter is get_url_rewriter(DATA_DIRECTORY, NAMESPACE, COURSE_ID))
+    assert_false(rewriter is get_url_rewriter(DATA_DIRECTORY, NAMESPACE))
@@ -0,0 +1,169 @@
+"""
+Buffered delivery of tracking events.
+
+An EventPipeline queues events in-process, and a background thread hands them
+to a writer in batches, so that the thread that produced an event doesn't wait
+on encoding it, writing it to the log, or saving it to the database.
+"""
+import atexit
+import logging
+import os
+import Queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# queued by shutdown() to wake the background thread up
+_WAKE_UP = object()
+
+
+class EventPipeline(object):
+    """
+    Queues events and writes them out in batches from a background thread.
+
+    The queue is bounded: when it's full, put() waits up to enqueue_timeout
+    seconds for room (applying some backpressure to the producers), and then
+    drops the event.  Counts of the events that were written, dropped, and
+    that failed to be written are kept in the written, dropped, and failed
+    attributes.
+    """
+    def __init__(self, writer, max_queue_size=10000, batch_size=100,
+                 flush_interval=1.0, enqueue_timeout=0.01):
+        """
+        writer: a function that takes a list of events and writes them out
+        max_queue_size: the number of events that may be waiting to be written
+        batch_size: the most events that are passed to writer at once
+        flush_interval: the longest time (in seconds) that the background
+            thread waits to fill up a batch before writing what it has
+        enqueue_timeout: how long (in seconds) put() waits for room in a
+            full queue before dropping the event
+        """
+        self.writer = writer
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._queue = Queue.Queue(max_queue_size)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._registered_shutdown = False
+
+    def put(self, event):
+        """
+        Queues event to be written.  Returns False if it was dropped because
+        the queue is full.
+        """
+        self._ensure_running()
+        try:
+            self._queue.put(event, timeout=self.enqueue_timeout)
+        except Queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            # don't flood the log while the queue stays full
+            if dropped == 1 or dropped % 1000 == 0:
+                log.warning("Tracking event queue is full: %d events dropped so far", dropped)
+            return False
+        return True
+
+    def flush(self):
+        """
+        Writes all the events that are currently queued, in the calling thread.
+        """
+        while True:
+            batch = self._get_batch(wait=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self, timeout=5):
+        """
+        Stops the background thread, waiting up to timeout seconds for it to
+        finish, and then writes whatever is still queued.
+        """
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            try:
+                self._queue.put_nowait(_WAKE_UP)
+            except Queue.Full:
+                # the thread has plenty to do, so it isn't waiting
+                pass
+            thread.join(timeout)
+        self.flush()
+
+    def _ensure_running(self):
+        """
+        Starts the background thread if it isn't running in this process.
+        Forked processes (e.g. web server workers) don't inherit the thread,
+        and start their own with a fresh queue, so that events queued before
+        the fork aren't written twice.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = Queue.Queue(self.max_queue_size)
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='tracking-event-pipeline')
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+            if not self._registered_shutdown:
+                atexit.register(self.shutdown)
+                self._registered_shutdown = True
+
+    def _run(self):
+        """
+        The body of the background thread
+        """
+        while not self._stopping.is_set():
+            batch = self._get_batch(wait=True)
+            if batch:
+                self._write(batch)
+
+    def _get_batch(self, wait):
+        """
+        Returns up to batch_size queued events.  If wait is True, waits up to
+        flush_interval seconds for the batch to fill up.
+        """
+        batch = []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                if wait and not self._stopping.is_set():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    event = self._queue.get(timeout=remaining)
+                else:
+                    event = self._queue.get_nowait()
+            except Queue.Empty:
+                break
+            if event is not _WAKE_UP:
+                batch.append(event)
+        return batch
+
+    def _write(self, batch):
+        """
+        Passes batch to the writer, counting the events written or failed.
+        """
+        try:
+            self.writer(batch)
+        except Exception:
+            log.exception("Failed to write %d tracking events", len(batch))
+            with self._lock:
+                self.failed += len(batch)
+        else:
+            with self._lock:
+                self.written += len(batch)
@@ -4,7 +4,8 @@ import mock
 from django.test import TestCase
 from django.core.urlresolvers import reverse, NoReverseMatch
 from track.models import TrackingLog
-from track.views import user_track
+from track.pipeline import EventPipeline
+from track.views import user_track, write_events, _write_events_in_background
 from nose.plugins.skip import SkipTest
 
 
@@ -58,3 +59,79 @@ class TrackingTest(TestCase):
                 self.assertEqual(log.event, request_params["event"])
                 self.assertEqual(log.event_type, request_params["event_type"])
                 self.assertEqual(log.page, request_params["page"])
+
+    def test_malformed_events_dropped(self):
+        """
+        Checks that events which can't be written don't keep the rest of their
+        batch from being written
+        """
+        def make_event(name, time='2013-07-01T12:00:00+00:00'):
+            return {
+                'username': 'user', 'ip': '127.0.0.1', 'event_source': 'browser', 'event_type': name,
+                'event': '', 'agent': '', 'page': 'my_page', 'time': time, 'host': 'testserver',
+            }
+        events = [
+            make_event('first'),
+            dict(make_event('unserializable'), event=object()),
+            make_event('bad_time', time='not a time'),
+            make_event('last'),
+        ]
+        with mock.patch.dict('django.conf.settings.MITX_FEATURES', {'ENABLE_SQL_TRACKING_LOGS': True}):
+            write_events(events)
+        self.assertEqual(
+            ['first', 'last'],
+            list(TrackingLog.objects.order_by('id').values_list('event_type', flat=True))
+        )
+
+    @mock.patch('track.views.close_connection')
+    def test_background_writes_close_connection(self, mock_close_connection):
+        """
+        Checks that the database connection used by the pipeline's thread is closed
+        after each batch, even when writing the batch fails
+        """
+        with mock.patch('track.views.write_events', side_effect=Exception):
+            with self.assertRaises(Exception):
+                _write_events_in_background([{}])
+        self.assertTrue(mock_close_connection.called)
+
+
+class EventPipelineTest(TestCase):
+    """
+    Tests that the EventPipeline writes out all the events it accepts
+    """
+
+    def setUp(self):
+        self.written = []
+
+    def writer(self, events):
+        self.written.append(list(events))
+
+    def test_batches_written_on_shutdown(self):
+        pipeline = EventPipeline(self.writer, batch_size=10, flush_interval=60)
+        for i in range(25):
+            self.assertTrue(pipeline.put({'event': i}))
+        pipeline.shutdown()
+
+        self.assertEqual(range(25), [event['event'] for batch in self.written for event in batch])
+        self.assertTrue(all(len(batch) <= 10 for batch in self.written))
+        self.assertEqual(25, pipeline.written)
+        self.assertEqual(0, pipeline.dropped)
+
+    def test_full_queue_drops_events(self):
+        pipeline = EventPipeline(self.writer, max_queue_size=2, enqueue_timeout=0)
+        # don't start the background thread, so nothing leaves the queue
+        with mock.patch.object(pipeline, '_ensure_running'):
+            results = [pipeline.put({'event': i}) for i in range(3)]
+        self.assertEqual([True, True, False], results)
+        self.assertEqual(1, pipeline.dropped)
+
+        pipeline.flush()
+        self.assertEqual([[{'event': 0}, {'event': 1}]], self.written)
+
+    def test_writer_failure_counted(self):
+        pipeline = EventPipeline(mock.Mock(side_effect=Exception))
+        with mock.patch.object(pipeline, '_ensure_running'):
+            pipeline.put({'event': 0})
+        pipeline.flush()
+        self.assertEqual(1, pipeline.failed)
+        self.assertEqual(0, pipeline.written)
@@ -1,5 +1,6 @@
 import json
 import logging
+import threading
 import pytz
 import datetime
 import dateutil.parser
@@ -8,10 +9,12 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.conf import settings
+from django.db import close_connection
 from mitxmako.shortcuts import render_to_response
 
 from django_future.csrf import ensure_csrf_cookie
 from track.models import TrackingLog
+from track.pipeline import EventPipeline
 from pytz import UTC
 
 log = logging.getLogger("tracking")
@@ -20,18 +23,88 @@ LOGFIELDS = ['username', 'ip', 'event_source', 'event_type', 'event', 'agent', '
 
 
 def log_event(event):
-    """Write tracking event to log file, and optionally to TrackingLog model."""
-    event_str = json.dumps(event)
-    log.info(event_str[:settings.TRACK_MAX_EVENT])
-    if settings.MITX_FEATURES.get('ENABLE_SQL_TRACKING_LOGS'):
-        event['time'] = dateutil.parser.parse(event['time'])
-        tldat = TrackingLog(**dict((x, event[x]) for x in LOGFIELDS))
+    """
+    Write tracking event to log file, and optionally to TrackingLog model.
+
+    If settings.TRACKING_PIPELINE is enabled, the event is queued and written
+    later, along with others, by a background thread.
+    """
+    pipeline = get_event_pipeline()
+    if pipeline is None:
+        write_events([event])
+    else:
+        pipeline.put(event)
+
+
+def write_events(events):
+    """
+    Write tracking events to log file, and optionally to TrackingLog model.
+
+    An event that can't be written is logged and dropped, without keeping the
+    rest of the events from being written.
+    """
+    records = []
+    for event in events:
         try:
-            tldat.save()
+            event_str = json.dumps(event)
+        except (TypeError, ValueError):
+            log.exception("Dropped tracking event that couldn't be serialized: %r", event)
+            continue
+        log.info(event_str[:settings.TRACK_MAX_EVENT])
+        if settings.MITX_FEATURES.get('ENABLE_SQL_TRACKING_LOGS'):
+            try:
+                event['time'] = dateutil.parser.parse(event['time'])
+                records.append(TrackingLog(**dict((x, event[x]) for x in LOGFIELDS)))
+            except Exception:
+                log.exception("Tracking event not saved to TrackingLog: %s", event_str[:settings.TRACK_MAX_EVENT])
+
+    if records:
+        try:
+            TrackingLog.objects.bulk_create(records)
         except Exception as err:
             log.exception(err)
 
 
+def _write_events_in_background(events):
+    """
+    Write tracking events from the EventPipeline's background thread.
+    """
+    try:
+        write_events(events)
+    finally:
+        # The thread has a database connection of its own, which would otherwise be
+        # kept open between batches until the database drops it as idle, after which
+        # every batch would fail. Closing it makes the next batch open a new one.
+        close_connection()
+
+
+_event_pipeline = None
+_event_pipeline_lock = threading.Lock()
+
+
+def get_event_pipeline():
+    """
+    Returns the EventPipeline that tracking events are queued on, or None if
+    settings.TRACKING_PIPELINE doesn't enable one.
+    """
+    global _event_pipeline
+
+    options = getattr(settings, 'TRACKING_PIPELINE', {})
+    if not options.get('ENABLED'):
+        return None
+
+    with _event_pipeline_lock:
+        if _event_pipeline is None:
+            _event_pipeline = EventPipeline(
+                _write_events_in_background,
+                max_queue_size=options.get('MAX_QUEUE_SIZE', 10000),
+                batch_size=options.get('BATCH_SIZE', 100),
+                flush_interval=options.get('FLUSH_INTERVAL', 1.0),
+                enqueue_timeout=options.get('ENQUEUE_TIMEOUT', 0.01),
+            )
+    return _event_pipeline
+
+
 def user_track(request):
     """
     Log when POST call to "event" URL is made by a user. Uses request.REQUEST
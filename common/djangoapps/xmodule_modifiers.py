@@ -67,6 +67,19 @@ def replace_static_urls(get_html, data_dir, course_namespace=None):
     return _get_html
 
 
+def rewrite_urls(get_html, url_rewriter):
+    """
+    Updates the supplied module with a new get_html function that wraps
+    the old get_html function and passes its output through url_rewriter,
+    a static_replace.UrlRewriter.  This does the work of both replace_static_urls
+    and replace_course_urls in one pass.
+    """
+    @wraps(get_html)
+    def _get_html():
+        return url_rewriter(get_html())
+    return _get_html
+
+
 def grade_histogram(module_id):
     ''' Print out a histogram of grades on a given problem.
         Part of staff member debug info.
@@ -2,6 +2,12 @@
 Parser and evaluator for FormulaResponse and NumericalResponse
 
 Uses pyparsing to parse. Main function as of now is evaluator().
+
+Expressions are parsed into a tree of python functions, which can then be
+evaluated against any values of the variables and functions they were compiled
+for. Both the pyparsing grammars and the compiled expressions are cached, so
+that evaluating the same expression many times (e.g. for each of the samples of
+a FormulaResponse) only parses it once.
 """
 
 import copy
@@ -12,6 +18,7 @@ import re
 import numpy
 import scipy.constants
 import calcfunctions
+from lrucache import LRUCache
 
 # have numpy raise errors on functions outside its domain
 # See http://docs.scipy.org/doc/numpy/reference/generated/numpy.seterr.html
@@ -76,6 +83,11 @@ SUFFIXES = {'%': 0.01, 'k': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12,
             'c': 1e-2, 'm': 1e-3, 'u': 1e-6, 'n': 1e-9, 'p': 1e-12}
 
 
+# Maximum number of grammars and compiled expressions to keep around
+GRAMMAR_CACHE_SIZE = 64
+EXPRESSION_CACHE_SIZE = 1024
+
+
 class UndefinedVariable(Exception):
     """
     Used to indicate the student input of a variable, which was unused by the
@@ -120,9 +132,14 @@ def lower_dict(input_dict):
     return {k.lower(): v for k, v in input_dict.iteritems()}
 
 
+_grammar_cache = LRUCache(GRAMMAR_CACHE_SIZE)
+_expression_cache = LRUCache(EXPRESSION_CACHE_SIZE)
+
+
 # The following few functions define parse actions, which are run on lists of
-# results from each parse component. They convert the strings and (previously
-# calculated) numbers into the number that component represents.
+# results from each parse component. Rather than computing values directly,
+# they build a tree of nodes. Each node is a function that takes the dicts of
+# variables and functions and returns the value of the component it represents.
 
 def super_float(text):
     """
@@ -141,7 +158,28 @@ def number_parse_action(parse_result):
     e.g. [ '7', '.', '13' ] ->  [ 7.13 ]
     Calls super_float above
     """
-    return super_float("".join(parse_result))
+    value = super_float("".join(parse_result))
+    return lambda variables, functions: value
+
+
+def variable_parse_action(parse_result):
+    """
+    Look up the value of each variable name when evaluated
+    """
+    def variable_node(name):
+        """
+        Return a node looking up the variable `name`
+        """
+        return lambda variables, functions: variables[name]
+    return [variable_node(name) for name in parse_result]
+
+
+def function_parse_action(parse_result):
+    """
+    Apply the function named by the first token to the value of the second
+    """
+    name, argument = parse_result[0], parse_result[1]
+    return lambda variables, functions: functions[name](argument(variables, functions))
 
 
 def exp_parse_action(parse_result):
@@ -150,14 +188,22 @@ def exp_parse_action(parse_result):
 
     e.g. [ 3, 2, 3 ] (which is 3^2^3 = 3^(2^3)) -> 6561
     """
+    if len(parse_result) == 1:
+        return parse_result[0]
+
     # pyparsing.ParseResults doesn't play well with reverse()
-    parse_result = reversed(parse_result)
-    # the result of an exponentiation is called a power
-    power = reduce(lambda a, b: b ** a, parse_result)
-    return power
+    nodes = list(reversed(parse_result))
+
+    def exp_node(variables, functions):
+        """
+        Compute the power
+        """
+        # the result of an exponentiation is called a power
+        return reduce(lambda a, b: b ** a, [node(variables, functions) for node in nodes])
+    return exp_node
 
 
-def parallel(parse_result):
+def parallel(values):
     """
     Compute numbers according to the parallel resistors operator
 
@@ -165,18 +211,32 @@ def parallel(parse_result):
       out = 1 / (1/in1 + 1/in2 + ...)
     e.g. [ 1, 2 ] => 2/3
 
-    Return NaN if there is a zero among the inputs
+    Return NaN if there is a zero among the inputs. If any of the inputs are
+    numpy arrays, the computation is done elementwise.
     """
-    # convert from pyparsing.ParseResults, which doesn't support '0 in parse_result'
-    parse_result = parse_result.asList()
-    if len(parse_result) == 1:
-        return parse_result[0]
-    if 0 in parse_result:
+    if len(values) == 1:
+        return values[0]
+    if any(isinstance(value, numpy.ndarray) for value in values):
+        has_zero = reduce(numpy.logical_or, [numpy.equal(value, 0) for value in values])
+        reciprocals = [numpy.true_divide(1., value) for value in values]
+        return numpy.where(has_zero, float('nan'), numpy.true_divide(1., sum(reciprocals)))
+    if 0 in values:
         return float('nan')
-    reciprocals = [1. / e for e in parse_result]
+    reciprocals = [1. / e for e in values]
     return 1. / sum(reciprocals)
 
 
+def parallel_parse_action(parse_result):
+    """
+    Combine the inputs with the parallel resistors operator (see parallel)
+    """
+    if len(parse_result) == 1:
+        return parse_result[0]
+
+    nodes = list(parse_result)
+    return lambda variables, functions: parallel([node(variables, functions) for node in nodes])
+
+
 def sum_parse_action(parse_result):
     """
     Add the inputs
@@ -185,7 +245,7 @@ def sum_parse_action(parse_result):
 
     Allow a leading + or -
     """
-    total = 0.0
+    terms = []
     current_op = operator.add
     for token in parse_result:
         if token is '+':
@@ -193,8 +253,17 @@ def sum_parse_action(parse_result):
         elif token is '-':
             current_op = operator.sub
         else:
-            total = current_op(total, token)
-    return total
+            terms.append((current_op, token))
+
+    def sum_node(variables, functions):
+        """
+        Compute the sum
+        """
+        total = 0.0
+        for current_op, node in terms:
+            total = current_op(total, node(variables, functions))
+        return total
+    return sum_node
 
 
 def prod_parse_action(parse_result):
@@ -203,7 +272,7 @@ def prod_parse_action(parse_result):
 
     [ 1, '*', 2, '/', 3 ] => 0.66
     """
-    prod = 1.0
+    factors = []
     current_op = operator.mul
     for token in parse_result:
         if token is '*':
@@ -211,37 +280,25 @@ def prod_parse_action(parse_result):
         elif token is '/':
             current_op = operator.truediv
         else:
-            prod = current_op(prod, token)
-    return prod
+            factors.append((current_op, token))
 
+    def prod_node(variables, functions):
+        """
+        Compute the product
+        """
+        prod = 1.0
+        for current_op, node in factors:
+            prod = current_op(prod, node(variables, functions))
+        return prod
+    return prod_node
 
-def evaluator(variables, functions, string, cs=False):
-    """
-    Evaluate an expression. Variables are passed as a dictionary
-    from string to value. Unary functions are passed as a dictionary
-    from string to function. Variables must be floats.
-    cs: Case sensitive
 
+def build_grammar(variable_names, function_names, cs):
     """
-
-    all_variables = copy.copy(DEFAULT_VARIABLES)
-    all_functions = copy.copy(DEFAULT_FUNCTIONS)
-    all_variables.update(variables)
-    all_functions.update(functions)
-
-    if not cs:
-        string_cs = string.lower()
-        all_functions = lower_dict(all_functions)
-        all_variables = lower_dict(all_variables)
-        CasedLiteral = CaselessLiteral
-    else:
-        string_cs = string
-        CasedLiteral = Literal
-
-    check_variables(string_cs, set(all_variables.keys() + all_functions.keys()))
-
-    if string.strip() == "":
-        return float('nan')
+    Build the pyparsing grammar for expressions using the given (already
+    lowercased, unless case sensitive) variable and function names.
+    """
+    CasedLiteral = Literal if cs else CaselessLiteral
 
     # SI suffixes and percent
     number_suffix = MatchFirst([Literal(k) for k in SUFFIXES.keys()])
@@ -268,23 +325,19 @@ def evaluator(variables, functions, string, cs=False):
     #  E.g. if we have {'R':0.5}, we make the substitution.
     # We sort the list so that var names (like "e2") match before
     # mathematical constants (like "e"). This is kind of a hack.
-    all_variables_keys = sorted(all_variables.keys(), key=len, reverse=True)
+    all_variables_keys = sorted(variable_names, key=len, reverse=True)
     varnames = MatchFirst([CasedLiteral(k) for k in all_variables_keys])
-    varnames.setParseAction(
-        lambda x: [all_variables[k] for k in x]
-    )
+    varnames.setParseAction(variable_parse_action)
 
     # if all_variables were empty, then pyparsing wants
     # varnames = NoMatch()
     # this is not the case, as all_variables contains the defaults
 
     # Same thing for functions.
-    all_functions_keys = sorted(all_functions.keys(), key=len, reverse=True)
+    all_functions_keys = sorted(function_names, key=len, reverse=True)
     funcnames = MatchFirst([CasedLiteral(k) for k in all_functions_keys])
     function = funcnames + Suppress("(") + expr + Suppress(")")
-    function.setParseAction(
-        lambda x: [all_functions[x[0]](x[1])]
-    )
+    function.setParseAction(function_parse_action)
 
     atom = number | function | varnames | Suppress("(") + expr + Suppress(")")
 
@@ -292,10 +345,113 @@ def evaluator(variables, functions, string, cs=False):
     pow_term = atom + ZeroOrMore(Suppress("^") + atom)
     pow_term.setParseAction(exp_parse_action)  # 7^6
     par_term = pow_term + ZeroOrMore(Suppress('||') + pow_term)  # 5k || 4k
-    par_term.setParseAction(parallel)
+    par_term.setParseAction(parallel_parse_action)
     prod_term = par_term + ZeroOrMore(times_div + par_term)  # 7 * 5 / 4 - 3
     prod_term.setParseAction(prod_parse_action)
     sum_term = Optional(plus_minus) + prod_term + ZeroOrMore(plus_minus + prod_term)  # -5 + 4 - 3
     sum_term.setParseAction(sum_parse_action)
     expr << sum_term  # finish the recursion
-    return (expr + stringEnd).parseString(string)[0]
+    return expr + stringEnd
+
+
+def get_grammar(variable_names, function_names, cs):
+    """
+    Return the (cached) grammar for the given variable and function names
+    """
+    key = (frozenset(variable_names), frozenset(function_names), cs)
+    grammar = _grammar_cache.get(key)
+    if grammar is None:
+        grammar = build_grammar(variable_names, function_names, cs)
+        _grammar_cache.set(key, grammar)
+    return grammar
+
+
+def merge_with_defaults(variables, functions, cs):
+    """
+    Return the dicts of all variables and functions available to an
+    expression, including the defaults, with lowercased names unless
+    the expression is case sensitive.
+    """
+    all_variables = copy.copy(DEFAULT_VARIABLES)
+    all_functions = copy.copy(DEFAULT_FUNCTIONS)
+    all_variables.update(variables)
+    all_functions.update(functions)
+
+    if not cs:
+        all_functions = lower_dict(all_functions)
+        all_variables = lower_dict(all_variables)
+
+    return all_variables, all_functions
+
+
+class CompiledExpression(object):
+    """
+    A parsed expression, which can be evaluated repeatedly against different
+    values of the variables and functions it was compiled for.
+
+    Variable values may be numpy arrays, in which case the expression is
+    evaluated elementwise over all of them at once (as long as every function
+    used supports arrays).
+    """
+    def __init__(self, string, tree, cs):
+        self.string = string
+        self.tree = tree
+        self.cs = cs
+
+    def evaluate(self, variables, functions=None):
+        """
+        Evaluate the expression. Variables and functions are passed as in
+        evaluator(), and must include every name the expression was compiled for.
+        """
+        if self.tree is None:
+            return float('nan')
+
+        all_variables, all_functions = merge_with_defaults(variables, functions or {}, self.cs)
+        return self.tree(all_variables, all_functions)
+
+
+def compile_expression(variables, functions, string, cs=False):
+    """
+    Parse an expression into a CompiledExpression. Only the names of `variables`
+    and `functions` are used; their values are supplied at evaluation time.
+    cs: Case sensitive
+
+    Raises UndefinedVariable if the expression uses any undefined names, and
+    pyparsing.ParseException if it can't be parsed.
+    """
+    variable_names = set(DEFAULT_VARIABLES) | set(variables)
+    function_names = set(DEFAULT_FUNCTIONS) | set(functions)
+
+    if not cs:
+        string_cs = string.lower()
+        variable_names = set(name.lower() for name in variable_names)
+        function_names = set(name.lower() for name in function_names)
+    else:
+        string_cs = string
+
+    key = (string, frozenset(variable_names), frozenset(function_names), cs)
+    compiled = _expression_cache.get(key)
+    if compiled is not None:
+        return compiled
+
+    check_variables(string_cs, variable_names | function_names)
+
+    if string.strip() == "":
+        tree = None
+    else:
+        tree = get_grammar(variable_names, function_names, cs).parseString(string)[0]
+
+    compiled = CompiledExpression(string, tree, cs)
+    _expression_cache.set(key, compiled)
+    return compiled
+
+
+def evaluator(variables, functions, string, cs=False):
+    """
+    Evaluate an expression. Variables are passed as a dictionary
+    from string to value. Unary functions are passed as a dictionary
+    from string to function. Variables must be floats.
+    cs: Case sensitive
+
+    """
+    return compile_expression(variables, functions, string, cs).evaluate(variables, functions)
@@ -474,3 +474,57 @@ class EvaluatorTest(unittest.TestCase):
                           {'r1': 5}, {}, "r1+r2")
         self.assertRaises(calc.UndefinedVariable, calc.evaluator,
                           variables, {}, "r1*r3", cs=True)
+
+
+class CompiledExpressionTest(unittest.TestCase):
+    """
+    Run tests for calc.compile_expression
+    """
+
+    def test_reuse(self):
+        """
+        A compiled expression can be evaluated with different values
+        """
+        expression = calc.compile_expression({'x': 0}, {}, '3*x+1')
+        self.assertEqual(expression.evaluate({'x': 1.0}), 4.0)
+        self.assertEqual(expression.evaluate({'x': 2.0}), 7.0)
+
+    def test_cached(self):
+        """
+        Compiling the same expression twice returns the cached result,
+        whatever the values of the variables are
+        """
+        first = calc.compile_expression({'x': 1.0}, {}, 'x^2')
+        second = calc.compile_expression({'x': 2.0}, {}, 'x^2')
+        self.assertIs(first, second)
+        self.assertIsNot(first, calc.compile_expression({'x': 1.0}, {}, 'x^2', cs=True))
+
+    def test_undefined_vars(self):
+        """
+        Undefined variables are caught at compile time
+        """
+        self.assertRaises(calc.UndefinedVariable, calc.compile_expression,
+                          {'x': 1.0}, {}, 'x+y')
+
+    def test_array_evaluation(self):
+        """
+        Evaluating against arrays gives the same results as evaluating
+        each sample individually
+        """
+        expression_str = 'x^2 + sin(y)*3 || 2 - y/x'
+        expression = calc.compile_expression({'x': 0, 'y': 0}, {}, expression_str)
+        xs = numpy.array([1.0, 2.0, 3.5])
+        ys = numpy.array([0.1, -0.2, 4.0])
+        results = expression.evaluate({'x': xs, 'y': ys})
+        for x_value, y_value, result in zip(xs, ys, results):
+            self.assertAlmostEqual(
+                calc.evaluator({'x': x_value, 'y': y_value}, {}, expression_str),
+                result)
+
+    def test_array_parallel_with_zero(self):
+        """
+        Check the behavior of the || operator with 0 for arrays
+        """
+        results = calc.compile_expression({'x': 0}, {}, 'x||1').evaluate({'x': numpy.array([0.0, 1.0])})
+        self.assertTrue(numpy.isnan(results[0]))
+        self.assertEqual(results[1], 0.5)
@@ -13,7 +13,9 @@ Main module which shows problems (of "capa" type).
 This is used by capa_module.
 '''
 
+from collections import namedtuple
 from datetime import datetime
+import hashlib
 import logging
 import os.path
 import re
@@ -22,6 +24,7 @@ from lxml import etree
 from xml.sax.saxutils import unescape
 from copy import deepcopy
 
+from lrucache import LRUCache
 from capa.correctmap import CorrectMap
 import capa.inputtypes as inputtypes
 import capa.customrender as customrender
@@ -52,6 +55,38 @@ html_problem_semantics = ["codeparam", "responseparam", "answer", "script", "hin
 
 log = logging.getLogger(__name__)
 
+# The parts of constructing a problem that don't depend on the seed or the student:
+# the parsed xml tree (with includes processed, but not yet preprocessed), and the
+# python code (and the path needed to run it) from its <script> tags. includes holds
+# the (filename, signature) of each file included into the tree: the file's (size,
+# modification time), or the md5 hexdigest of its contents if the filestore can't tell those.
+ProblemTemplate = namedtuple('ProblemTemplate', 'tree, script_code, python_path, includes')
+
+# Maximum number of problem templates to keep in memory per process
+PROBLEM_TEMPLATE_CACHE_SIZE = 500
+_problem_template_cache = LRUCache(PROBLEM_TEMPLATE_CACHE_SIZE)
+
+
+def _md5_hexdigest(text):
+    """
+    Returns the md5 hexdigest of text, encoding it as utf-8 first if it's unicode
+    """
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return hashlib.md5(text).hexdigest()
+
+
+def _file_info_signature(filestore, filename):
+    """
+    Returns the (size, modification time) of filename in filestore, or None if the
+    filestore can't tell them
+    """
+    try:
+        info = filestore.getinfo(filename)
+        return (info['size'], info['modified_time'])
+    except Exception:
+        return None
+
 #-----------------------------------------------------------------------------
 # main class for this module
 
@@ -107,14 +142,14 @@ class LoncapaProblem(object):
         problem_text = re.sub(r"endouttext\s*/", "/text", problem_text)
         self.problem_text = problem_text
 
-        # parse problem XML file into an element tree
-        self.tree = etree.XML(problem_text)
-
-        # handle any <include file="foo"> tags
-        self._process_includes()
+        # parse problem XML file into an element tree, and handle any <include file="foo"> tags.
+        # This is the same for every student, so it is cached, and each problem gets its own
+        # copy of the tree to preprocess.
+        template = self._get_template()
+        self.tree = deepcopy(template.tree)
 
         # construct script processor context (eg for customresponse problems)
-        self.context = self._extract_context(self.tree)
+        self.context = self._extract_context(template.script_code, list(template.python_path))
 
         # Pre-parse the XML tree: modifies it to add ID's and perform some in-place
         # transformations.  This also creates the dict (self.responders) of Response
@@ -391,15 +426,67 @@ class LoncapaProblem(object):
 
     # ======= Private Methods Below ========
 
-    def _process_includes(self):
+    def _get_template(self):
+        '''
+        Return the ProblemTemplate for this problem's text, building it if it isn't
+        in the template cache yet.
+
+        The tree in the returned template is shared, and must not be modified.
+
+        Since the tree has the problem's included files in it, a cached template is
+        only used if none of them have changed since, and a template whose includes
+        couldn't all be processed (which only happens when debugging) isn't cached.
+        '''
+        key = (
+            self.problem_id,
+            getattr(self.system.filestore, 'root_path', None),
+            _md5_hexdigest(self.problem_text),
+        )
+        template = _problem_template_cache.get(key)
+        if template is None or not self._includes_unchanged(template.includes):
+            tree = etree.XML(self.problem_text)
+            includes = self._process_includes(tree)
+            script_code, python_path = self._extract_script(tree)
+            template = ProblemTemplate(tree, script_code, python_path, includes)
+            if includes is not None:
+                _problem_template_cache.set(key, template)
+        return template
+
+    def _includes_unchanged(self, includes):
+        '''
+        Returns whether each of the included files in includes (as returned by
+        _process_includes) is still the same: the files are only read if the filestore
+        can't tell their size and modification time.
+        '''
+        filestore = self.system.filestore
+        for filename, signature in includes:
+            current = _file_info_signature(filestore, filename)
+            if current is None:
+                try:
+                    current = _md5_hexdigest(filestore.open(filename).read())
+                except Exception:
+                    return False
+            if current != signature:
+                return False
+        return True
+
+    def _process_includes(self, tree):
         '''
         Handle any <include file="foo"> tags by reading in the specified file and inserting it
-        into our XML tree.  Fail gracefully if debugging.
+        into the XML tree.  Fail gracefully if debugging.
+
+        Returns a tuple of the (filename, signature) of each file included (see
+        ProblemTemplate), or None if any include couldn't be processed.
         '''
-        includes = self.tree.findall('.//include')
+        included = []
+        failed = False
+        includes = tree.findall('.//include')
         for inc in includes:
             filename = inc.get('file')
             if filename is not None:
+                # look at the file's size and modification time before reading it, so that a
+                # change made while it's read makes the cached template out of date
+                info_signature = _file_info_signature(self.system.filestore, filename)
                 try:
                     # open using ModuleSystem OSFS filestore
                     ifp = self.system.filestore.open(filename)
@@ -413,10 +500,12 @@ class LoncapaProblem(object):
                     if not self.system.get('DEBUG'):
                         raise
                     else:
+                        failed = True
                         continue
                 try:
                     # read in and convert to XML
-                    incxml = etree.XML(ifp.read())
+                    contents = ifp.read()
+                    incxml = etree.XML(contents)
                 except Exception as err:
                     log.warning('Error %s in problem xml include: %s' % (
                             err, etree.tostring(inc, pretty_print=True)))
@@ -426,14 +515,20 @@ class LoncapaProblem(object):
                     if not self.system.get('DEBUG'):
                         raise
                     else:
+                        failed = True
                         continue
 
+                signature = info_signature if info_signature is not None else _md5_hexdigest(contents)
+
                 # insert new XML into tree in place of include
                 parent = inc.getparent()
                 parent.insert(parent.index(inc), incxml)
                 parent.remove(inc)
+                included.append((filename, signature))
                 log.debug('Included %s into %s' % (filename, self.problem_id))
 
+        return None if failed else tuple(included)
+
     def _extract_system_path(self, script):
         """
         Extracts and normalizes additional paths for code execution.
@@ -468,16 +563,13 @@ class LoncapaProblem(object):
 
         return path
 
-    def _extract_context(self, tree):
+    def _extract_script(self, tree):
         '''
-        Extract content of <script>...</script> from the problem.xml file, and exec it in the
-        context of this problem.  Provides ability to randomize problems, and also set
-        variables for problem answer checking.
+        Extract content of <script>...</script> from the problem.xml file.
 
-        Problem XML goes to Python execution context. Runs everything in script tags.
+        Returns the python code from all of the script tags, and the python path
+        needed to run it.
         '''
-        context = {}
-        context['seed'] = self.seed
         all_code = ''
 
         python_path = []
@@ -500,6 +592,19 @@ class LoncapaProblem(object):
             code = unescape(script.text, XMLESC)
             all_code += code
 
+        return all_code, python_path
+
+    def _extract_context(self, all_code, python_path):
+        '''
+        Exec the problem's script code (see _extract_script) in the context of this
+        problem.  Provides ability to randomize problems, and also set variables for
+        problem answer checking.
+
+        Problem XML goes to Python execution context. Runs everything in script tags.
+        '''
+        context = {}
+        context['seed'] = self.seed
+
         if all_code:
             try:
                 safe_exec(
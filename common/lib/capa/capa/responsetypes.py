@@ -30,7 +30,7 @@ from collections import namedtuple
 from shapely.geometry import Point, MultiPoint
 
 # specific library imports
-from calc import evaluator, UndefinedVariable
+from calc import compile_expression, evaluator, UndefinedVariable
 from . import correctmap
 from datetime import datetime
 from .util import *
@@ -1732,53 +1732,95 @@ class FormulaResponse(LoncapaResponse):
                            samples.split('@')[1].split('#')[0].split(':')))
 
         ranges = dict(zip(variables, sranges))
-        for i in range(numsamples):
-            instructor_variables = self.strip_dict(dict(self.context))
-            student_variables = dict()
-            # ranges give numerical ranges for testing
-            for var in ranges:
-                # TODO: allow specified ranges (i.e. integers and complex numbers) for random variables
-                value = random.uniform(*ranges[var])
-                instructor_variables[str(var)] = value
-                student_variables[str(var)] = value
-            # log.debug('formula: instructor_vars=%s, expected=%s' %
-            # (instructor_variables,expected))
-            instructor_result = evaluator(instructor_variables, dict(),
-                                          expected, cs=self.case_sensitive)
-            try:
-                # log.debug('formula: student_vars=%s, given=%s' %
-                # (student_variables,given))
-                student_result = evaluator(student_variables,
-                                           dict(),
-                                           given,
-                                           cs=self.case_sensitive)
-            except UndefinedVariable as uv:
-                log.debug(
-                    'formularesponse: undefined variable in given=%s' % given)
-                raise StudentInputError(
-                    "Invalid input: " + uv.message + " not permitted in answer")
-            except ValueError as ve:
-                if 'factorial' in ve.message:
-                    # This is thrown when fact() or factorial() is used in a formularesponse answer
-                    #   that tests on negative and/or non-integer inputs
-                    # ve.message will be: `factorial() only accepts integral values` or `factorial() not defined for negative values`
-                    log.debug(
-                        'formularesponse: factorial function used in response that tests negative and/or non-integer inputs. given={0}'.format(given))
-                    raise StudentInputError(
-                        "factorial function not permitted in answer for this problem. Provided answer was: {0}".format(given))
-                # If non-factorial related ValueError thrown, handle it the same as any other Exception
-                log.debug('formularesponse: error {0} in formula'.format(ve))
-                raise StudentInputError("Invalid input: Could not parse '%s' as a formula" %
-                                        cgi.escape(given))
-            except Exception as err:
-                # traceback.print_exc()
-                log.debug('formularesponse: error %s in formula' % err)
-                raise StudentInputError("Invalid input: Could not parse '%s' as a formula" %
-                                        cgi.escape(given))
+        # ranges give numerical ranges for testing
+        # TODO: allow specified ranges (i.e. integers and complex numbers) for random variables
+        sample_values = dict(
+            (str(var), numpy.array([random.uniform(*ranges[var]) for _ in range(numsamples)]))
+            for var in ranges
+        )
+        instructor_variables = self.strip_dict(dict(self.context))
+        instructor_variables.update(sample_values)
+        student_variables = dict(sample_values)
+
+        # Parse both formulas once, and reuse them for every sample
+        instructor_formula = compile_expression(instructor_variables, dict(),
+                                                expected, cs=self.case_sensitive)
+        student_formula = self.evaluate_student_formula(
+            given, compile_expression, student_variables, dict(), given, cs=self.case_sensitive)
+
+        # Evaluate both formulas on all of the samples at once. If that isn't
+        # possible (e.g. the formula uses a function that doesn't support arrays),
+        # or any sample doesn't evaluate to a finite number, evaluate the samples
+        # one at a time, which gives the same errors as evaluating them individually.
+        try:
+            instructor_results = self.evaluate_samples(instructor_formula, instructor_variables, numsamples)
+            student_results = self.evaluate_samples(student_formula, student_variables, numsamples)
+        except Exception:
+            instructor_results = student_results = None
+
+        if instructor_results is None or student_results is None:
+            for i in range(numsamples):
+                instructor_sample = dict(instructor_variables)
+                student_sample = dict()
+                for var in sample_values:
+                    instructor_sample[var] = sample_values[var][i]
+                    student_sample[var] = sample_values[var][i]
+                instructor_result = instructor_formula.evaluate(instructor_sample)
+                student_result = self.evaluate_student_formula(given, student_formula.evaluate, student_sample)
+                if not compare_with_tolerance(student_result, instructor_result, self.tolerance):
+                    return "incorrect"
+            return "correct"
+
+        for student_result, instructor_result in zip(student_results, instructor_results):
             if not compare_with_tolerance(student_result, instructor_result, self.tolerance):
                 return "incorrect"
         return "correct"
 
+    def evaluate_samples(self, formula, variables, numsamples):
+        """
+        Evaluate `formula` (a CompiledExpression) on all of the sampled
+        variables at once. Returns an array with one result per sample, or
+        None if any of the results isn't a finite number.
+        """
+        results = numpy.asarray(formula.evaluate(variables))
+        if results.shape == ():
+            # The formula doesn't depend on the sampled variables
+            results = numpy.resize(results, numsamples)
+        if results.shape != (numsamples,) or not numpy.all(numpy.isfinite(results)):
+            return None
+        return results
+
+    def evaluate_student_formula(self, given, function, *args, **kwargs):
+        """
+        Call `function` (which parses or evaluates the student's formula `given`),
+        converting any errors into StudentInputErrors.
+        """
+        try:
+            return function(*args, **kwargs)
+        except UndefinedVariable as uv:
+            log.debug(
+                'formularesponse: undefined variable in given=%s' % given)
+            raise StudentInputError(
+                "Invalid input: " + uv.message + " not permitted in answer")
+        except ValueError as ve:
+            if 'factorial' in ve.message:
+                # This is thrown when fact() or factorial() is used in a formularesponse answer
+                #   that tests on negative and/or non-integer inputs
+                # ve.message will be: `factorial() only accepts integral values` or `factorial() not defined for negative values`
+                log.debug(
+                    'formularesponse: factorial function used in response that tests negative and/or non-integer inputs. given={0}'.format(given))
+                raise StudentInputError(
+                    "factorial function not permitted in answer for this problem. Provided answer was: {0}".format(given))
+            # If non-factorial related ValueError thrown, handle it the same as any other Exception
+            log.debug('formularesponse: error {0} in formula'.format(ve))
+            raise StudentInputError("Invalid input: Could not parse '%s' as a formula" %
+                                    cgi.escape(given))
+        except Exception as err:
+            # traceback.print_exc()
+            log.debug('formularesponse: error %s in formula' % err)
+            raise StudentInputError("Invalid input: Could not parse '%s' as a formula" %
+                                    cgi.escape(given))
+
     def strip_dict(self, d):
         ''' Takes a dict. Returns an identical dict, with all non-word
         keys and all non-numeric values stripped out. All values also
@@ -6,6 +6,7 @@ import textwrap
 import mock
 
 from .response_xml_factory import StringResponseXMLFactory, CustomResponseXMLFactory
+from capa.capa_problem import LoncapaProblem
 from . import test_system, new_loncapa_problem
 
 class CapaHtmlRenderTest(unittest.TestCase):
@@ -51,6 +52,62 @@ class CapaHtmlRenderTest(unittest.TestCase):
         self.assertEqual(test_element.tag, "test")
         self.assertEqual(test_element.text, "Test include")
 
+    def test_template_reused(self):
+        # Problems with the same text share a parsed template, but
+        # each gets its own copy of the tree, with its own context
+        xml_str = textwrap.dedent("""
+            <problem>
+            <script type="loncapa/python">
+            answer = str(seed)
+            </script>
+            <p>$answer</p>
+            </problem>
+        """)
+
+        with mock.patch('capa.capa_problem.etree.XML', wraps=etree.XML) as mock_xml:
+            first = new_loncapa_problem(xml_str, system=self.system)
+            second = LoncapaProblem(xml_str, id='1', seed=42, system=self.system)
+            parse_calls = [call for call in mock_xml.call_args_list if call[0][0] == first.problem_text]
+            self.assertEqual(len(parse_calls), 1)
+
+        self.assertIsNot(first.tree, second.tree)
+        self.assertEqual(first.context['answer'], '723')
+        self.assertEqual(second.context['answer'], '42')
+
+    def test_template_include_changed(self):
+        # A cached template isn't used once a file it included has changed
+        self._create_test_file('test_changed_include.xml', '<test>Before</test>')
+        xml_str = '<problem><include file="test_changed_include.xml"/></problem>'
+        problem = new_loncapa_problem(xml_str, system=self.system)
+        self.assertEqual(etree.XML(problem.get_html()).find("test").text, "Before")
+
+        with self.system.filestore.open('test_changed_include.xml', 'w') as test_fp:
+            test_fp.write('<test>After</test>')
+        problem = new_loncapa_problem(xml_str, system=self.system)
+        self.assertEqual(etree.XML(problem.get_html()).find("test").text, "After")
+
+    def test_template_include_not_read_when_unchanged(self):
+        # Checking that a cached template's includes haven't changed doesn't read them
+        self._create_test_file('test_unchanged_include.xml', '<test>Unchanged</test>')
+        xml_str = '<problem><include file="test_unchanged_include.xml"/></problem>'
+        new_loncapa_problem(xml_str, system=self.system)
+
+        with mock.patch.object(self.system.filestore, 'open', wraps=self.system.filestore.open) as mock_open:
+            problem = new_loncapa_problem(xml_str, system=self.system)
+            self.assertFalse(mock_open.called)
+        self.assertEqual(etree.XML(problem.get_html()).find("test").text, "Unchanged")
+
+    def test_template_failed_include_not_cached(self):
+        # When debugging, a problem whose include fails is still made, but
+        # isn't cached without the included file
+        xml_str = '<problem><include file="test_late_include.xml"/></problem>'
+        problem = new_loncapa_problem(xml_str, system=self.system)
+        self.assertIsNone(etree.XML(problem.get_html()).find("test"))
+
+        self._create_test_file('test_late_include.xml', '<test>Included</test>')
+        problem = new_loncapa_problem(xml_str, system=self.system)
+        self.assertEqual(etree.XML(problem.get_html()).find("test").text, "Included")
+
     def test_process_outtext(self):
         # Generate some XML with <startouttext /> and <endouttext />
         xml_str = textwrap.dedent("""
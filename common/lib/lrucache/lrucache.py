@@ -0,0 +1,50 @@
+"""
+A bounded, thread-safe, in-process cache, shared by the libraries that keep
+per-process caches of things that are expensive to rebuild (compiled calc
+expressions, capa problem templates, modulestore parent maps).
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread-safe mapping that holds at most `max_size` items, evicting the
+    least recently used item when full
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the value for key (marking it as recently used), or default
+        """
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Store value under key, evicting the least recently used item if needed
+        """
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all items
+        """
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
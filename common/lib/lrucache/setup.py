@@ -0,0 +1,7 @@
+from setuptools import setup
+
+setup(
+    name="lrucache",
+    version="0.1",
+    py_modules=["lrucache"],
+)
@@ -0,0 +1,32 @@
+"""
+Unit tests for lrucache.py
+"""
+
+import unittest
+from lrucache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    """
+    Tests of the LRUCache
+    """
+    def test_eviction(self):
+        """
+        The LRU cache evicts the least recently used item
+        """
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('a', 'missing'), 'missing')
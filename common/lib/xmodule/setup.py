@@ -8,6 +8,7 @@ setup(
         'distribute',
         'docopt',
         'capa',
+        'lrucache',
         'path.py',
     ],
     package_data={
@@ -15,13 +15,15 @@ from PIL import Image
 
 class StaticContent(object):
     def __init__(self, loc, name, content_type, data, last_modified_at=None, thumbnail_location=None, import_path=None,
-                 length=None):
+                 length=None, content_digest=None):
         self.location = loc
         self.name = name   # a display string which can be edited, and thus not part of the location which needs to be fixed
         self.content_type = content_type
         self._data = data
         self.length = length
         self.last_modified_at = last_modified_at
+        # a digest (e.g. the md5 GridFS computes) of the data, which changes whenever the data does
+        self.content_digest = content_digest
         self.thumbnail_location = Location(thumbnail_location) if thumbnail_location is not None else None
         # optional information about where this file was imported from. This is needed to support import/export
         # cycles
@@ -89,14 +91,22 @@ class StaticContent(object):
     def stream_data(self):
         yield self._data
 
+    def stream_data_in_range(self, first_byte, last_byte):
+        """
+        Stream the data from first_byte to last_byte, inclusive
+        """
+        yield self._data[first_byte:last_byte + 1]
+
 
 class StaticContentStream(StaticContent):
     def __init__(self, loc, name, content_type, stream, last_modified_at=None, thumbnail_location=None, import_path=None,
-                 length=None):
+                 length=None, content_digest=None, chunk_size=None):
         super(StaticContentStream, self).__init__(loc, name, content_type, None, last_modified_at=last_modified_at,
                                                   thumbnail_location=thumbnail_location, import_path=import_path,
-                                                  length=length)
+                                                  length=length, content_digest=content_digest)
         self._stream = stream
+        # the size of the chunks the underlying store keeps the data in, if it uses chunks
+        self.chunk_size = chunk_size
 
     def stream_data(self):
         while True:
@@ -105,6 +115,28 @@ class StaticContentStream(StaticContent):
                 break
             yield chunk
 
+    def stream_data_in_range(self, first_byte, last_byte):
+        """
+        Stream the data from first_byte to last_byte, inclusive.  Seeks rather than
+        reading the data before first_byte, so a GridFS stream only fetches the
+        chunks the range covers.
+        """
+        self._stream.seek(first_byte)
+        remaining = last_byte - first_byte + 1
+        while remaining > 0:
+            chunk = self._stream.read(min(remaining, 1024))
+            if len(chunk) == 0:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def read_chunk(self, index):
+        """
+        Returns the index'th chunk_size bytes of the data
+        """
+        self._stream.seek(index * self.chunk_size)
+        return self._stream.read(self.chunk_size)
+
     def close(self):
         self._stream.close()
 
@@ -112,7 +144,7 @@ class StaticContentStream(StaticContent):
         self._stream.seek(0)
         content = StaticContent(self.location, self.name, self.content_type, self._stream.read(),
                                 last_modified_at=self.last_modified_at, thumbnail_location=self.thumbnail_location,
-                                import_path=self.import_path, length=self.length)
+                                import_path=self.import_path, length=self.length, content_digest=self.content_digest)
         return content
 
 
@@ -431,6 +431,14 @@ class ModuleStoreBase(ModuleStore):
                 return c
         return None
 
+    def get_course_version(self, location):
+        """
+        Returns the version stamp of the course (org/course) that location belongs to,
+        which changes whenever the course's content does, or None if this store
+        doesn't keep track of changes to its content
+        """
+        return None
+
 
 def namedtuple_to_son(namedtuple, prefix=''):
     """
@@ -17,6 +17,8 @@ import sys
 import logging
 import copy
 
+from bson import BSON
+from bson.son import SON
 from collections import namedtuple
 from fs.osfs import OSFS
 from itertools import repeat
@@ -25,6 +27,7 @@ from operator import attrgetter
 from uuid import uuid4
 
 from importlib import import_module
+from lrucache import LRUCache
 from xmodule.errortracker import null_error_tracker, exc_info_to_str
 from xmodule.mako_module import MakoDescriptorSystem
 from xmodule.x_module import XModuleDescriptor
@@ -35,6 +38,7 @@ from xblock.core import Scope
 from xmodule.modulestore import ModuleStoreBase, Location, namedtuple_to_son
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.modulestore.inheritance import own_metadata, INHERITABLE_METADATA, inherit_metadata
+from xmodule.modulestore.mongo.course_data_cache import CourseDataCache
 
 log = logging.getLogger(__name__)
 
@@ -57,6 +61,34 @@ class InvalidWriteError(Exception):
     """
 
 
+class DefinitionDataLazyLoader(object):
+    """
+    A placeholder for the definition data of an item which was loaded without it.
+    Like split_mongo's DefinitionLazyLoader, it knows how to fetch the data when it is
+    first needed.
+    """
+    def __init__(self, modulestore, location):
+        """
+        :param modulestore: the MongoModuleStore which holds the item
+        :param location: the Location (including revision) of the item
+        """
+        self.modulestore = modulestore
+        self.location = location
+
+    def fetch(self):
+        """
+        Fetch the definition data. Note, the caller should replace this lazy
+        loader with the result so as not to fetch more than once
+        """
+        item = self.modulestore.collection.find_one(
+            location_to_query(self.location, wildcard=False),
+            {'definition.data': True}
+        )
+        if item is None:
+            raise ItemNotFoundError(self.location)
+        return item.get('definition', {}).get('data', {})
+
+
 class MongoKeyValueStore(KeyValueStore):
     """
     A KeyValueStore that maps keyed data access to one of the 3 data areas
@@ -69,6 +101,19 @@ class MongoKeyValueStore(KeyValueStore):
         self._location = location
         self._category = category
 
+    @property
+    def _data(self):
+        """
+        The definition data, fetched first if it was loaded lazily
+        """
+        if isinstance(self._raw_data, DefinitionDataLazyLoader):
+            self._raw_data = self._raw_data.fetch()
+        return self._raw_data
+
+    @_data.setter
+    def _data(self, value):
+        self._raw_data = value
+
     def get(self, key):
         if key.scope == Scope.children:
             return self._children
@@ -153,13 +198,17 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
     references to metadata_inheritance_tree
     """
     def __init__(self, modulestore, module_data, default_class, resources_fs,
-                 error_tracker, render_template, cached_metadata=None):
+                 error_tracker, render_template, cached_metadata=None, copy_module_data=False):
         """
         modulestore: the module store that can be used to retrieve additional modules
 
         module_data: a dict mapping Location -> json that was cached from the
             underlying modulestore
 
+        copy_module_data: if True, the json in module_data is shared with other systems
+            (as the module data of the modulestore's course_data_cache is), so each item's
+            json is copied before a descriptor is loaded from it
+
         default_class: The default_class to use when loading an
             XModuleDescriptor from the module_data
 
@@ -179,6 +228,7 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
         # define an attribute here as well, even though it's None
         self.course_id = None
         self.cached_metadata = cached_metadata
+        self.copy_module_data = copy_module_data
 
     def load_item(self, location):
         """
@@ -193,6 +243,9 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
                 self.module_data.update(module.system.module_data)
             return module
         else:
+            if self.copy_module_data:
+                json_data = _copy_item_data(json_data)
+                self.module_data[location] = json_data
             # load the module and apply the inherited metadata
             try:
                 category = json_data['location']['category']
@@ -228,6 +281,9 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
                 return module
             except:
                 log.warning("Failed to load descriptor", exc_info=True)
+                definition = json_data.get('definition', {})
+                if isinstance(definition.get('data'), DefinitionDataLazyLoader):
+                    definition['data'] = definition['data'].fetch()
                 return ErrorDescriptor.from_json(
                     json_data,
                     self,
@@ -236,6 +292,22 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
                 )
 
 
+def _copy_item_data(json_data):
+    """
+    Returns a copy of an item's json that shares nothing with it that a descriptor
+    loaded from it can change: its definition data, children and metadata. Definition
+    data that is still to be loaded lazily is left to the (stateless) loader.
+    """
+    json_data = json_data.copy()
+    definition = json_data.get('definition', {}).copy()
+    if not isinstance(definition.get('data'), DefinitionDataLazyLoader):
+        definition['data'] = copy.deepcopy(definition.get('data', {}))
+    definition['children'] = list(definition.get('children', []))
+    json_data['definition'] = definition
+    json_data['metadata'] = copy.deepcopy(json_data.get('metadata', {}))
+    return json_data
+
+
 def location_to_query(location, wildcard=True):
     """
     Takes a Location and returns a SON object that will query for that location.
@@ -258,6 +330,14 @@ def location_to_query(location, wildcard=True):
 
 metadata_cache_key = attrgetter('org', 'course')
 
+# The number of items that bulk_update_items writes to the db at once
+BULK_WRITE_BATCH_SIZE = 500
+# and the most bytes of item data it puts in one batch, to stay well under the db's 16MB limit on commands
+BULK_WRITE_BATCH_BYTES = 8 * 1024 * 1024
+
+# The number of courses whose parent maps are kept in memory per process
+PARENT_MAP_CACHE_SIZE = 100
+
 
 class MongoModuleStore(ModuleStoreBase):
     """
@@ -269,7 +349,18 @@ class MongoModuleStore(ModuleStoreBase):
                  port=27017, default_class=None,
                  error_tracker=null_error_tracker,
                  user=None, password=None, request_cache=None,
-                 metadata_inheritance_cache_subsystem=None, **kwargs):
+                 metadata_inheritance_cache_subsystem=None,
+                 lazy_definition_data=False, course_data_cache_size=0, **kwargs):
+        """
+        lazy_definition_data: if True, whole subtrees (depth=None) are fetched without
+            their definition data, which is only loaded from the db when it is first accessed
+
+        course_data_cache_size: the number of bytes of module data that courses loaded with
+            depth=None may hold in this process's CourseDataCache. 0 disables the cache.
+            The course version stamps that keep the cache current are kept in the
+            metadata_inheritance_cache_subsystem, which must be shared with every process that
+            writes to the courses.
+        """
 
         super(MongoModuleStore, self).__init__()
 
@@ -291,6 +382,9 @@ class MongoModuleStore(ModuleStoreBase):
         self.collection.ensure_index(
             zip(('_id.' + field for field in Location._fields), repeat(1)))
 
+        # and one over the children, for finding the parents of an item
+        self.collection.ensure_index('definition.children')
+
         if default_class is not None:
             module_path, _, class_name = default_class.rpartition('.')
             class_ = getattr(import_module(module_path), class_name)
@@ -303,6 +397,11 @@ class MongoModuleStore(ModuleStoreBase):
         self.ignore_write_events_on_courses = []
         self.request_cache = request_cache
         self.metadata_inheritance_cache_subsystem = metadata_inheritance_cache_subsystem
+        self.lazy_definition_data = lazy_definition_data
+        self.course_data_cache = CourseDataCache(course_data_cache_size) if course_data_cache_size else None
+        self._course_versions = {}
+        self._parent_maps = LRUCache(PARENT_MAP_CACHE_SIZE)
+        self._write_commands = None  # whether the db server supports write commands, once known
 
     def compute_metadata_inheritance_tree(self, location):
         '''
@@ -427,6 +526,41 @@ class MongoModuleStore(ModuleStoreBase):
         if pseudo_course_id not in self.ignore_write_events_on_courses:
             self.get_cached_metadata_inheritance_tree(location, force_refresh=True)
 
+    def get_course_version(self, location):
+        """
+        Returns the version stamp of the course (org/course) that location belongs to.
+        The stamp changes whenever anything in the course is written.
+        """
+        key = 'course_version.' + get_course_id_no_run(location)
+        if self.metadata_inheritance_cache_subsystem is None:
+            return self._course_versions.setdefault(key, uuid4().hex)
+
+        version = self.metadata_inheritance_cache_subsystem.get(key)
+        if version is None:
+            # another process may be doing the same, so only add ours if there still isn't one
+            self.metadata_inheritance_cache_subsystem.add(key, uuid4().hex)
+            version = self.metadata_inheritance_cache_subsystem.get(key)
+        if version is None:
+            # the caching subsystem isn't keeping anything, so no version can be trusted
+            version = uuid4().hex
+        return version
+
+    def update_course_version(self, location):
+        """
+        Gives the course (org/course) that location belongs to a new version stamp,
+        so that descriptors and parent maps cached for the course are no longer used
+        """
+        course_key = get_course_id_no_run(location)
+        key = 'course_version.' + course_key
+        if self.metadata_inheritance_cache_subsystem is None:
+            self._course_versions[key] = uuid4().hex
+        else:
+            self.metadata_inheritance_cache_subsystem.set(key, uuid4().hex)
+
+        # the parent map kept in this process is replaced when its version is next checked
+        if self.request_cache is not None:
+            self.request_cache.data.get('parent_maps', {}).pop(course_key, None)
+
     def _clean_item_data(self, item):
         """
         Renames the '_id' field in item to 'location'
@@ -441,14 +575,75 @@ class MongoModuleStore(ModuleStoreBase):
         }
         return list(self.collection.find(query))
 
+    def _find_items_for_cache(self, query):
+        """
+        Returns a list of the items matching query. If lazy_definition_data is set,
+        the items are fetched without their definition data, and a DefinitionDataLazyLoader
+        is put in its place.
+        """
+        if not self.lazy_definition_data:
+            return list(self.collection.find(query))
+
+        items = list(self.collection.find(query, {'definition.data': False}))
+        for item in items:
+            item.setdefault('definition', {})['data'] = DefinitionDataLazyLoader(self, Location(item['_id']))
+        return items
+
+    def _query_course_for_cache_children(self, location):
+        """
+        Returns a dictionary mapping Location -> item data for every item in the
+        course (org/course) of location, fetched in a single query
+        """
+        query = {
+            '_id.tag': location.tag,
+            '_id.org': location.org,
+            '_id.course': location.course,
+            '_id.revision': None,
+        }
+        return dict((Location(item['_id']), item) for item in self._find_items_for_cache(query))
+
+    def _cache_subtrees(self, items):
+        """
+        Returns a dictionary mapping Location -> item data, populated with json data
+        for items and all of their descendents.
+        Rather than querying a level of the tree at a time, this fetches every item
+        in the course at once (one query per course that items belong to), and then
+        walks the trees in memory, so it should only be used for items that are courses.
+        """
+        data = {}
+        course_items = {}
+        to_process = list(items)
+        while to_process:
+            item = to_process.pop()
+            self._clean_item_data(item)
+            location = Location(item['location'])
+            data[location] = item
+
+            children = item.get('definition', {}).get('children', [])
+            if not children:
+                continue
+            key = metadata_cache_key(location)
+            if key not in course_items:
+                course_items[key] = self._query_course_for_cache_children(location)
+            for child in children:
+                # pop the child, so that items shared by several parents are only processed once
+                child_item = course_items[key].pop(Location(child), None)
+                if child_item is not None:
+                    to_process.append(child_item)
+
+        return data
+
     def _cache_children(self, items, depth=0):
         """
         Returns a dictionary mapping Location -> item data, populated with json data
         for all descendents of items up to the specified depth.
         (0 = no descendents, 1 = children, 2 = grandchildren, etc)
-        If depth is None, will load all the children.
-        This will make a number of queries that is linear in the depth.
+        If depth is None and items are all courses, will load all the children, with
+        one query per course. Otherwise, this will make a number of queries that is
+        linear in the depth (so that loading part of a course doesn't fetch all of it).
         """
+        if depth is None and all(item['_id']['category'] == 'course' for item in items):
+            return self._cache_subtrees(items)
 
         data = {}
         to_process = list(items)
@@ -475,9 +670,11 @@ class MongoModuleStore(ModuleStoreBase):
 
         return data
 
-    def _load_item(self, item, data_cache, apply_cached_metadata=True):
+    def _load_item(self, item, data_cache, apply_cached_metadata=True, copy_module_data=False):
         """
-        Load an XModuleDescriptor from item, using the children stored in data_cache
+        Load an XModuleDescriptor from item, using the children stored in data_cache.
+        If copy_module_data is set, the json in data_cache is shared, and is copied
+        before descriptors are loaded from it (see CachingDescriptorSystem).
         """
         data_dir = getattr(item, 'data_dir', item['location']['course'])
         root = self.fs_root / data_dir
@@ -501,6 +698,7 @@ class MongoModuleStore(ModuleStoreBase):
             self.error_tracker,
             self.render_template,
             cached_metadata,
+            copy_module_data=copy_module_data,
         )
         return system.load_item(item['location'])
 
@@ -572,10 +770,31 @@ class MongoModuleStore(ModuleStoreBase):
             calls to get_children() to cache. None indicates to cache all descendents.
         """
         location = Location.ensure_fully_specified(location)
+        if depth is None and location.category == 'course' and self.course_data_cache is not None:
+            return self._get_cached_course(location)
         item = self._find_one(location)
         module = self._load_items([item], depth)[0]
         return module
 
+    def _get_cached_course(self, location):
+        """
+        Returns the course descriptor at location, with all of its descendents loaded
+        from the module data in the course_data_cache, if the current version of the
+        course is there. The descriptors are new for each call, so they can be used
+        (and changed) by one thread without affecting any other.
+        """
+        # get the version before loading, so that writes made while the course
+        # is loading cause the next request for it to miss the cache
+        version = self.get_course_version(location)
+        module_data = self.course_data_cache.get(location.url(), version)
+        if module_data is None:
+            item = self._find_one(location)
+            module_data = self._cache_children([item], depth=None)
+            size = sum(len(repr(json_data)) for json_data in module_data.values())
+            self.course_data_cache.set(location.url(), version, module_data, size)
+        # the system gets its own dict, which it fills with copies of the items it loads
+        return self._load_item(module_data[location], dict(module_data), copy_module_data=True)
+
     def get_instance(self, course_id, location, depth=0):
         """
         TODO (vshnayder): implement policy tracking in mongo.
@@ -650,6 +869,7 @@ class MongoModuleStore(ModuleStoreBase):
                     'children': xmodule.children if xmodule.has_children else []
                 }
             })
+        self.update_course_version(xmodule.location)
         # recompute (and update) the metadata inheritance tree which is cached
         self.refresh_cached_metadata_inheritance_tree(xmodule.location)
         self.fire_updated_modulestore_signal(get_course_id_no_run(xmodule.location), xmodule.location)
@@ -741,9 +961,87 @@ class MongoModuleStore(ModuleStoreBase):
             # from overriding our default value set in the init method.
             safe=self.collection.safe
         )
+        self.update_course_version(Location(location))
         if result['n'] == 0:
             raise ItemNotFoundError(location)
 
+    def bulk_update_items(self, items):
+        """
+        Write many items at once, as an import does.
+
+        items: an iterable of (location, data, children, metadata) tuples. As with
+            update_item, update_children and update_metadata, the item's data and
+            metadata are set, as are its children if there are any, and the item is
+            created if it doesn't exist.
+
+        Rather than making three updates per item, the items are written BULK_WRITE_BATCH_SIZE
+        (or BULK_WRITE_BATCH_BYTES) at a time, each batch with a single update command (on
+        servers that support write commands; otherwise, with one upsert per item). The cached
+        metadata inheritance tree of each course written to is then refreshed once.
+        """
+        courses = {}
+        batch = []
+        batch_bytes = 0
+        for location, data, children, metadata in items:
+            location = Location(location)
+            courses.setdefault(get_course_id_no_run(location), location)
+            update = {'definition.data': data, 'metadata': metadata}
+            if children:
+                update['definition.children'] = children
+            batch.append((location, update))
+            batch_bytes += len(BSON.encode(update))
+            if len(batch) >= BULK_WRITE_BATCH_SIZE or batch_bytes >= BULK_WRITE_BATCH_BYTES:
+                self._write_batch(batch)
+                batch = []
+                batch_bytes = 0
+        if batch:
+            self._write_batch(batch)
+
+        for course_id, location in courses.iteritems():
+            self.update_course_version(location)
+            # recompute (and update) the metadata inheritance tree which is cached
+            self.refresh_cached_metadata_inheritance_tree(location)
+            self.fire_updated_modulestore_signal(course_id, location)
+
+    def _write_batch(self, updates):
+        """
+        Set each update (a dictionary of fields to $set) in updates, a list of
+        (location, update) pairs, on the item at location, creating the items
+        which don't exist yet.
+        """
+        if not self._supports_write_commands():
+            for location, update in updates:
+                # Must include this to avoid the django debug toolbar (which defines the deprecated "safe=False")
+                # from overriding our default value set in the init method.
+                self.collection.update(
+                    {'_id': location.dict()}, {'$set': update}, upsert=True, safe=self.collection.safe
+                )
+            return
+
+        result = self.collection.database.command(SON([
+            ('update', self.collection.name),
+            ('updates', [
+                {'q': {'_id': location.dict()}, 'u': {'$set': update}, 'upsert': True}
+                for location, update in updates
+            ]),
+            ('ordered', False),
+        ]))
+        if result.get('writeErrors'):
+            raise pymongo.errors.OperationFailure(
+                'Failed to write {0} of {1} items: {2}'.format(
+                    len(result['writeErrors']), len(updates), result['writeErrors'][0].get('errmsg')
+                )
+            )
+
+    def _supports_write_commands(self):
+        """
+        Returns True if the db server takes batched write commands (MongoDB 2.6 and later)
+        """
+        if self._write_commands is None:
+            version = self.collection.database.connection.server_info()['versionArray']
+            self._write_commands = version[:2] >= [2, 6]
+        return self._write_commands
+
     def update_item(self, location, data, allow_not_found=False):
         """
         Set the data in the item specified by the location to
@@ -824,18 +1122,52 @@ class MongoModuleStore(ModuleStoreBase):
         # Must include this to avoid the django debug toolbar (which defines the deprecated "safe=False")
         # from overriding our default value set in the init method.
         self.collection.remove({'_id': Location(location).dict()}, safe=self.collection.safe)
+        self.update_course_version(Location(location))
         # recompute (and update) the metadata inheritance tree which is cached
         self.refresh_cached_metadata_inheritance_tree(Location(location))
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
+    def _get_parent_map(self, location):
+        """
+        Returns a dictionary mapping the url of every item with a parent in the course (org/course)
+        of location to the list of the ids of its parents.
+
+        The map is built with a single query, and is kept (in this process, for the
+        PARENT_MAP_CACHE_SIZE most recently used courses, and in the request cache if present)
+        until the course is next written to.
+        """
+        key = get_course_id_no_run(location)
+        if self.request_cache is not None and key in self.request_cache.data.get('parent_maps', {}):
+            return self.request_cache.data['parent_maps'][key]
+
+        # get the version before querying, so that writes made while the map
+        # is being built cause it to be rebuilt next time
+        version = self.get_course_version(location)
+        cached = self._parent_maps.get(key)
+        if cached is not None and cached[0] == version:
+            parent_map = cached[1]
+        else:
+            parent_map = {}
+            query = {
+                '_id.org': location.org,
+                '_id.course': location.course,
+                'definition.children': {'$exists': True},
+            }
+            for item in self.collection.find(query, {'_id': True, 'definition.children': True}):
+                for child in item['definition']['children']:
+                    parent_map.setdefault(child, []).append(item['_id'])
+            self._parent_maps.set(key, (version, parent_map))
+
+        if self.request_cache is not None:
+            self.request_cache.data.setdefault('parent_maps', {})[key] = parent_map
+        return parent_map
+
     def get_parent_locations(self, location, course_id):
         '''Find all locations that are the parents of this location in this
         course.  Needed for path_to_location().
         '''
         location = Location.ensure_fully_specified(location)
-        items = self.collection.find({'definition.children': location.url()},
-                                     {'_id': True})
-        return [i['_id'] for i in items]
+        return list(self._get_parent_map(location).get(location.url(), []))
 
     def get_errored_courses(self):
         """
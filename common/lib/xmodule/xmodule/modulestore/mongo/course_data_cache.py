@@ -0,0 +1,84 @@
+"""
+A per-process cache of the module data of whole courses, for use by the MongoModuleStore.
+
+Each course's module data (the Location -> item json mapping that descriptors are loaded
+from) is stored along with the version stamp that it was fetched at. The modulestore
+changes a course's version stamp whenever the course is written to, so a lookup with the
+current version stamp never returns stale data.
+
+Only the module data is shared between threads and requests: the modulestore builds new
+descriptors from it for each call, copying each item's json as it's loaded, so the cached
+data is never changed once it has been stored.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+
+class CourseDataCache(object):
+    """
+    A least-recently-used cache of course module data, bounded by the
+    (estimated) number of bytes that the cached courses hold.
+    """
+    def __init__(self, max_size):
+        """
+        max_size: the number of bytes the cached courses may hold in total
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        Returns the module data cached for key at version, or None if there isn't one
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            # move the entry to the most recently used end
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, module_data, size):
+        """
+        Caches module_data for key at version, replacing any other version of it, and
+        evicts the least recently used courses until the cache is within its budget.
+        Courses that are larger than the whole budget aren't cached.
+        """
+        with self._lock:
+            self._remove(key)
+            if size > self.max_size:
+                return
+            self._entries[key] = (version, module_data, size)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """
+        Removes all the cached courses, and resets the hit and miss counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _remove(self, key):
+        """
+        Removes the entry for key, if there is one. Must be called with the lock held.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def __len__(self):
+        return len(self._entries)
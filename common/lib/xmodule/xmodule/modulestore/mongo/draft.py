@@ -46,6 +46,21 @@ def wrap_draft(item):
     return item
 
 
+def pick_drafts(items):
+    """
+    Returns the items (the data of modules) in items that a read should return: the
+    drafts, and then the published items that there isn't a draft of
+    """
+    drafts = [item for item in items if item['_id'].get('revision') == DRAFT]
+    draft_locs = set(as_published(item['_id']) for item in drafts)
+    published = [
+        item
+        for item in items
+        if item['_id'].get('revision') != DRAFT and Location(item['_id']) not in draft_locs
+    ]
+    return drafts + published
+
+
 class DraftModuleStore(MongoModuleStore):
     """
     This mixin modifies a modulestore to give it draft semantics.
@@ -76,22 +91,25 @@ class DraftModuleStore(MongoModuleStore):
             in the request. The depth is counted in the number of calls to
             get_children() to cache. None indicates to cache all descendents
         """
-
-        try:
-            return wrap_draft(super(DraftModuleStore, self).get_item(as_draft(location), depth=depth))
-        except ItemNotFoundError:
+        location = Location.ensure_fully_specified(location)
+        if location.category in DIRECT_ONLY_CATEGORIES or location.revision == DRAFT:
+            # there's only the one revision to look for
             return wrap_draft(super(DraftModuleStore, self).get_item(location, depth=depth))
 
+        # fetch the draft and the published item together, and use the draft if there is one
+        query = location_to_query(location, wildcard=False)
+        query['_id.revision'] = {'$in': [None, DRAFT]}
+        items = pick_drafts(list(self.collection.find(query)))
+        if not items:
+            raise ItemNotFoundError(location)
+        return wrap_draft(self._load_items(items[:1], depth)[0])
+
     def get_instance(self, course_id, location, depth=0):
         """
         Get an instance of this location, with policy for course_id applied.
         TODO (vshnayder): this may want to live outside the modulestore eventually
         """
-
-        try:
-            return wrap_draft(super(DraftModuleStore, self).get_instance(course_id, as_draft(location), depth=depth))
-        except ItemNotFoundError:
-            return wrap_draft(super(DraftModuleStore, self).get_instance(course_id, location, depth=depth))
+        return self.get_item(location, depth=depth)
 
     def create_xmodule(self, location, definition_data=None, metadata=None, system=None):
         """
@@ -121,19 +139,16 @@ class DraftModuleStore(MongoModuleStore):
             in the request. The depth is counted in the number of calls to
             get_children() to cache. None indicates to cache all descendents
         """
-        draft_loc = as_draft(location)
+        location = Location(location)
+        if location.revision == DRAFT:
+            items = super(DraftModuleStore, self).get_items(location, course_id=course_id, depth=depth)
+            return [wrap_draft(item) for item in items]
 
-        draft_items = super(DraftModuleStore, self).get_items(draft_loc, course_id=course_id, depth=depth)
-        items = super(DraftModuleStore, self).get_items(location, course_id=course_id, depth=depth)
-
-        draft_locs_found = set(item.location.replace(revision=None) for item in draft_items)
-        non_draft_items = [
-            item
-            for item in items
-            if (item.location.revision != DRAFT
-                and item.location.replace(revision=None) not in draft_locs_found)
-        ]
-        return [wrap_draft(item) for item in draft_items + non_draft_items]
+        # fetch the drafts and the published items together, and use the drafts where there are any
+        query = location_to_query(location)
+        query['_id.revision'] = {'$in': [None, DRAFT]}
+        items = pick_drafts(list(self.collection.find(query, sort=[('revision', pymongo.ASCENDING)])))
+        return [wrap_draft(item) for item in self._load_items(items, depth)]
 
     def convert_to_draft(self, source_location):
         """
@@ -148,6 +163,7 @@ class DraftModuleStore(MongoModuleStore):
         original['_id'] = draft_location.dict()
         try:
             self.collection.insert(original)
+            self.update_course_version(draft_location)
         except pymongo.errors.DuplicateKeyError:
             raise DuplicateItemError(original['_id'])
 
@@ -190,6 +206,19 @@ class DraftModuleStore(MongoModuleStore):
 
         return super(DraftModuleStore, self).update_children(draft_loc, children)
 
+    def bulk_update_items(self, items):
+        """
+        Write many items at once. Each item goes through update_item, update_children and
+        update_metadata, so that the items which must be written as drafts are.
+
+        items: an iterable of (location, data, children, metadata) tuples
+        """
+        for location, data, children, metadata in items:
+            self.update_item(location, data)
+            if children:
+                self.update_children(location, children)
+            self.update_metadata(location, metadata)
+
     def update_metadata(self, location, metadata):
         """
         Set the metadata for the item specified by the location to
@@ -249,19 +278,46 @@ class DraftModuleStore(MongoModuleStore):
         self.convert_to_draft(location)
         super(DraftModuleStore, self).delete_item(location)
 
-    def _query_children_for_cache_children(self, items):
-        # first get non-draft in a round-trip
-        to_process_non_drafts = super(DraftModuleStore, self)._query_children_for_cache_children(items)
-
+    def _query_course_for_cache_children(self, location):
+        # get drafts and non-drafts in the same round-trip
+        query = {
+            '_id.tag': location.tag,
+            '_id.org': location.org,
+            '_id.course': location.course,
+        }
         to_process_dict = {}
-        for non_draft in to_process_non_drafts:
-            to_process_dict[Location(non_draft["_id"])] = non_draft
+        to_process_drafts = []
+        for item in self._find_items_for_cache(query):
+            item_loc = Location(item['_id'])
+            if item_loc.revision == DRAFT:
+                to_process_drafts.append(item)
+            else:
+                to_process_dict[item_loc] = item
+
+        # as in _query_children_for_cache_children, a draft replaces its non-draft,
+        # if the non-draft exists
+        for draft in to_process_drafts:
+            draft_as_non_draft_loc = as_published(draft['_id'])
+            if draft_as_non_draft_loc in to_process_dict:
+                to_process_dict[draft_as_non_draft_loc] = draft
 
-        # now query all draft content in another round-trip
+        return to_process_dict
+
+    def _query_children_for_cache_children(self, items):
+        # get drafts and non-drafts in the same round-trip
+        locations = [Location(item) for item in items]
         query = {
-            '_id': {'$in': [namedtuple_to_son(as_draft(Location(item))) for item in items]}
+            '_id': {'$in': [namedtuple_to_son(location) for location in locations] +
+                           [namedtuple_to_son(as_draft(location)) for location in locations]}
         }
-        to_process_drafts = list(self.collection.find(query))
+        to_process_dict = {}
+        to_process_drafts = []
+        for item in self.collection.find(query):
+            item_loc = Location(item['_id'])
+            if item_loc.revision == DRAFT:
+                to_process_drafts.append(item)
+            else:
+                to_process_dict[item_loc] = item
 
         # now we have to go through all drafts and replace the non-draft
         # with the draft. This is because the semantics of the DraftStore is to
@@ -1,3 +1,5 @@
+import copy
+
 from xmodule.modulestore.locator import DescriptionLocator
 
 
@@ -8,19 +10,55 @@ class DefinitionLazyLoader(object):
     object doesn't force access during init but waits until client wants the
     definition. Only works if the modulestore is a split mongo store.
     """
-    def __init__(self, modulestore, definition_id):
+    def __init__(self, modulestore, definition_id, batch=None):
         """
         Simple placeholder for yet-to-be-fetched data
         :param modulestore: the pymongo db connection with the definitions
         :param definition_locator: the id of the record in the above to fetch
+        :param batch: an optional DefinitionBatch to fetch the definition along with
         """
         self.modulestore = modulestore
         self.definition_locator = DescriptionLocator(definition_id)
+        self.batch = batch
+        if batch is not None:
+            batch.add(definition_id)
 
     def fetch(self):
         """
         Fetch the definition. Note, the caller should replace this lazy
         loader pointer with the result so as not to fetch more than once
         """
+        if self.batch is not None:
+            return self.batch.get(self.definition_locator.definition_id)
         return self.modulestore.definitions.find_one(
             {'_id': self.definition_locator.definition_id})
+
+
+class DefinitionBatch(object):
+    """
+    The definitions for a set of lazy loaders, which are all fetched in a single
+    query as soon as any one of them is needed.
+    """
+    def __init__(self, modulestore):
+        self.modulestore = modulestore
+        self._pending = set()
+        self._definitions = {}
+
+    def add(self, definition_id):
+        """
+        Adds definition_id to the ones to fetch
+        """
+        if definition_id not in self._definitions:
+            self._pending.add(definition_id)
+
+    def get(self, definition_id):
+        """
+        Returns the definition with definition_id (or None if there isn't one),
+        fetching all the pending definitions if it hasn't been fetched yet
+        """
+        if definition_id in self._pending:
+            for definition in self.modulestore.definitions.find({'_id': {'$in': list(self._pending)}}):
+                self._definitions[definition['_id']] = definition
+            self._pending.clear()
+        # each loader gets its own copy, as it would from its own fetch
+        return copy.deepcopy(self._definitions.get(definition_id))
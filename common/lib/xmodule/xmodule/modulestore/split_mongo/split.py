@@ -5,6 +5,7 @@ import pymongo
 import re
 from importlib import import_module
 from path import path
+from bson.objectid import ObjectId
 
 from xmodule.errortracker import null_error_tracker
 from xmodule.x_module import XModuleDescriptor
@@ -14,10 +15,16 @@ from xmodule.modulestore import inheritance
 
 from .. import ModuleStoreBase
 from ..exceptions import ItemNotFoundError
-from .definition_lazy_loader import DefinitionLazyLoader
+from .definition_lazy_loader import DefinitionLazyLoader, DefinitionBatch
 from .caching_descriptor_system import CachingDescriptorSystem
+from .structure_cache import StructureCache, StructureIndex, CourseIndexCache
 
 log = logging.getLogger(__name__)
+
+# the most versions of a structure, counting from its last full snapshot, that are
+# stored as change sets before the next version is stored as a full snapshot again
+STRUCTURE_SNAPSHOT_INTERVAL = 20
+
 #==============================================================================
 # Documentation is at
 # https://edx-wiki.atlassian.net/wiki/display/ENG/Mongostore+Data+Structure
@@ -47,8 +54,22 @@ class SplitMongoModuleStore(ModuleStoreBase):
     def __init__(self, host, db, collection, fs_root, render_template,
                  port=27017, default_class=None,
                  error_tracker=null_error_tracker,
-                 user=None, password=None,
+                 user=None, password=None, structure_cache_size=0,
+                 index_cache_ttl=0, structure_snapshot_interval=STRUCTURE_SNAPSHOT_INTERVAL,
                  **kwargs):
+        """
+        structure_snapshot_interval: each version of a course structure is stored as just
+            the blocks that changed from the version it was derived from, except for every
+            this many'th version, which is stored in full. 1 stores every version in full.
+
+        structure_cache_size: the number of bytes of course structures that this process's
+            StructureCache may hold. 0 disables the cache.
+
+        index_cache_ttl: the number of seconds that this process uses a course's index
+            entry (and so the version_guids of its heads) for before fetching it again.
+            Changes made through this store are seen at once; changes made by other
+            processes may go unseen for this long. 0 disables the cache.
+        """
 
         ModuleStoreBase.__init__(self)
 
@@ -59,8 +80,6 @@ class SplitMongoModuleStore(ModuleStoreBase):
             **kwargs
         ), db)
 
-        # TODO add caching of structures to thread_cache to prevent repeated fetches (but not index b/c
-        # it changes w/o having a change in id)
         self.course_index = self.db[collection + '.active_versions']
         self.structures = self.db[collection + '.structures']
         self.definitions = self.db[collection + '.definitions']
@@ -90,6 +109,9 @@ class SplitMongoModuleStore(ModuleStoreBase):
         self.fs_root = path(fs_root)
         self.error_tracker = error_tracker
         self.render_template = render_template
+        self.structure_cache = StructureCache(structure_cache_size) if structure_cache_size else None
+        self.index_cache = CourseIndexCache(index_cache_ttl) if index_cache_ttl else None
+        self.structure_snapshot_interval = structure_snapshot_interval
 
     def cache_items(self, system, base_usage_ids, depth=0, lazy=True):
         '''
@@ -98,7 +120,8 @@ class SplitMongoModuleStore(ModuleStoreBase):
         :param system: a CachingDescriptorSystem
         :param base_usage_ids: list of usage_ids to fetch
         :param depth: how deep below these to prefetch
-        :param lazy: whether to fetch definitions or use placeholders
+        :param lazy: whether to fetch definitions or use placeholders, which fetch
+            all of the definitions that they're placeholders for at once when one is needed
         '''
         new_module_data = {}
         for usage_id in base_usage_ids:
@@ -108,14 +131,16 @@ class SplitMongoModuleStore(ModuleStoreBase):
                                                new_module_data)
 
         # remove any which were already in module_data (not sure if there's a better way)
-        for newkey in new_module_data.iterkeys():
+        for newkey in new_module_data.keys():
             if newkey in system.module_data:
                 del new_module_data[newkey]
 
         if lazy:
+            batch = DefinitionBatch(self)
             for block in new_module_data.itervalues():
                 block['definition'] = DefinitionLazyLoader(self,
-                                                           block['definition'])
+                                                           block['definition'],
+                                                           batch)
         else:
             # Load all descendants by id
             descendent_definitions = self.definitions.find({
@@ -150,7 +175,9 @@ class SplitMongoModuleStore(ModuleStoreBase):
                 self.render_template
             )
             self._add_cache(course_entry['_id'], system)
-            self.cache_items(system, usage_ids, depth, lazy)
+        # prefetch the blocks to depth even if others were cached before, so
+        # their definitions are batched together
+        self.cache_items(system, usage_ids, depth, lazy)
         return [system.load_item(usage_id, course_entry) for usage_id in usage_ids]
 
     def _get_cache(self, course_version_guid):
@@ -179,6 +206,156 @@ class SplitMongoModuleStore(ModuleStoreBase):
         Should only be used by testing or something which implements transactional boundary semantics
         """
         self.thread_cache.course_cache = {}
+        if self.index_cache is not None:
+            self.index_cache.clear()
+
+    def _get_structure(self, version_guid):
+        """
+        Returns the structure whose _id is version_guid (an ObjectId), or None if there
+        isn't one. The result is the caller's to change.
+        """
+        if self.structure_cache is not None:
+            entry = self.structure_cache.get(version_guid)
+            if entry is not None:
+                return entry
+        entry = self.structures.find_one({'_id': version_guid})
+        if entry is not None:
+            entry = self._materialize_structure(entry)
+            if self.structure_cache is not None:
+                self.structure_cache.set(entry)
+        return entry
+
+    def _get_structures(self, version_guids):
+        """
+        Returns the structures whose _ids are in version_guids, fetching the ones that
+        aren't cached in a single query.
+        """
+        if self.structure_cache is None:
+            return [self._materialize_structure(entry)
+                    for entry in self.structures.find({'_id': {'$in': version_guids}})]
+        result = []
+        missing = []
+        for version_guid in version_guids:
+            entry = self.structure_cache.get(version_guid)
+            if entry is None:
+                missing.append(version_guid)
+            else:
+                result.append(entry)
+        if missing:
+            for entry in self.structures.find({'_id': {'$in': missing}}):
+                entry = self._materialize_structure(entry)
+                self.structure_cache.set(entry)
+                result.append(entry)
+        return result
+
+    def _materialize_structure(self, entry):
+        """
+        Returns the full structure for entry, a document from the structures collection.
+        A document that holds only a change set is applied, along with the change sets
+        in its delta_chain, to the full snapshot that the chain starts at; the latest
+        version in the chain that's in the structure_cache is used in place of the
+        ones before it.
+        """
+        if 'delta' not in entry:
+            return entry
+
+        delta_chain = entry['delta_chain']
+        base = None
+        start = 0
+        if self.structure_cache is not None:
+            for index in range(len(delta_chain) - 1, -1, -1):
+                base = self.structure_cache.get(delta_chain[index])
+                if base is not None:
+                    start = index + 1
+                    break
+        documents = {}
+        if start < len(delta_chain):
+            documents = {
+                document['_id']: document
+                for document in self.structures.find({'_id': {'$in': delta_chain[start:]}})
+            }
+        if base is None:
+            base = documents[delta_chain[0]]
+            start = 1
+
+        blocks = base['blocks']
+        for version_guid in delta_chain[start:]:
+            _apply_delta(blocks, documents[version_guid]['delta'])
+        _apply_delta(blocks, entry['delta'])
+
+        structure = entry.copy()
+        del structure['delta']
+        structure['blocks'] = blocks
+        return structure
+
+    def _insert_structure(self, original_structure, new_structure, updated_usage_ids):
+        """
+        Saves new_structure, and returns its version_guid. new_structure is a new version
+        of original_structure (or, if original_structure is None, a wholly new structure)
+        in which the blocks whose usage_ids are in updated_usage_ids were added or changed,
+        and any others that aren't there any longer were deleted.
+
+        The new version is saved as just those changes, and the chain of versions they
+        apply to, unless that chain would reach structure_snapshot_interval versions or
+        the changes touch half the blocks, in which case it's saved in full.
+        """
+        new_id = ObjectId()
+        new_structure['_id'] = new_id
+        if new_structure.get('original_version') is None:
+            new_structure['original_version'] = new_id
+        updated_usage_ids = set(updated_usage_ids)
+        for usage_id in updated_usage_ids:
+            new_structure['blocks'][usage_id]['update_version'] = new_id
+
+        new_structure.pop('delta_chain', None)
+        document = new_structure
+        if original_structure is not None:
+            delta_chain = original_structure.get('delta_chain', []) + [original_structure['_id']]
+            deleted = [usage_id for usage_id in original_structure['blocks']
+                       if usage_id not in new_structure['blocks']]
+            if (len(delta_chain) < self.structure_snapshot_interval and
+                    2 * (len(updated_usage_ids) + len(deleted)) < len(new_structure['blocks'])):
+                document = {key: value for key, value in new_structure.iteritems() if key != 'blocks'}
+                document['delta_chain'] = delta_chain
+                document['delta'] = {
+                    'updated': {usage_id: new_structure['blocks'][usage_id] for usage_id in updated_usage_ids},
+                    'deleted': deleted,
+                }
+                new_structure['delta_chain'] = delta_chain
+
+        self.structures.insert(document)
+        return new_id
+
+    def _get_structure_index(self, structure):
+        """
+        Returns the StructureIndex of structure, which is kept with it in the
+        structure_cache (so it's only built once per version) if that's in use.
+        """
+        if self.structure_cache is not None:
+            return self.structure_cache.get_index(structure)
+        return StructureIndex(structure['blocks'])
+
+    def _get_index_entry(self, course_id):
+        """
+        Returns the course index entry for course_id, or None if there isn't one, from
+        the index_cache if it's there. Only for reads: the result may be a little out of
+        date, and must not be changed.
+        """
+        if self.index_cache is None:
+            return self.course_index.find_one({'_id': course_id})
+        index = self.index_cache.get(course_id)
+        if index is None:
+            index = self.course_index.find_one({'_id': course_id})
+            if index is not None:
+                self.index_cache.set(course_id, index)
+        return index
+
+    def _invalidate_index_entry(self, course_id):
+        """
+        Drops any cached index entry for course_id: called whenever it's changed
+        """
+        if self.index_cache is not None:
+            self.index_cache.invalidate(course_id)
 
     def _lookup_course(self, course_locator):
         '''
@@ -193,14 +370,14 @@ class SplitMongoModuleStore(ModuleStoreBase):
 
         :param course_locator: any subclass of CourseLocator
         '''
-        # NOTE: if and when this uses cache, the update if changed logic will break if the cache
-        # holds the same objects as the descriptors!
+        # NOTE: the update if changed logic relies on the structure returned here not sharing
+        # objects with any cached copy of it, which the structure_cache ensures
         if not course_locator.is_fully_specified():
             raise InsufficientSpecificationError('Not fully specified: %s' % course_locator)
 
         if course_locator.course_id is not None and course_locator.revision is not None:
             # use the course_id
-            index = self.course_index.find_one({'_id': course_locator.course_id})
+            index = self._get_index_entry(course_locator.course_id)
             if index is None:
                 raise ItemNotFoundError(course_locator)
             if course_locator.revision not in index['versions']:
@@ -215,7 +392,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
 
         # cast string to ObjectId if necessary
         version_guid = course_locator.as_object_id(version_guid)
-        entry = self.structures.find_one({'_id': version_guid})
+        entry = self._get_structure(version_guid)
 
         # b/c more than one course can use same structure, the 'course_id' is not intrinsic to structure
         # and the one assoc'd w/ it by another fetch may not be the one relevant to this fetch; so,
@@ -249,7 +426,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
             version_guids.append(version_guid)
             id_version_map[version_guid] = course_entry['_id']
 
-        course_entries = self.structures.find({'_id': {'$in': version_guids}})
+        course_entries = self._get_structures(version_guids)
 
         # get the block for the course element (s/b the root)
         result = []
@@ -335,9 +512,13 @@ class SplitMongoModuleStore(ModuleStoreBase):
         '''
         # TODO extend to only search a subdag of the course?
         course = self._lookup_course(locator)
+        # narrow the search down by any qualifiers that the structure's index answers
+        candidates = self._get_structure_index(course).candidates(qualifiers)
+        if candidates is None:
+            candidates = course['blocks'].iterkeys()
         items = []
-        for usage_id, value in course['blocks'].iteritems():
-            if self._block_matches(value, qualifiers):
+        for usage_id in candidates:
+            if self._block_matches(course['blocks'][usage_id], qualifiers):
                 items.append(usage_id)
 
         if len(items) > 0:
@@ -349,20 +530,16 @@ class SplitMongoModuleStore(ModuleStoreBase):
     def get_parent_locations(self, locator, usage_id=None):
         '''
         Return the locations (Locators w/ usage_ids) for the parents of this location in this
-        course. Could use get_items(location, {'children': usage_id}) but this is slightly faster.
+        course. Could use get_items(location, {'children': usage_id}) but this skips loading the parents.
         NOTE: does not actually ensure usage_id exists
         If usage_id is None, then the locator must specify the usage_id
         '''
         if usage_id is None:
             usage_id = locator.usage_id
         course = self._lookup_course(locator)
-        items = []
-        for parent_id, value in course['blocks'].iteritems():
-            for child_id in value['children']:
-                if usage_id == child_id:
-                    locator = locator.as_course_locator()
-                    items.append(BlockUsageLocator(url=locator, usage_id=parent_id))
-        return items
+        locator = locator.as_course_locator()
+        return [BlockUsageLocator(url=locator, usage_id=parent_id)
+                for parent_id in self._get_structure_index(course).parents.get(usage_id, [])]
 
     def get_course_index_info(self, course_locator):
         """
@@ -465,19 +642,21 @@ class SplitMongoModuleStore(ModuleStoreBase):
         block_locator = block_locator.version_agnostic()
         course_struct = self._lookup_course(block_locator)
         usage_id = block_locator.usage_id
-        update_version_field = 'blocks.{}.update_version'.format(usage_id)
+        # versions stored as change sets only have the block if it changed
         all_versions_with_block = self.structures.find({'original_version': course_struct['original_version'],
-            update_version_field: {'$exists': True}})
+            '$or': [{'blocks.{}.update_version'.format(usage_id): {'$exists': True}},
+                    {'delta.updated.{}.update_version'.format(usage_id): {'$exists': True}}]})
         # find (all) root versions and build map previous: [successors]
         possible_roots = []
         result = {}
         for version in all_versions_with_block:
-            if version['_id'] == version['blocks'][usage_id]['update_version']:
-                if version['blocks'][usage_id].get('previous_version') is None:
-                    possible_roots.append(version['blocks'][usage_id]['update_version'])
+            block = version['blocks'][usage_id] if 'blocks' in version else version['delta']['updated'][usage_id]
+            if version['_id'] == block['update_version']:
+                if block.get('previous_version') is None:
+                    possible_roots.append(block['update_version'])
                 else:
-                    result.setdefault(version['blocks'][usage_id]['previous_version'], set()).add(
-                        version['blocks'][usage_id]['update_version'])
+                    result.setdefault(block['previous_version'], set()).add(
+                        block['update_version'])
         # more than one possible_root means usage was added and deleted > 1x.
         if len(possible_roots) > 1:
             # find the history segment including block_locator's version
@@ -643,14 +822,14 @@ class SplitMongoModuleStore(ModuleStoreBase):
         new_structure = self._version_structure(structure, user_id)
         # generate an id
         new_usage_id = self._generate_usage_id(new_structure['blocks'], category)
-        update_version_keys = ['blocks.{}.update_version'.format(new_usage_id)]
+        updated_usage_ids = [new_usage_id]
         if isinstance(course_or_parent_locator, BlockUsageLocator) and course_or_parent_locator.usage_id is not None:
             parent = new_structure['blocks'][course_or_parent_locator.usage_id]
             parent['children'].append(new_usage_id)
             parent['edited_on'] = datetime.datetime.utcnow()
             parent['edited_by'] = user_id
             parent['previous_version'] = parent['update_version']
-            update_version_keys.append('blocks.{}.update_version'.format(course_or_parent_locator.usage_id))
+            updated_usage_ids.append(course_or_parent_locator.usage_id)
         new_structure['blocks'][new_usage_id] = {
             "children": [],
             "category": category,
@@ -660,10 +839,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
             'edited_by': user_id,
             'previous_version': None
             }
-        new_id = self.structures.insert(new_structure)
-        update_version_payload = {key: new_id for key in update_version_keys}
-        self.structures.update({'_id': new_id},
-            {'$set': update_version_payload})
+        new_id = self._insert_structure(structure, new_structure, updated_usage_ids)
 
         # update the index entry if appropriate
         if index_entry is not None:
@@ -738,11 +914,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
                         'edited_on': datetime.datetime.utcnow(),
                         'edited_by': user_id,
                         'previous_version': None}}}
-            new_id = self.structures.insert(draft_structure)
-            draft_structure['original_version'] = new_id
-            self.structures.update({'_id': new_id},
-                {'$set': {"original_version": new_id,
-                    'blocks.course.update_version': new_id}})
+            new_id = self._insert_structure(None, draft_structure, ['course'])
             if versions_dict is None:
                 versions_dict = {master_version: new_id}
             else:
@@ -751,9 +923,10 @@ class SplitMongoModuleStore(ModuleStoreBase):
         else:
             # just get the draft_version structure
             draft_version = CourseLocator(version_guid=versions_dict[master_version])
-            draft_structure = self._lookup_course(draft_version)
+            original_structure = self._lookup_course(draft_version)
+            draft_structure = original_structure
             if course_data is not None or metadata:
-                draft_structure = self._version_structure(draft_structure, user_id)
+                draft_structure = self._version_structure(original_structure, user_id)
                 root_block = draft_structure['blocks'][draft_structure['root']]
                 if metadata is not None:
                     root_block['metadata'].update(metadata)
@@ -768,11 +941,8 @@ class SplitMongoModuleStore(ModuleStoreBase):
                     root_block['edited_on'] = datetime.datetime.utcnow()
                     root_block['edited_by'] = user_id
                     root_block['previous_version'] = root_block.get('update_version')
-                # insert updates the '_id' in draft_structure
-                new_id = self.structures.insert(draft_structure)
+                new_id = self._insert_structure(original_structure, draft_structure, [draft_structure['root']])
                 versions_dict[master_version] = new_id
-                self.structures.update({'_id': new_id},
-                    {'$set': {'blocks.{}.update_version'.format(draft_structure['root']): new_id}})
         # create the index entry
         if id_root is None:
             id_root = org
@@ -786,6 +956,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
             'edited_on': datetime.datetime.utcnow(),
             'versions': versions_dict}
         new_id = self.course_index.insert(index_entry)
+        self._invalidate_index_entry(new_id)
         return self.get_course(CourseLocator(course_id=new_id, revision=master_version))
 
     def update_item(self, descriptor, user_id, force=False):
@@ -829,9 +1000,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
             block_data['edited_on'] = datetime.datetime.utcnow()
             block_data['edited_by'] = user_id
             block_data['previous_version'] = block_data['update_version']
-            new_id = self.structures.insert(new_structure)
-            self.structures.update({'_id': new_id},
-                {'$set': {'blocks.{}.update_version'.format(descriptor.location.usage_id): new_id}})
+            new_id = self._insert_structure(original_structure, new_structure, [descriptor.location.usage_id])
 
             # update the index entry if appropriate
             if index_entry is not None:
@@ -868,11 +1037,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
         changed_blocks = self._persist_subdag(xblock, user_id, new_structure['blocks'])
 
         if changed_blocks:
-            new_id = self.structures.insert(new_structure)
-            update_command = {}
-            for usage_id in changed_blocks:
-                update_command['blocks.{}.update_version'.format(usage_id)] = new_id
-            self.structures.update({'_id': new_id}, {'$set': update_command})
+            new_id = self._insert_structure(structure, new_structure, changed_blocks)
 
             # update the index entry if appropriate
             if index_entry is not None:
@@ -979,6 +1144,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
             raise ValueError("Cannot override versions without setting update_versions")
         self.course_index.update({'_id': course_locator.course_id},
             {'$set': new_values_dict})
+        self._invalidate_index_entry(course_locator.course_id)
 
     def delete_item(self, usage_locator, user_id, force=False):
         """
@@ -1003,14 +1169,14 @@ class SplitMongoModuleStore(ModuleStoreBase):
         new_structure = self._version_structure(original_structure, user_id)
         new_blocks = new_structure['blocks']
         parents = self.get_parent_locations(usage_locator)
-        update_version_keys = []
+        updated_usage_ids = []
         for parent in parents:
             parent_block = new_blocks[parent.usage_id]
             parent_block['children'].remove(usage_locator.usage_id)
             parent_block['edited_on'] = datetime.datetime.utcnow()
             parent_block['edited_by'] = user_id
             parent_block['previous_version'] = parent_block['update_version']
-            update_version_keys.append('blocks.{}.update_version'.format(parent.usage_id))
+            updated_usage_ids.append(parent.usage_id)
         # remove subtree
         def remove_subtree(usage_id):
             for child in new_blocks[usage_id]['children']:
@@ -1019,10 +1185,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
         remove_subtree(usage_locator.usage_id)
 
         # update index if appropriate and structures
-        new_id = self.structures.insert(new_structure)
-        if update_version_keys:
-            update_version_payload = {key: new_id for key in update_version_keys}
-            self.structures.update({'_id': new_id}, {'$set': update_version_payload})
+        new_id = self._insert_structure(original_structure, new_structure, updated_usage_ids)
 
         result = CourseLocator(version_guid=new_id)
 
@@ -1049,6 +1212,7 @@ class SplitMongoModuleStore(ModuleStoreBase):
             raise ItemNotFoundError(course_id)
         # this is the only real delete in the system. should it do something else?
         self.course_index.remove(index['_id'])
+        self._invalidate_index_entry(index['_id'])
 
     # TODO remove all callers and then this
     def get_errored_courses(self):
@@ -1238,3 +1402,13 @@ class SplitMongoModuleStore(ModuleStoreBase):
         self.course_index.update(
             {"_id": index_entry["_id"]},
             {"$set": {"versions.{}".format(revision): new_id}})
+        self._invalidate_index_entry(index_entry["_id"])
+
+
+def _apply_delta(blocks, delta):
+    """
+    Applies the change set delta, from a structure stored as one, to blocks
+    """
+    for usage_id in delta['deleted']:
+        blocks.pop(usage_id, None)
+    blocks.update(delta['updated'])
@@ -0,0 +1,248 @@
+"""
+Per-process caches for the SplitMongoModuleStore.
+
+Course structures are never changed once they've been written under a version_guid
+(a change to a course writes a new structure), so they can be cached for as long as
+there's room for them. The course index, which maps a course_id and revision to the
+guid of its head structure, does change, so its entries are only cached briefly.
+
+Since structures don't change, neither does a StructureIndex of one, which is kept
+along with the structure in the StructureCache.
+"""
+
+import copy
+import threading
+import time
+
+from collections import OrderedDict
+
+# The estimated number of bytes that a structure's block takes up in memory, used to
+# size cached structures without walking them
+BLOCK_SIZE_ESTIMATE = 2048
+
+
+class StructureCache(object):
+    """
+    A least-recently-used cache of course structures keyed by version_guid, bounded
+    by the (estimated) number of bytes that the cached structures hold.
+
+    The cache keeps its own copy of each structure, and get returns a copy of the
+    cached one, since the modulestore annotates and edits the structures it loads.
+    """
+    def __init__(self, max_size):
+        """
+        max_size: the number of bytes the cached structures may hold in total
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version_guid):
+        """
+        Returns a copy of the structure cached for version_guid, or None if there isn't one
+        """
+        with self._lock:
+            entry = self._entries.pop(version_guid, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # put the entry back at the most recently used end
+            self._entries[version_guid] = entry
+            self.hits += 1
+        return copy_structure(entry[0])
+
+    def get_index(self, structure):
+        """
+        Returns the StructureIndex of structure, building it if it isn't kept with the
+        cached copy of structure yet. It's only kept if structure is cached.
+        """
+        with self._lock:
+            entry = self._entries.get(structure['_id'])
+            if entry is not None and entry[2] is not None:
+                return entry[2]
+        # the cached copy is sure not to have been changed
+        index = StructureIndex((entry[0] if entry is not None else structure)['blocks'])
+        with self._lock:
+            entry = self._entries.get(structure['_id'])
+            if entry is not None:
+                self._entries[structure['_id']] = (entry[0], entry[1], index)
+        return index
+
+    def set(self, structure):
+        """
+        Caches a copy of structure under its _id, and evicts the least recently used
+        structures until the cache is within its budget. Structures that are larger
+        than the whole budget aren't cached.
+        """
+        size = structure_size(structure)
+        if size > self.max_size:
+            return
+        structure = copy_structure(structure)
+        with self._lock:
+            self._remove(structure['_id'])
+            self._entries[structure['_id']] = (structure, size, None)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """
+        Removes all the cached structures, and resets the hit and miss counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _remove(self, version_guid):
+        """
+        Removes the entry for version_guid, if there is one. Must be called with the lock held.
+        """
+        entry = self._entries.pop(version_guid, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class StructureIndex(object):
+    """
+    Maps from the values of the block fields that are most often queried on to the
+    usage_ids of the blocks in a structure that have them.
+    """
+    # the fields whose values are indexed, other than children
+    INDEXED_FIELDS = ('category', 'definition')
+
+    def __init__(self, blocks):
+        """
+        blocks: the blocks of the structure, by usage_id
+        """
+        # child usage_id -> the usage_ids of its parents (once per time it's listed)
+        self.parents = {}
+        # field -> value -> the usage_ids of the blocks with that value
+        self.values = dict((field, {}) for field in self.INDEXED_FIELDS)
+        for usage_id, block in blocks.iteritems():
+            for child in block.get('children', []):
+                self.parents.setdefault(child, []).append(usage_id)
+            for field in self.INDEXED_FIELDS:
+                if field in block:
+                    self.values[field].setdefault(block[field], []).append(usage_id)
+
+    def candidates(self, qualifiers):
+        """
+        Returns the usage_ids of the blocks that can match qualifiers (as passed to
+        get_items) judging by their indexed fields, or None if none of the qualifiers
+        can be answered from the index.
+        """
+        result = None
+        for field, criteria in qualifiers.iteritems():
+            if criteria is None or isinstance(criteria, (dict, list)):
+                continue
+            if field == 'children':
+                usage_ids = self.parents.get(criteria, [])
+            elif field in self.values:
+                usage_ids = self.values[field].get(criteria, [])
+            else:
+                continue
+            if result is None:
+                result = list(OrderedDict.fromkeys(usage_ids))
+            else:
+                usage_ids = set(usage_ids)
+                result = [usage_id for usage_id in result if usage_id in usage_ids]
+        return result
+
+
+class CourseIndexCache(object):
+    """
+    A cache of course index entries keyed by course_id, each of which expires ttl
+    seconds after it was fetched. The modulestore invalidates the entries for the
+    courses it changes, so the ttl only bounds how long a change made by another
+    process can go unnoticed.
+    """
+    def __init__(self, ttl):
+        """
+        ttl: the number of seconds that an index entry is used for
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, course_id):
+        """
+        Returns the index entry cached for course_id, or None if there isn't a current one
+        """
+        with self._lock:
+            entry = self._entries.get(course_id)
+            if entry is None or entry[0] <= time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, course_id, index_entry):
+        """
+        Caches index_entry for course_id, and drops any entries that have expired
+        """
+        now = time.time()
+        with self._lock:
+            for key in [key for key, entry in self._entries.iteritems() if entry[0] <= now]:
+                del self._entries[key]
+            self._entries[course_id] = (now + self.ttl, index_entry)
+
+    def invalidate(self, course_id):
+        """
+        Removes the entry for course_id, if there is one
+        """
+        with self._lock:
+            self._entries.pop(course_id, None)
+
+    def clear(self):
+        """
+        Removes all the cached index entries, and resets the hit and miss counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def structure_size(structure):
+    """
+    Returns the estimated number of bytes that structure takes up in memory
+    """
+    return len(structure['blocks']) * BLOCK_SIZE_ESTIMATE
+
+
+def copy_structure(structure):
+    """
+    Returns a copy of structure that shares nothing with it that the modulestore
+    changes: the structure's fields, its blocks, and the children and metadata of
+    each block are copied.
+    """
+    structure = structure.copy()
+    structure['blocks'] = dict(
+        (usage_id, _copy_block(block)) for usage_id, block in structure['blocks'].iteritems()
+    )
+    return structure
+
+
+def _copy_block(block):
+    """
+    Returns a copy of a structure's block
+    """
+    block = block.copy()
+    if 'children' in block:
+        block['children'] = list(block['children'])
+    if 'metadata' in block:
+        block['metadata'] = copy.deepcopy(block['metadata'])
+    return block
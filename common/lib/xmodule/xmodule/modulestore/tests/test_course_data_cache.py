@@ -0,0 +1,53 @@
+"""
+Tests for the CourseDataCache
+"""
+import unittest
+
+from xmodule.modulestore.mongo.course_data_cache import CourseDataCache
+
+
+class TestCourseDataCache(unittest.TestCase):
+    """
+    Tests of the lookup, versioning and eviction of cached courses
+    """
+    def setUp(self):
+        self.cache = CourseDataCache(max_size=100)
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get('course', 'v1'))
+        self.cache.set('course', 'v1', 'module data', 10)
+        self.assertEqual(self.cache.get('course', 'v1'), 'module data')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_new_version(self):
+        self.cache.set('course', 'v1', 'old module data', 10)
+        self.assertIsNone(self.cache.get('course', 'v2'))
+        self.cache.set('course', 'v2', 'new module data', 20)
+        self.assertEqual(self.cache.get('course', 'v2'), 'new module data')
+        self.assertIsNone(self.cache.get('course', 'v1'))
+        # the old version's size is no longer counted
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.size, 20)
+
+    def test_eviction(self):
+        self.cache.set('course1', 'v1', 'module data 1', 40)
+        self.cache.set('course2', 'v1', 'module data 2', 40)
+        # using course1 makes course2 the least recently used
+        self.cache.get('course1', 'v1')
+        self.cache.set('course3', 'v1', 'module data 3', 40)
+        self.assertIsNone(self.cache.get('course2', 'v1'))
+        self.assertEqual(self.cache.get('course1', 'v1'), 'module data 1')
+        self.assertEqual(self.cache.get('course3', 'v1'), 'module data 3')
+        self.assertEqual(self.cache.size, 80)
+
+    def test_too_large(self):
+        self.cache.set('course', 'v1', 'module data', 101)
+        self.assertIsNone(self.cache.get('course', 'v1'))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_clear(self):
+        self.cache.set('course', 'v1', 'module data', 10)
+        self.cache.get('course', 'v1')
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual((self.cache.size, self.cache.hits, self.cache.misses), (0, 0, 0))
@@ -2,12 +2,14 @@ import pymongo
 
 from nose.tools import assert_equals, assert_raises, assert_not_equals, assert_false
 from pprint import pprint
+from mock import Mock, patch
 
 from xblock.core import Scope
 from xblock.runtime import KeyValueStore, InvalidScopeError
 
 from xmodule.modulestore import Location
 from xmodule.modulestore.mongo import MongoModuleStore, MongoKeyValueStore
+from xmodule.modulestore.mongo.base import DefinitionDataLazyLoader
 from xmodule.modulestore.xml_importer import import_from_xml
 
 from .test_modulestore import check_path_to_location
@@ -105,6 +107,118 @@ class TestMongoModuleStore(object):
             self.store._find_one(Location("i4x://edX/toy/video/Welcome")),
             None)
 
+    def test_get_item_full_depth(self):
+        # loading the whole course at once should give the same tree as loading it item by item
+        def check_subtree(prefetched):
+            fetched = self.store.get_item(prefetched.location)
+            assert_equals(prefetched.children, fetched.children)
+            assert_equals(prefetched.display_name, fetched.display_name)
+            for child in prefetched.get_children():
+                check_subtree(child)
+
+        check_subtree(self.store.get_item("i4x://edX/toy/course/2012_Fall", depth=None))
+
+        # only loading a course fetches the whole course; anything else is fetched a level at a time
+        chapter_location = self.store.get_item("i4x://edX/toy/course/2012_Fall").children[0]
+        with patch.object(self.store, '_query_course_for_cache_children') as mock_query:
+            check_subtree(self.store.get_item(chapter_location, depth=None))
+            assert not mock_query.called
+
+    def test_lazy_definition_data(self):
+        store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS, lazy_definition_data=True)
+        course = store.get_item("i4x://edX/toy/course/2012_Fall", depth=None)
+        html = course.get_children()[0].get_children()[0].get_children()[0]
+        assert_equals(html.location.category, 'html')
+        assert_equals(html.data, self.store.get_item(html.location).data)
+
+    def test_course_data_cache(self):
+        store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS, course_data_cache_size=10 ** 7)
+        location = Location("i4x://edX/toy/course/2012_Fall")
+        course = store.get_item(location, depth=None)
+        other_course = store.get_item(location, depth=None)
+        assert_equals((store.course_data_cache.hits, store.course_data_cache.misses), (1, 1))
+
+        # each call gets descriptors of its own, which don't share the state they change
+        assert other_course is not course
+        chapter = course.get_children()[0]
+        other_chapter = other_course.get_children()[0]
+        assert chapter is not other_chapter
+        chapter.display_name = 'Changed'
+        chapter.children.append('i4x://edX/toy/html/new')
+        assert_not_equals(other_chapter.display_name, 'Changed')
+        assert_false('i4x://edX/toy/html/new' in other_chapter.children)
+        assert_not_equals(store.get_item(location, depth=None).get_children()[0].display_name, 'Changed')
+
+        # a write to the course makes the cached course stale
+        store.update_metadata(location, course.xblock_kvs._metadata)
+        assert store.get_item(location, depth=None) is not course
+
+    def test_get_parent_locations(self):
+        location = Location("i4x://edX/toy/video/Welcome")
+        parents = self.store.get_parent_locations(location, 'edX/toy/2012_Fall')
+        assert_equals([Location(parent).url() for parent in parents], ["i4x://edX/toy/chapter/Overview"])
+
+        # the parents of other items in the course are found without going to the db again
+        with patch.object(self.store.collection, 'find') as mock_find:
+            parents = self.store.get_parent_locations(Location("i4x://edX/toy/chapter/Overview"), 'edX/toy/2012_Fall')
+            assert_equals([Location(parent).url() for parent in parents], ["i4x://edX/toy/course/2012_Fall"])
+            assert_false(mock_find.called)
+
+    def test_parent_maps_bounded(self):
+        with patch('xmodule.modulestore.mongo.base.PARENT_MAP_CACHE_SIZE', 1):
+            store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS)
+        store.get_parent_locations(Location("i4x://edX/toy/video/Welcome"), 'edX/toy/2012_Fall')
+        store.get_parent_locations(Location("i4x://edX/simple/course/2012_Fall"), 'edX/simple/2012_Fall')
+        # only the parent map of the most recently used course is kept
+        assert_equals(len(store._parent_maps), 1)
+        assert store._parent_maps.get('edX/simple') is not None
+
+    def test_bulk_update_items(self):
+        locations = [Location('i4x', 'edX', 'bulk', 'html', 'html{0}'.format(i)) for i in xrange(3)]
+        self.store.bulk_update_items(
+            (location, '<p>{0}</p>'.format(location.name), [], {'display_name': location.name})
+            for location in locations
+        )
+        # writing an item again sets its data and metadata
+        self.store.bulk_update_items([(locations[0], '<p>new</p>', [], {})])
+
+        assert_equals(self.connection[DB][COLLECTION].find({'_id.course': 'bulk'}).count(), 3)
+        assert_equals(self.store.get_item(locations[0]).data, '<p>new</p>')
+        assert_equals(self.store.get_item(locations[1]).display_name, 'html1')
+
+    def test_bulk_update_items_keeps_other_fields(self):
+        location = Location('i4x', 'edX', 'bulk_fields', 'html', 'existing')
+        self.store.bulk_update_items([(location, '<p>old</p>', [], {'display_name': 'Old'})])
+        self.connection[DB][COLLECTION].update({'_id': location.dict()}, {'$set': {'extra': 'kept'}})
+
+        # as with update_item and update_metadata, only the item's data and metadata are set
+        self.store.bulk_update_items([(location, '<p>new</p>', [], {'display_name': 'New'})])
+        document = self.connection[DB][COLLECTION].find_one({'_id': location.dict()})
+        assert_equals(document['extra'], 'kept')
+        assert_equals(document['definition']['data'], '<p>new</p>')
+        assert_equals(document['metadata'], {'display_name': 'New'})
+
+    def test_bulk_update_items_one_write_per_batch(self):
+        locations = [Location('i4x', 'edX', 'bulk_batched', 'html', 'html{0}'.format(i)) for i in xrange(3)]
+        self.store.bulk_update_items([(locations[0], '<p>old</p>', [], {})])
+        with patch.object(self.store, '_supports_write_commands', return_value=True):
+            with patch.object(self.store.collection.database, 'command', return_value={'ok': 1}) as mock_command:
+                with patch.object(self.store.collection, 'find') as mock_find:
+                    self.store.bulk_update_items((location, '<p>new</p>', [], {}) for location in locations)
+        assert_equals(mock_command.call_count, 1)
+        assert not mock_find.called
+        assert_equals(len(mock_command.call_args[0][0]['updates']), 3)
+
+    def test_bulk_update_items_write_errors(self):
+        location = Location('i4x', 'edX', 'bulk_failed', 'html', 'failed')
+        write_errors = {'ok': 1, 'n': 0, 'writeErrors': [{'index': 0, 'code': 2, 'errmsg': 'failed'}]}
+        with patch.object(self.store, '_supports_write_commands', return_value=True):
+            with patch.object(self.store.collection.database, 'command', return_value=write_errors):
+                with assert_raises(pymongo.errors.OperationFailure):
+                    self.store.bulk_update_items([(location, '<p>new</p>', [], {})])
+
     def test_path_to_location(self):
         '''Make sure that path_to_location works'''
         check_path_to_location(self.store)
@@ -144,6 +258,15 @@ class TestMongoKeyValueStore(object):
                 self.kvs.get(key)
             assert_false(self.kvs.has(key))
 
+    def test_read_lazy_data(self):
+        loader = Mock()
+        loader.fetch.return_value = {'foo': 'fetched_value'}
+        self.kvs._data = DefinitionDataLazyLoader(None, self.location)
+        with patch.object(DefinitionDataLazyLoader, 'fetch', loader.fetch):
+            assert_equals('fetched_value', self.kvs.get(KeyValueStore.Key(Scope.content, None, None, 'foo')))
+            assert_equals('fetched_value', self.kvs.get(KeyValueStore.Key(Scope.content, None, None, 'foo')))
+        loader.fetch.assert_called_once_with()
+
     def test_read_non_dict_data(self):
         self.kvs._data = 'xml_data'
         assert_equals('xml_data', self.kvs.get(KeyValueStore.Key(Scope.content, None, None, 'data')))
@@ -8,6 +8,7 @@ import subprocess
 import unittest
 import uuid
 from importlib import import_module
+from mock import patch
 
 from xblock.core import Scope
 from xmodule.course_module import CourseDescriptor
@@ -31,6 +32,9 @@ class SplitModuleTest(unittest.TestCase):
         'db': 'test_xmodule',
         'collection': 'modulestore{0}'.format(uuid.uuid4().hex),
         'fs_root': '',
+        'structure_cache_size': 10 ** 7,
+        'index_cache_ttl': 60,
+        'structure_snapshot_interval': 3,
     }
 
     MODULESTORE = {
@@ -459,6 +463,23 @@ class SplitModuleItemTests(SplitModuleTest):
             expected_ids.remove(child.location.usage_id)
         self.assertEqual(len(expected_ids), 0)
 
+    def test_definitions_fetched_together(self):
+        """
+        The definitions of the blocks fetched to a depth are fetched in one query
+        """
+        # pylint: disable=W0212
+        modulestore()._clear_cache()
+        locator = BlockUsageLocator(course_id="GreekHero", usage_id="head12345", revision='draft')
+        definitions = modulestore().definitions
+        with patch.object(definitions, 'find', wraps=definitions.find) as find:
+            with patch.object(definitions, 'find_one') as find_one:
+                block = modulestore().get_item(locator, depth=1)
+                block.xblock_kvs.get_data()
+                for child in block.get_children():
+                    child.xblock_kvs.get_data()
+        self.assertEqual(find.call_count, 1)
+        self.assertFalse(find_one.called)
+
 
 class TestItemCrud(SplitModuleTest):
     """
@@ -942,6 +963,83 @@ class TestCourseCreation(SplitModuleTest):
         self.assertEqual(str(course.location.version_guid), self.GUID_D1)
 
 
+class TestCaching(SplitModuleTest):
+    """
+    Test the structure and index caches
+    """
+    def test_reads_use_caches(self):
+        locator = BlockUsageLocator(course_id="GreekHero", usage_id="chapter1", revision='draft')
+        modulestore().get_item(locator)
+        structure_hits = modulestore().structure_cache.hits
+        index_hits = modulestore().index_cache.hits
+        # once it's cached, the course resolves without any queries
+        with patch.object(modulestore().structures, 'find_one') as find_structure:
+            with patch.object(modulestore().course_index, 'find_one') as find_index:
+                self.assertTrue(modulestore().has_item(locator))
+                modulestore().get_item(locator)
+        self.assertFalse(find_structure.called)
+        self.assertFalse(find_index.called)
+        self.assertEqual(modulestore().structure_cache.hits, structure_hits + 2)
+        self.assertEqual(modulestore().index_cache.hits, index_hits + 2)
+
+    def test_writes_invalidate_index(self):
+        locator = BlockUsageLocator(course_id="GreekHero", usage_id="chapter1", revision='draft')
+        course = modulestore().get_course(locator.as_course_locator())
+        new_item = modulestore().create_item(locator, 'problem', 'test_caching',
+                                             metadata={'display_name': 'new problem'},
+                                             new_def_data="<problem></problem>")
+        # the course's new head is seen at once, and the old version is unchanged
+        self.assertEqual(modulestore().get_item(locator).location.version_guid, new_item.location.version_guid)
+        self.assertIn(new_item.location.usage_id, modulestore().get_item(locator).children)
+        old_chapter = modulestore().get_item(
+            BlockUsageLocator(version_guid=course.location.version_guid, usage_id="chapter1"))
+        self.assertNotIn(new_item.location.usage_id, old_chapter.children)
+
+
+class TestDeltaVersions(SplitModuleTest):
+    """
+    Test storing structure versions as change sets
+    """
+    def test_delta_versions(self):
+        locator = BlockUsageLocator(course_id="GreekHero", usage_id="chapter1", revision='draft')
+        new_items = []
+        for index in range(modulestore().structure_snapshot_interval + 1):
+            new_items.append(modulestore().create_item(
+                locator, 'problem', 'test_delta_versions',
+                metadata={'display_name': 'problem {}'.format(index)},
+                new_def_data="<problem></problem>"
+            ))
+
+        chain_lengths = []
+        for new_item in new_items:
+            stored = modulestore().structures.find_one({'_id': new_item.location.version_guid})
+            if 'delta' in stored:
+                # only the new block and its parent are stored
+                self.assertNotIn('blocks', stored)
+                self.assertEqual(set(stored['delta']['updated']), set([new_item.location.usage_id, 'chapter1']))
+                self.assertEqual(stored['delta']['deleted'], [])
+                chain_lengths.append(len(stored['delta_chain']))
+            else:
+                chain_lengths.append(0)
+        # every interval'th version is stored in full
+        self.assertIn(0, chain_lengths)
+        self.assertTrue(all(length < modulestore().structure_snapshot_interval for length in chain_lengths))
+
+        # each version reads back with the blocks it had, with or without the structure cache
+        for cached in (True, False):
+            # pylint: disable=W0212
+            modulestore()._clear_cache()
+            for index, new_item in enumerate(new_items):
+                if not cached:
+                    modulestore().structure_cache.clear()
+                    modulestore()._clear_cache()
+                chapter = modulestore().get_item(
+                    BlockUsageLocator(version_guid=new_item.location.version_guid, usage_id="chapter1"))
+                created = [item.location.usage_id for item in new_items[:index + 1]]
+                self.assertEqual(chapter.children[-len(created):], created)
+                self.assertEqual(chapter.update_version, new_item.location.version_guid)
+
+
 class TestInheritance(SplitModuleTest):
     """
     Test the metadata inheritance mechanism.
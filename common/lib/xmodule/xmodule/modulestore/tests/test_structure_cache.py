@@ -0,0 +1,146 @@
+"""
+Tests for the split mongo StructureCache, StructureIndex and CourseIndexCache
+"""
+import unittest
+
+from mock import patch
+
+from xmodule.modulestore.split_mongo.structure_cache import (
+    StructureCache, StructureIndex, CourseIndexCache, structure_size
+)
+
+
+def make_structure(version_guid, display_name='Course'):
+    """
+    Returns a minimal structure with the given _id
+    """
+    return {
+        '_id': version_guid,
+        'root': 'course',
+        'blocks': {
+            'course': {
+                'category': 'course',
+                'children': ['chapter1'],
+                'metadata': {'display_name': display_name, 'tabs': [{'type': 'courseware'}]},
+            },
+            'chapter1': {'category': 'chapter', 'children': [], 'metadata': {}},
+        },
+    }
+
+
+class TestStructureCache(unittest.TestCase):
+    """
+    Tests of the lookup, isolation and eviction of cached structures
+    """
+    def setUp(self):
+        self.size = structure_size(make_structure('v1'))
+        self.cache = StructureCache(max_size=self.size * 2)
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get('v1'))
+        self.cache.set(make_structure('v1'))
+        self.assertEqual(self.cache.get('v1'), make_structure('v1'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.size, self.size)
+
+    def test_isolation(self):
+        structure = make_structure('v1')
+        self.cache.set(structure)
+        # neither changes to the structure that was cached...
+        structure['blocks']['course']['children'].append('chapter2')
+        # ...nor to the ones handed out...
+        cached = self.cache.get('v1')
+        cached['course_id'] = 'GreekHero'
+        cached['blocks']['course']['metadata']['tabs'][0]['type'] = 'progress'
+        cached['blocks']['chapter1']['_inherited_metadata'] = {}
+        # ...change what's in the cache
+        self.assertEqual(self.cache.get('v1'), make_structure('v1'))
+
+    def test_eviction(self):
+        self.cache.set(make_structure('v1'))
+        self.cache.set(make_structure('v2'))
+        # using v1 makes v2 the least recently used
+        self.cache.get('v1')
+        self.cache.set(make_structure('v3'))
+        self.assertIsNone(self.cache.get('v2'))
+        self.assertIsNotNone(self.cache.get('v1'))
+        self.assertIsNotNone(self.cache.get('v3'))
+        self.assertEqual(self.cache.size, self.size * 2)
+
+    def test_index_kept(self):
+        structure = make_structure('v1')
+        self.cache.set(structure)
+        index = self.cache.get_index(structure)
+        self.assertIs(self.cache.get_index(self.cache.get('v1')), index)
+        # an uncached structure's index is built each time
+        self.assertIsNot(self.cache.get_index(make_structure('v2')), self.cache.get_index(make_structure('v2')))
+
+    def test_too_large(self):
+        structure = make_structure('v1')
+        for index in xrange(len(structure['blocks']) * 2):
+            structure['blocks']['html{0}'.format(index)] = {'category': 'html', 'metadata': {}}
+        self.cache.set(structure)
+        self.assertIsNone(self.cache.get('v1'))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_clear(self):
+        self.cache.set(make_structure('v1'))
+        self.cache.get('v1')
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual((self.cache.size, self.cache.hits, self.cache.misses), (0, 0, 0))
+
+
+class TestStructureIndex(unittest.TestCase):
+    """
+    Tests of the lookups that a StructureIndex answers
+    """
+    def setUp(self):
+        structure = make_structure('v1')
+        structure['blocks']['chapter2'] = {'category': 'chapter', 'children': ['problem1'], 'definition': 'd1'}
+        structure['blocks']['problem1'] = {'category': 'problem', 'children': [], 'definition': 'd1'}
+        structure['blocks']['course']['children'].append('chapter2')
+        self.index = StructureIndex(structure['blocks'])
+
+    def test_parents(self):
+        self.assertEqual(self.index.parents['chapter2'], ['course'])
+        self.assertEqual(self.index.parents['problem1'], ['chapter2'])
+        self.assertNotIn('course', self.index.parents)
+
+    def test_candidates(self):
+        self.assertEqual(sorted(self.index.candidates({'category': 'chapter'})), ['chapter1', 'chapter2'])
+        self.assertEqual(self.index.candidates({'category': 'chapter', 'definition': 'd1'}), ['chapter2'])
+        self.assertEqual(self.index.candidates({'children': 'chapter1'}), ['course'])
+        self.assertEqual(self.index.candidates({'category': 'html'}), [])
+        # qualifiers that aren't indexed don't narrow the search
+        self.assertIsNone(self.index.candidates({'metadata': {'display_name': 'Course'}}))
+        self.assertIsNone(self.index.candidates({'category': {'$regex': 'chap'}}))
+        self.assertEqual(self.index.candidates({'category': 'problem', 'metadata': {}}), ['problem1'])
+
+
+class TestCourseIndexCache(unittest.TestCase):
+    """
+    Tests of the expiry and invalidation of cached index entries
+    """
+    def setUp(self):
+        self.cache = CourseIndexCache(ttl=5)
+
+    @patch('xmodule.modulestore.split_mongo.structure_cache.time.time')
+    def test_expiry(self, mock_time):
+        mock_time.return_value = 100
+        self.cache.set('GreekHero', {'versions': {'draft': 'v1'}})
+        mock_time.return_value = 104
+        self.assertEqual(self.cache.get('GreekHero'), {'versions': {'draft': 'v1'}})
+        mock_time.return_value = 105
+        self.assertIsNone(self.cache.get('GreekHero'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # expired entries are dropped as others are added
+        self.cache.set('wonderful', {'versions': {'draft': 'v2'}})
+        self.assertEqual(len(self.cache), 1)
+
+    def test_invalidate(self):
+        self.cache.set('GreekHero', {'versions': {'draft': 'v1'}})
+        self.cache.invalidate('GreekHero')
+        self.assertIsNone(self.cache.get('GreekHero'))
+        # invalidating a course that isn't cached is fine
+        self.cache.invalidate('wonderful')
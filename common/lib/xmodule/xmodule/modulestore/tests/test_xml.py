@@ -1,9 +1,14 @@
 import os.path
+import shutil
+import tempfile
+
+from mock import patch
 
 from xmodule.course_module import CourseDescriptor
+from xmodule.modulestore import Location
 from xmodule.modulestore.xml import XMLModuleStore
 
-from nose.tools import assert_raises
+from nose.tools import assert_raises, assert_equals
 
 from .test_modulestore import check_path_to_location
 from . import DATA_DIR
@@ -37,3 +42,93 @@ class TestXMLModuleStore(object):
         location = CourseDescriptor.id_to_location("edX/toy/2012_Fall")
         errors = modulestore.get_item_errors(location)
         assert errors == []
+
+    def test_snapshot(self):
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            loaded = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'], snapshot_dir=snapshot_dir)
+
+            # the courses are restored from their snapshots, rather than loaded from xml
+            with patch.object(XMLModuleStore, 'try_load_course') as mock_load:
+                restored = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'], snapshot_dir=snapshot_dir)
+                assert not mock_load.called
+
+            for course_id in loaded.modules:
+                assert_equals(set(loaded.modules[course_id]), set(restored.modules[course_id]))
+                for location, descriptor in loaded.modules[course_id].iteritems():
+                    assert_equals(descriptor._model_data, restored.modules[course_id][location]._model_data)
+            check_path_to_location(restored)
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_parallel_load(self):
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'], course_load_processes=2)
+        assert_equals(len(modulestore.get_courses()), 2)
+        check_path_to_location(modulestore)
+
+    def test_lazy_load(self):
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'], lazy=True, max_loaded_modules=1)
+        # only the summaries of the courses are loaded to start with
+        assert_equals(len(modulestore.get_courses()), 2)
+        toy_location = Location(['i4x', 'edX', 'toy', 'video', 'Welcome', None])
+        assert toy_location not in modulestore.modules['edX/toy/2012_Fall']
+
+        # asking for a module loads its course
+        assert_equals(modulestore.get_instance('edX/toy/2012_Fall', toy_location).location, toy_location)
+        check_path_to_location(modulestore)
+
+        # which is reduced to its summary again once another course is loaded
+        modulestore.get_items(Location(['i4x', 'edX', 'simple', None, None, None]), course_id='edX/simple/2012_Fall')
+        assert toy_location not in modulestore.modules['edX/toy/2012_Fall']
+
+        # queries that don't name a course don't load any
+        loaded_modules = modulestore.modules['edX/toy/2012_Fall']
+        videos = modulestore.get_items(Location(['i4x', None, None, 'video', 'Welcome', None]))
+        assert_equals([video.location.course for video in videos], ['simple'])
+        assert modulestore.modules['edX/toy/2012_Fall'] is loaded_modules
+        assert_equals(len(modulestore.get_items(Location(['i4x', None, None, 'course', None, None]))), 2)
+
+    def test_restore_summary_swaps_modules(self):
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['toy'], lazy=True)
+        toy_location = Location(['i4x', 'edX', 'toy', 'video', 'Welcome', None])
+        modulestore.get_instance('edX/toy/2012_Fall', toy_location)
+        loaded_modules = modulestore.modules['edX/toy/2012_Fall']
+
+        modulestore._restore_summary('toy')
+        # lookups that already hold the loaded course's modules still see all of them
+        assert toy_location in loaded_modules
+        assert toy_location not in modulestore.modules['edX/toy/2012_Fall']
+        assert modulestore.modules['edX/toy/2012_Fall']
+
+    def test_get_items_by_category(self):
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'])
+        videos = modulestore.get_items(Location(['i4x', None, None, 'video', None, None]))
+        assert_equals(
+            sorted(video.location for video in videos),
+            sorted(location for modules in modulestore.modules.values()
+                   for location in modules if location.category == 'video')
+        )
+        toy_videos = modulestore.get_items(Location(['i4x', 'edX', 'toy', 'video', None, None]))
+        assert all(video.location.course == 'toy' for video in toy_videos)
+        assert_equals(len(toy_videos), len([video for video in videos if video.location.course == 'toy']))
+
+        # the index follows the modules as they change
+        toy_modules = modulestore.modules['edX/toy/2012_Fall']
+        del toy_modules[toy_videos[0].location]
+        assert_equals(len(modulestore.get_items(Location(['i4x', 'edX', 'toy', 'video', None, None]))),
+                      len(toy_videos) - 1)
+
+    def test_course_version(self):
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'])
+        toy_location = Location(['i4x', 'edX', 'toy', 'course', '2012_Fall', None])
+        simple_location = Location(['i4x', 'edX', 'simple', 'course', '2012_Fall', None])
+        version = modulestore.get_course_version(toy_location)
+        assert version is not None
+        assert_equals(version, XMLModuleStore(DATA_DIR, course_dirs=['toy']).get_course_version(toy_location))
+        assert version != modulestore.get_course_version(simple_location)
+        assert modulestore.get_course_version(Location(['i4x', 'edX', 'unknown', 'course', 'x', None])) is None
+
+        # loading the course from changed files gives it a new version
+        with patch('xmodule.modulestore.xml.course_dir_fingerprint', return_value='changed'):
+            modulestore.load_courses(['toy'])
+        assert_equals(modulestore.get_course_version(toy_location), 'changed')
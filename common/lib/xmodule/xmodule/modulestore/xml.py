@@ -1,12 +1,15 @@
 import hashlib
 import json
 import logging
+import multiprocessing
 import os
 import re
 import sys
 import glob
+import cPickle as pickle
+import threading
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from cStringIO import StringIO
 from fs.osfs import OSFS
 from importlib import import_module
@@ -32,6 +35,17 @@ etree.set_default_parser(edx_xml_parser)
 
 log = logging.getLogger(__name__)
 
+# Change this whenever the format of course snapshots, or what descriptors
+# keep outside of their model data, changes, so that old snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+# The descriptor attributes, other than the model data, that snapshots keep
+SNAPSHOT_DESCRIPTOR_ATTRS = ('data_dir', '_inherited_metadata', '_inheritable_metadata')
+
+# The categories of modules, other than the course itself, that a lazy XMLModuleStore
+# keeps for courses that aren't loaded, so that listing the courses doesn't load them
+SUMMARY_CATEGORIES = ('about',)
+
 
 # VS[compat]
 # TODO (cpennington): Remove this once all fall 2012 courses have been imported
@@ -253,11 +267,101 @@ class ParentTracker(object):
         return list(self._parents[child])
 
 
+def course_dir_fingerprint(course_path):
+    """
+    Returns a hash of the names, sizes and modification times of all the files
+    under course_path (ignoring any .git directory), which changes whenever the
+    course's content does
+    """
+    hasher = hashlib.md5()
+    for dirpath, dirnames, filenames in os.walk(course_path):
+        if '.git' in dirnames:
+            dirnames.remove('.git')
+        # walk in a fixed order, so that the hash doesn't depend on the OS
+        dirnames.sort()
+        for filename in sorted(filenames):
+            filepath = os.path.join(dirpath, filename)
+            stat = os.stat(filepath)
+            hasher.update('{0}:{1}:{2}\n'.format(os.path.relpath(filepath, course_path), stat.st_mtime, stat.st_size))
+    return hasher.hexdigest()
+
+
+def _load_course_snapshot(args):
+    """
+    Loads a single course, and returns a pickled snapshot of it (see XMLModuleStore.snapshot_course),
+    or None if the course failed to load or couldn't be pickled.
+
+    Run in the worker processes of XMLModuleStore's course loading pool.
+    """
+    data_dir, course_dir, default_class, load_error_modules = args
+    try:
+        store = XMLModuleStore(data_dir, default_class=default_class, course_dirs=[],
+                               load_error_modules=load_error_modules)
+        store.try_load_course(course_dir)
+        snapshot = store.snapshot_course(course_dir)
+        if snapshot is None:
+            return None
+        return pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        # the parent process will load the course itself, and report any errors
+        log.exception("Failed to snapshot course '{0}' in a course loading process".format(course_dir))
+        return None
+
+
+class CourseModules(dict):
+    """
+    A dict(location -> XModuleDescriptor) of the modules in a course, which
+    also keeps an index of the locations by category
+    """
+    def __init__(self, *args, **kwargs):
+        super(CourseModules, self).__init__()
+        self.by_category = defaultdict(set)  # category -> set(locations)
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, location, descriptor):
+        super(CourseModules, self).__setitem__(location, descriptor)
+        self.by_category[location.category].add(location)
+
+    def __delitem__(self, location):
+        super(CourseModules, self).__delitem__(location)
+        self.by_category[location.category].discard(location)
+
+    def update(self, *args, **kwargs):
+        for location, descriptor in dict(*args, **kwargs).iteritems():
+            self[location] = descriptor
+
+    def setdefault(self, location, descriptor=None):
+        if location not in self:
+            self[location] = descriptor
+        return self[location]
+
+    def pop(self, location, *default):
+        if location in self:
+            self.by_category[location.category].discard(location)
+        return super(CourseModules, self).pop(location, *default)
+
+    def popitem(self):
+        location, descriptor = super(CourseModules, self).popitem()
+        self.by_category[location.category].discard(location)
+        return location, descriptor
+
+    def clear(self):
+        super(CourseModules, self).clear()
+        self.by_category.clear()
+
+    def items_in_category(self, category):
+        """
+        Returns a list of the (location, descriptor) pairs of the modules in category
+        """
+        return [(location, self[location]) for location in list(self.by_category.get(category, ()))]
+
+
 class XMLModuleStore(ModuleStoreBase):
     """
     An XML backed ModuleStore
     """
-    def __init__(self, data_dir, default_class=None, course_dirs=None, load_error_modules=True):
+    def __init__(self, data_dir, default_class=None, course_dirs=None, load_error_modules=True,
+                 course_load_processes=1, snapshot_dir=None, lazy=False, max_loaded_modules=None):
         """
         Initialize an XMLModuleStore from data_dir
 
@@ -268,15 +372,44 @@ class XMLModuleStore(ModuleStoreBase):
 
         course_dirs: If specified, the list of course_dirs to load. Otherwise,
             load all course dirs
+
+        course_load_processes: If more than 1, courses are loaded in a pool of this
+            many processes, and the loaded courses are passed back as snapshots
+
+        snapshot_dir: If specified, a directory in which to keep a snapshot of each
+            loaded course. A course is restored from its snapshot, rather than parsed,
+            if the files in its course dir haven't changed since the snapshot was taken.
+            Snapshots are pickles, which can run arbitrary code when they're loaded, so the
+            directory must not be writable by anyone but the user this store runs as.
+
+        lazy: If True, only a summary of each course (its course descriptor and its
+            modules in SUMMARY_CATEGORIES) is kept in memory after startup, and the rest of
+            a course is loaded the first time it is asked for. Queries that don't name a
+            course (e.g. get_items with org None) only see the courses that are loaded,
+            and the summaries of the rest.
+
+        max_loaded_modules: In lazy mode, the number of modules that fully loaded courses
+            may hold. When it is exceeded, the least recently used courses are reduced to
+            their summaries again. None means no limit.
         """
         super(XMLModuleStore, self).__init__()
 
         self.data_dir = path(data_dir)
-        self.modules = defaultdict(dict)  # course_id -> dict(location -> XModuleDescriptor)
+        self.modules = defaultdict(CourseModules)  # course_id -> CourseModules(location -> XModuleDescriptor)
         self.courses = {}  # course_dir -> XModuleDescriptor for the course
         self.errored_courses = {}  # course_dir -> errorlog, for dirs that failed to load
+        self._course_versions = {}  # course_dir -> fingerprint of the course's files when it was loaded
 
         self.load_error_modules = load_error_modules
+        self.default_class_name = default_class
+        self.snapshot_dir = path(snapshot_dir) if snapshot_dir is not None else None
+
+        self.lazy = lazy
+        self.max_loaded_modules = max_loaded_modules
+        self._summaries = {}  # course_dir -> (course location, dict(location -> summary XModuleDescriptor))
+        self._course_dirs_by_id = {}  # course_id -> course_dir, for the summarized courses
+        self._loaded_courses = OrderedDict()  # course_dir -> number of modules, in least recently used order
+        self._load_lock = threading.RLock()
 
         if default_class is None:
             self.default_class = None
@@ -295,8 +428,321 @@ class XMLModuleStore(ModuleStoreBase):
         if course_dirs is None:
             course_dirs = sorted([d for d in os.listdir(self.data_dir) if
                                   os.path.exists(self.data_dir / d / "course.xml")])
+        self.load_courses(course_dirs, course_load_processes, summary_only=self.lazy)
+
+    def load_courses(self, course_dirs, processes=1, summary_only=False):
+        """
+        Load the courses in course_dirs, restoring them from their snapshots where
+        possible, and parsing the rest (across a pool of processes, if processes > 1)
+
+        If summary_only is True, only keep the summaries of the courses in memory (see restore_course)
+        """
+        fingerprints = {}
+        snapshot_keys = {}
+        to_load = []
         for course_dir in course_dirs:
-            self.try_load_course(course_dir)
+            # fingerprint the course before loading it, so that changes made while
+            # it loads give it a new version, and invalidate its snapshot
+            fingerprints[course_dir] = course_dir_fingerprint(self.data_dir / course_dir)
+            self._course_versions[course_dir] = fingerprints[course_dir]
+            if self.snapshot_dir is not None:
+                snapshot_keys[course_dir] = self._snapshot_key(fingerprints[course_dir])
+                pickled = self._read_snapshot(course_dir, snapshot_keys[course_dir])
+                if pickled is not None and self._restore_pickled_course(course_dir, pickled, summary_only):
+                    continue
+            to_load.append(course_dir)
+
+        if processes > 1 and len(to_load) > 1:
+            pool = multiprocessing.Pool(min(processes, len(to_load)))
+            try:
+                results = pool.map(_load_course_snapshot, [
+                    (self.data_dir, course_dir, self.default_class_name, self.load_error_modules)
+                    for course_dir in to_load
+                ])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [None] * len(to_load)
+
+        for course_dir, pickled in zip(to_load, results):
+            if pickled is None or not self._restore_pickled_course(course_dir, pickled, summary_only):
+                self.try_load_course(course_dir)
+                pickled = None
+                if self.snapshot_dir is not None or summary_only:
+                    snapshot = self.snapshot_course(course_dir)
+                    if snapshot is not None and self.snapshot_dir is not None:
+                        pickled = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+                    if snapshot is not None and summary_only:
+                        # replace the course with its summary
+                        self._forget_course(course_dir)
+                        self.restore_course(course_dir, snapshot, summary_only=True)
+            if pickled is not None and self.snapshot_dir is not None:
+                self._write_snapshot(course_dir, snapshot_keys[course_dir], pickled)
+
+    def snapshot_course(self, course_dir):
+        """
+        Returns a picklable snapshot of the loaded course in course_dir, from which
+        restore_course can recreate it, or None if the course didn't load.
+
+        A descriptor is recreated by constructing its class with its model data (which
+        for xml descriptors is a plain dictionary), and the attributes in SNAPSHOT_DESCRIPTOR_ATTRS.
+        """
+        course = self.courses.get(course_dir)
+        if course is None:
+            return None
+        modules = []
+        for descriptor in self.modules[course.id].itervalues():
+            attrs = dict(
+                (attr, getattr(descriptor, attr))
+                for attr in SNAPSHOT_DESCRIPTOR_ATTRS
+                if hasattr(descriptor, attr)
+            )
+            modules.append((descriptor.__class__, descriptor._model_data, attrs))
+        return {
+            'course_id': course.id,
+            'course_location': course.location,
+            'policy': course.system.policy,
+            'errors': self._location_errors[course.location].errors,
+            'parents': self.parent_trackers[course.id]._parents,
+            'modules': modules,
+        }
+
+    def restore_course(self, course_dir, snapshot, summary_only=False):
+        """
+        Recreate the course in course_dir from a snapshot taken by snapshot_course
+
+        If summary_only is True, only recreate the course descriptor and the modules in
+        SUMMARY_CATEGORIES, and remember them as the course's summary
+        """
+        course_id = snapshot['course_id']
+        errorlog = make_error_tracker()
+        errorlog.errors.extend(snapshot['errors'])
+        parent_tracker = self.parent_trackers[course_id]
+        if not summary_only:
+            for child, parents in snapshot['parents'].iteritems():
+                parent_tracker.make_known(child)
+                for parent in parents:
+                    parent_tracker.add_parent(child, parent)
+
+        system = ImportSystem(
+            self,
+            course_id,
+            course_dir,
+            snapshot['policy'],
+            errorlog.tracker,
+            parent_tracker,
+            self.load_error_modules,
+        )
+
+        to_restore = dict(
+            (model_data['location'], (class_, model_data, attrs))
+            for class_, model_data, attrs in snapshot['modules']
+            if not summary_only or (model_data['location'] == snapshot['course_location'] or
+                                    model_data['location'].category in SUMMARY_CATEGORIES)
+        )
+        modules = self.modules[course_id]
+
+        def restore(location):
+            """
+            Recreate the descriptor at location, after its children, as loading from xml does
+            """
+            if location not in to_restore:
+                return
+            class_, model_data, attrs = to_restore.pop(location)
+            if not summary_only:
+                for child in model_data.get('children', []):
+                    restore(Location(child))
+            descriptor = class_(system, model_data)
+            for attr, value in attrs.iteritems():
+                setattr(descriptor, attr, value)
+            modules[location] = descriptor
+
+        while to_restore:
+            restore(next(iter(to_restore)))
+
+        course_descriptor = modules[snapshot['course_location']]
+        self.courses[course_dir] = course_descriptor
+        self._location_errors[course_descriptor.location] = errorlog
+        parent_tracker.make_known(course_descriptor.location)
+
+        if summary_only:
+            self._summarize_course(course_dir)
+
+    def _restore_pickled_course(self, course_dir, pickled, summary_only=False):
+        """
+        Restore the course in course_dir from a pickled snapshot. Returns False (having
+        cleaned up after itself) if that failed, in which case the course should be loaded
+        from xml instead.
+        """
+        course_id = None
+        try:
+            snapshot = pickle.loads(pickled)
+            course_id = snapshot['course_id']
+            self.restore_course(course_dir, snapshot, summary_only)
+            return True
+        except Exception:
+            log.exception("Failed to restore course '{0}' from a snapshot. Loading it from xml.".format(course_dir))
+            self.courses.pop(course_dir, None)
+            if course_id is not None:
+                self.modules.pop(course_id, None)
+                self.parent_trackers.pop(course_id, None)
+            return False
+
+    def _forget_course(self, course_dir):
+        """
+        Drop the course in course_dir, and all of its modules
+        """
+        course_descriptor = self.courses.pop(course_dir)
+        self.modules.pop(course_descriptor.id, None)
+        self.parent_trackers.pop(course_descriptor.id, None)
+
+    def _course_modules(self, course_id):
+        """
+        Returns the dict(location -> XModuleDescriptor) of the modules in course_id,
+        first loading the whole course if this store is lazy and it isn't loaded
+        """
+        if not self.lazy or course_id not in self._course_dirs_by_id:
+            return self.modules[course_id]
+
+        course_dir = self._course_dirs_by_id[course_id]
+        with self._load_lock:
+            if course_dir in self._loaded_courses:
+                # mark the course as the most recently used
+                self._loaded_courses[course_dir] = self._loaded_courses.pop(course_dir)
+                return self.modules[course_id]
+
+            # Mark the course as loaded before loading it, so that the lookups made
+            # while it loads see the modules loaded so far, rather than loading it again.
+            # The summary stays in place while the course loads, so that the course
+            # doesn't disappear from get_courses meanwhile.
+            self._loaded_courses[course_dir] = 0
+            summary_course = self.courses[course_dir]
+            try:
+                self.load_courses([course_dir])
+            finally:
+                loaded_course = self.courses.get(course_dir)
+                if loaded_course is None or loaded_course is summary_course:
+                    # it didn't load, so fall back on its summary
+                    del self._loaded_courses[course_dir]
+                    self._restore_summary(course_dir)
+
+            if course_dir in self._loaded_courses:
+                # the course may have changed on disk, so summarize it again
+                self._summarize_course(course_dir)
+                self._loaded_courses[course_dir] = len(self.modules[course_id])
+                self._evict_courses()
+            return self.modules[course_id]
+
+    def _summarize_course(self, course_dir):
+        """
+        Remember the loaded course descriptor in course_dir, and its modules in
+        SUMMARY_CATEGORIES, as the summary of the course
+        """
+        course_descriptor = self.courses[course_dir]
+        summary = dict(
+            (location, descriptor)
+            for location, descriptor in self.modules[course_descriptor.id].iteritems()
+            if location == course_descriptor.location or location.category in SUMMARY_CATEGORIES
+        )
+        self._summaries[course_dir] = (course_descriptor.location, summary)
+        self._course_dirs_by_id[course_descriptor.id] = course_dir
+
+    def _restore_summary(self, course_dir):
+        """
+        Replace the course in course_dir with its summary
+        """
+        course_location, summary = self._summaries[course_dir]
+        course_id = CourseDescriptor.location_to_id(course_location)
+        for descriptor in summary.itervalues():
+            # drop any loaded children, so that they can be freed
+            descriptor._child_instances = None
+        parent_tracker = ParentTracker()
+        parent_tracker.make_known(course_location)
+        # swap in (rather than clear and refill) the course's modules and parents, so
+        # that concurrent lookups see either the loaded course or its summary, and
+        # never an empty course
+        self.modules[course_id] = CourseModules(summary)
+        self.parent_trackers[course_id] = parent_tracker
+        self.courses[course_dir] = summary[course_location]
+
+    def _evict_courses(self):
+        """
+        Reduce the least recently used courses to their summaries, until the loaded
+        courses hold at most max_loaded_modules modules. The most recently used course is
+        always kept.
+        """
+        if self.max_loaded_modules is None:
+            return
+        while len(self._loaded_courses) > 1 and sum(self._loaded_courses.values()) > self.max_loaded_modules:
+            course_dir, _ = self._loaded_courses.popitem(last=False)
+            self._restore_summary(course_dir)
+
+    def _load_courses_matching(self, location):
+        """
+        In a lazy store, load all the courses which could contain location.
+
+        Locations that don't name a course (whose org or course is None) don't load
+        any, so that an unscoped query doesn't load every course: they are answered
+        from the courses that are already loaded, and the summaries of the rest.
+        """
+        if not self.lazy:
+            return
+        location = Location(location)
+        if location.org is None or location.course is None:
+            return
+        for course_id in self._course_dirs_by_id.keys():
+            org, course, _ = course_id.split('/')
+            if location.org in (None, org) and location.course in (None, course):
+                self._course_modules(course_id)
+
+    def _snapshot_key(self, fingerprint):
+        """
+        Returns the key that identifies a snapshot of a course dir with the given
+        fingerprint (see course_dir_fingerprint) as current
+        """
+        return '{0}:{1}:{2}:{3}'.format(
+            SNAPSHOT_VERSION,
+            self.default_class_name,
+            self.load_error_modules,
+            fingerprint,
+        )
+
+    def _snapshot_path(self, course_dir):
+        """
+        Returns the path of the file that holds the snapshot of course_dir
+        """
+        return self.snapshot_dir / '{0}.snapshot'.format(course_dir)
+
+    def _read_snapshot(self, course_dir, key):
+        """
+        Returns the pickled snapshot of course_dir, or None if there is
+        no snapshot, or the snapshot's key isn't key
+        """
+        try:
+            with open(self._snapshot_path(course_dir), 'rb') as snapshot_file:
+                if snapshot_file.readline().rstrip('\n') != key:
+                    return None
+                return snapshot_file.read()
+        except IOError:
+            return None
+
+    def _write_snapshot(self, course_dir, key, pickled):
+        """
+        Save the pickled snapshot of course_dir, with the key it was taken at
+        """
+        snapshot_path = self._snapshot_path(course_dir)
+        tmp_path = '{0}.{1}.tmp'.format(snapshot_path, os.getpid())
+        try:
+            if not self.snapshot_dir.isdir():
+                self.snapshot_dir.makedirs()
+            with open(tmp_path, 'wb') as snapshot_file:
+                snapshot_file.write(key + '\n')
+                snapshot_file.write(pickled)
+            # rename, so that other processes never read a partly written snapshot
+            os.rename(tmp_path, snapshot_path)
+        except (IOError, OSError):
+            log.exception("Failed to save a snapshot of course '{0}'".format(course_dir))
 
     def try_load_course(self, course_dir):
         '''
@@ -500,8 +946,13 @@ class XMLModuleStore(ModuleStoreBase):
         location: Something that can be passed to Location
         """
         location = Location(location)
+        if course_id in self._course_dirs_by_id:
+            # don't load a whole course for the modules in its summary
+            _, summary = self._summaries[self._course_dirs_by_id[course_id]]
+            if location in summary:
+                return summary[location]
         try:
-            return self.modules[course_id][location]
+            return self._course_modules(course_id)[location]
         except KeyError:
             raise ItemNotFoundError(location)
 
@@ -510,6 +961,7 @@ class XMLModuleStore(ModuleStoreBase):
         Returns True if location exists in this ModuleStore.
         """
         location = Location(location)
+        self._load_courses_matching(location)
         return any(location in course_modules for course_modules in self.modules.values())
 
     def get_item(self, location, depth=0):
@@ -528,20 +980,30 @@ class XMLModuleStore(ModuleStoreBase):
                                   " are unique. Use get_instance.")
 
     def get_items(self, location, course_id=None, depth=0):
+        location = Location(location)
         items = []
 
         def _add_get_items(self, location, modules):
-            for mod_loc, module in modules.iteritems():
+            # only look at the modules in the right category, if there is one
+            if location.category is None:
+                candidates = modules.items()
+            else:
+                candidates = modules.items_in_category(location.category)
+            for mod_loc, module in candidates:
                 # Locations match if each value in `location` is None or if the value from `location`
                 # matches the value from `mod_loc`
                 if all(goal is None or goal == value for goal, value in zip(location, mod_loc)):
                     items.append(module)
 
         if course_id is None:
-            for _, modules in self.modules.iteritems():
-                _add_get_items(self, location, modules)
+            self._load_courses_matching(location)
+            for modules_course_id, modules in self.modules.items():
+                # skip the courses that location can't be in
+                org, course, _ = modules_course_id.split('/')
+                if location.org in (None, org) and location.course in (None, course):
+                    _add_get_items(self, location, modules)
         else:
-            _add_get_items(self, location, self.modules[course_id])
+            _add_get_items(self, location, self._course_modules(course_id))
 
         return items
 
@@ -552,6 +1014,25 @@ class XMLModuleStore(ModuleStoreBase):
         """
         return self.courses.values()
 
+    def get_course_version(self, location):
+        """
+        Returns the version stamp of the course (org/course) that location belongs to:
+        the fingerprint of the files of its course dir(s) when they were loaded, so
+        that it changes whenever a course is loaded from changed files
+        """
+        location = Location(location)
+        versions = sorted(
+            self._course_versions[course_dir]
+            for course_dir, course in self.courses.items()
+            if course.location.org == location.org and course.location.course == location.course
+            and course_dir in self._course_versions
+        )
+        if not versions:
+            return None
+        if len(versions) == 1:
+            return versions[0]
+        return hashlib.md5(':'.join(versions)).hexdigest()
+
     def get_errored_courses(self):
         """
         Return a dictionary of course_dir -> [(msg, exception_str)], for each
@@ -597,6 +1078,7 @@ class XMLModuleStore(ModuleStoreBase):
         be empty if there are no parents.
         '''
         location = Location.ensure_fully_specified(location)
+        self._course_modules(course_id)
         if not self.parent_trackers[course_id].is_known(location):
             raise ItemNotFoundError("{0} not in {1}".format(location, course_id))
 
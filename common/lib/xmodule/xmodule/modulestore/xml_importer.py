@@ -175,7 +175,7 @@ def import_course_from_xml(modulestore, static_content_store, course_data_path,
 def import_from_xml(store, data_dir, course_dirs=None,
                     default_class='xmodule.raw_module.RawDescriptor',
                     load_error_modules=True, static_content_store=None, target_location_namespace=None,
-                    verbose=False, draft_store=None):
+                    verbose=False, draft_store=None, course_load_processes=1):
     """
     Import the specified xml data_dir into the "store" modulestore,
     using org and course as the location org and course.
@@ -183,6 +183,9 @@ def import_from_xml(store, data_dir, course_dirs=None,
     course_dirs: If specified, the list of course_dirs to load. Otherwise, load
     all course dirs
 
+    course_load_processes: If more than 1, the courses are loaded from xml in a pool
+    of this many processes (see XMLModuleStore)
+
     target_location_namespace is the namespace [passed as Location] (i.e. {tag},{org},{course}) that all modules in the should be remapped to
     after import off disk. We do this remapping as a post-processing step because there's logic in the importing which
     expects a 'url_name' as an identifier to where things are on disk e.g. ../policies/<url_name>/policy.json as well as metadata keys in
@@ -194,7 +197,8 @@ def import_from_xml(store, data_dir, course_dirs=None,
         data_dir,
         default_class=default_class,
         course_dirs=course_dirs,
-        load_error_modules=load_error_modules
+        load_error_modules=load_error_modules,
+        course_load_processes=course_load_processes,
     )
 
     # NOTE: the XmlModuleStore does not implement get_items() which would be a preferable means
@@ -255,22 +259,36 @@ def import_from_xml(store, data_dir, course_dirs=None,
                 import_static_content(xml_module_store.modules[course_id], course_location, course_data_path, static_content_store,
                                       _namespace_rename, subpath='static', verbose=verbose)
 
-            # finally loop through all the modules
-            for module in xml_module_store.modules[course_id].itervalues():
+            # finally loop through all the modules, writing them to the store in bulk
+            def _modules_to_import():
+                """
+                Yield the (location, data, children, metadata) of all the modules to
+                write in bulk, importing the rest one at a time
+                """
+                for module in xml_module_store.modules[course_id].itervalues():
 
-                if module.category == 'course':
-                    # we've already saved the course module up at the top of the loop
-                    # so just skip over it in the inner loop
-                    continue
+                    if module.category == 'course':
+                        # we've already saved the course module up at the top of the loop
+                        # so just skip over it in the inner loop
+                        continue
 
-                # remap module to the new namespace
-                if target_location_namespace is not None:
-                    module = remap_namespace(module, target_location_namespace)
+                    # remap module to the new namespace
+                    if target_location_namespace is not None:
+                        module = remap_namespace(module, target_location_namespace)
 
-                if verbose:
-                    log.debug('importing module location {0}'.format(module.location))
+                    if verbose:
+                        log.debug('importing module location {0}'.format(module.location))
+
+                    if module.category == 'static_tab':
+                        # static tabs also update the course's tabs when their metadata is written
+                        import_module(module, store, course_data_path, static_content_store)
+                        continue
+
+                    module_data, children, metadata = get_module_import_data(module, course_data_path,
+                                                                             static_content_store)
+                    yield module.location, module_data, children, metadata
 
-                import_module(module, store, course_data_path, static_content_store)
+            store.bulk_update_items(_modules_to_import())
 
             # now import any 'draft' items
             if draft_store is not None:
@@ -288,7 +306,11 @@ def import_from_xml(store, data_dir, course_dirs=None,
     return xml_module_store, course_items
 
 
-def import_module(module, store, course_data_path, static_content_store, allow_not_found=False):
+def get_module_import_data(module, course_data_path, static_content_store):
+    """
+    Returns the (data, children, metadata) of module to write to a modulestore, after
+    importing the static content that its data links to
+    """
     content = {}
     for field in module.fields:
         if field.scope != Scope.content:
@@ -326,17 +348,25 @@ def import_module(module, store, course_data_path, static_content_store, allow_n
     else:
         module_data = content
 
+    children = getattr(module, 'children', [])
+
+    # NOTE: It's important to use own_metadata here to avoid writing
+    # inherited metadata everywhere.
+    return module_data, children, dict(own_metadata(module))
+
+
+def import_module(module, store, course_data_path, static_content_store, allow_not_found=False):
+    module_data, children, metadata = get_module_import_data(module, course_data_path, static_content_store)
+
     if allow_not_found:
         store.update_item(module.location, module_data, allow_not_found=allow_not_found)
     else:
         store.update_item(module.location, module_data)
 
-    if hasattr(module, 'children') and module.children != []:
-        store.update_children(module.location, module.children)
+    if children != []:
+        store.update_children(module.location, children)
 
-    # NOTE: It's important to use own_metadata here to avoid writing
-    # inherited metadata everywhere.
-    store.update_metadata(module.location, dict(own_metadata(module)))
+    store.update_metadata(module.location, metadata)
 
 
 def import_course_draft(xml_module_store, store, draft_store, course_data_path, static_content_store, target_location_namespace):
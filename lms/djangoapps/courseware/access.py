@@ -6,7 +6,9 @@ from datetime import datetime, timedelta
 from functools import partial
 
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
 
 from xmodule.course_module import CourseDescriptor
 from xmodule.error_module import ErrorDescriptor
@@ -17,9 +19,13 @@ from student.models import CourseEnrollmentAllowed
 from external_auth.models import ExternalAuthMap
 from courseware.masquerade import is_masquerading_as_student
 from django.utils.timezone import UTC
+from request_cache.middleware import RequestCache
 
 DEBUG_ACCESS = False
 
+# the key under which access decisions are memoized in the request cache
+ACCESS_CACHE_KEY = 'courseware.access'
+
 log = logging.getLogger(__name__)
 
 
@@ -62,6 +68,25 @@ def has_access(user, obj, action, course_context=None):
 
     Returns a bool.  It is up to the caller to actually deny access in a way
     that makes sense in context.
+
+    While a request is being processed, decisions are memoized per
+    (user, object, action, course_context), so checking the same object
+    repeatedly while rendering a page only computes the answer once.
+    """
+    cache = _access_cache('decisions')
+    key = _decision_key(user, obj, action, course_context) if cache is not None else None
+    if key is not None and key in cache:
+        return cache[key]
+
+    result = _has_access(user, obj, action, course_context)
+    if key is not None:
+        cache[key] = result
+    return result
+
+
+def _has_access(user, obj, action, course_context):
+    """
+    Does the work of has_access, without memoizing the decision.
     """
     # delegate the work to type-specific functions.
     # (start with more specific types, then get more general)
@@ -106,7 +131,75 @@ def get_access_group_name(obj, action):
                     .format(type(obj)))
 
 
+def clear_access_cache():
+    """
+    Forgets the access decisions memoized for the current request.
+    """
+    RequestCache.get_request_cache().data.pop(ACCESS_CACHE_KEY, None)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def _user_groups_changed(sender, **kwargs):
+    """
+    Group membership decides staff, instructor, and beta tester access, so
+    memoized decisions can't outlive a change to it.
+    """
+    clear_access_cache()
+
+
 # ================ Implementation helpers ================================
+def _access_cache(name):
+    """
+    Returns the dict called name that access information is memoized in for
+    the current request, or None if no request is being processed (e.g. in
+    management commands and celery tasks, which have no request to scope the
+    memoized decisions to).
+    """
+    request_cache = RequestCache.get_request_cache()
+    if not getattr(request_cache, 'in_request', False):
+        return None
+    return request_cache.data.setdefault(ACCESS_CACHE_KEY, {}).setdefault(name, {})
+
+
+def _user_cache_key(user):
+    """
+    Returns the part of an access cache key that identifies user.
+    """
+    if user is None or not user.is_authenticated():
+        return None
+    return (user.id, is_masquerading_as_student(user))
+
+
+def _decision_key(user, obj, action, course_context):
+    """
+    Returns the key that the has_access decision for these arguments is memoized
+    under, or None if the decision shouldn't be memoized.
+    """
+    if isinstance(obj, (XModuleDescriptor, XModule)):
+        obj_key = obj.location.url()
+    elif isinstance(obj, Location):
+        obj_key = obj.url()
+    elif isinstance(obj, basestring):
+        obj_key = obj
+    else:
+        return None
+    return (_user_cache_key(user), type(obj), obj_key, action, course_context)
+
+
+def _user_group_names(user):
+    """
+    Returns the set of names of the groups that user is in.  Looked up once per
+    request for each user.
+    """
+    cache = _access_cache('group_names')
+    if cache is None:
+        return set(g.name for g in user.groups.all())
+
+    if user.id not in cache:
+        cache[user.id] = set(g.name for g in user.groups.all())
+    return cache[user.id]
+
+
 def _has_access_course_desc(user, course, action):
     """
     Check if user has access to a course descriptor.
@@ -518,7 +611,7 @@ def _adjust_start_date_for_beta_testers(user, descriptor):
         # bail early if no beta testing is set up
         return descriptor.lms.start
 
-    user_groups = [g.name for g in user.groups.all()]
+    user_groups = _user_group_names(user)
 
     beta_group = course_beta_test_group_name(descriptor.location)
     if beta_group in user_groups:
@@ -565,7 +658,26 @@ def _has_access_to_location(user, location, access_level, course_context):
         return True
 
     # If not global staff, is the user in the Auth group for this class?
-    user_groups = [g.name for g in user.groups.all()]
+    # The answer is the same for every location in a course run, so it's
+    # memoized per course rather than per location.
+    cache = _access_cache('course_access')
+    if cache is None:
+        return _has_group_access_to_location(user, location, access_level, course_context)
+
+    loc = Location(location)
+    course_id = loc.course_id if loc.category == 'course' else course_context
+    key = (user.id, loc.org, loc.course, course_id, access_level)
+    if key not in cache:
+        cache[key] = _has_group_access_to_location(user, location, access_level, course_context)
+    return cache[key]
+
+
+def _has_group_access_to_location(user, location, access_level, course_context):
+    '''
+    Returns True if user is in one of the staff (if access_level is 'staff') or
+    instructor groups for the course that location is in.
+    '''
+    user_groups = _user_group_names(user)
 
     if access_level == 'staff':
         staff_groups = group_names_for_staff(location, course_context) + \
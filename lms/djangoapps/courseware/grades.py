@@ -1,23 +1,39 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
 
+import hashlib
+import json
 import random
 import logging
 
 from collections import defaultdict
+from datetime import timedelta
+from itertools import chain
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
-from .model_data import ModelDataCache, LmsKeyValueStore
+from .model_data import ModelDataCache, LmsKeyValueStore, chunks
 from xblock.core import Scope
 from .module_render import get_module, get_module_for_descriptor
 from xmodule import graders
-from xmodule.capa_module import CapaModule
+from xmodule.capa_module import CapaModule, CapaDescriptor
 from xmodule.graders import Score
-from .models import StudentModule
+from xmodule.modulestore.django import modulestore
+from .models import StudentModule, StudentGradeSummary
 
 log = logging.getLogger("mitx.courseware")
 
+# Number of students whose model data is loaded at once by iterate_grades_for
+GRADING_CHUNK_SIZE = 250
+
+# How long (in seconds) to keep the max score of a problem in the cache. Since
+# the cache key includes a hash of the problem content, this only bounds how
+# long unused entries hang around.
+MAX_SCORE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
 
 def yield_module_descendents(module):
     stack = module.get_display_items()
@@ -137,7 +153,13 @@ def grade(student, request, course, model_data_cache=None, keep_raw_scores=False
 
     More information on the format is in the docstring for CourseGrader.
     """
+    return _grade(student, request, course, model_data_cache, keep_raw_scores, _ScoreMemo())
+
 
+def _grade(student, request, course, model_data_cache, keep_raw_scores, memo):
+    """
+    Implements grade(), reusing the modules and scores already in memo (a _ScoreMemo)
+    """
     grading_context = course.grading_context
     raw_scores = []
 
@@ -181,11 +203,14 @@ def grade(student, request, course, model_data_cache=None, keep_raw_scores=False
                     '''creates an XModule instance given a descriptor'''
                     # TODO: We need the request to pass into here. If we could forego that, our arguments
                     # would be simpler
-                    return get_module_for_descriptor(student, request, descriptor, model_data_cache, course.id)
+                    return memo.get_module(
+                        descriptor,
+                        lambda: get_module_for_descriptor(student, request, descriptor, model_data_cache, course.id)
+                    )
 
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
+                for module_descriptor in memo.descendents(section_descriptor, create_module):
 
-                    (correct, total) = get_score(course.id, student, module_descriptor, create_module, model_data_cache)
+                    (correct, total) = memo.get_score(course.id, student, module_descriptor, create_module, model_data_cache)
                     if correct is None and total is None:
                         continue
 
@@ -232,6 +257,185 @@ def grade(student, request, course, model_data_cache=None, keep_raw_scores=False
     return grade_summary
 
 
+def iterate_grades_for(course, students, request, keep_raw_scores=False, chunk_size=GRADING_CHUNK_SIZE):
+    """
+    Grade many students in a course, yielding a (student, grade_summary) tuple
+    for each student in `students`, in order.
+
+    This is equivalent to calling grade() for each student, but loads the model
+    data for `chunk_size` students at a time with a single set of queries, and
+    reuses the course's descriptor tree and grading_context for all of them.
+
+    course: a CourseDescriptor, loaded with depth=None
+    students: an iterable of User objects
+    request: the request to use when creating modules (only used when a
+        module needs to be instantiated to compute its score)
+    keep_raw_scores: passed through to grade()
+    chunk_size: the number of students to load model data for at once
+    """
+    all_descriptors = course.grading_context['all_descriptors']
+    for student_chunk in chunks(students, chunk_size):
+        model_data_caches = ModelDataCache.cache_for_users(all_descriptors, course.id, student_chunk)
+        for student in student_chunk:
+            model_data_cache = model_data_caches.get(student.id)
+            if model_data_cache is None:
+                model_data_cache = ModelDataCache(all_descriptors, course.id, student)
+            yield student, grade(student, request, course, model_data_cache, keep_raw_scores)
+
+
+def grading_policy_hash(course):
+    """
+    Return a hash of the grading policy of `course`, used to tell whether a stored
+    grade summary was computed under the course's current grading policy.
+    """
+    return hashlib.md5(json.dumps(course.grading_policy, sort_keys=True)).hexdigest()
+
+
+def materialized_grade(student, request, course, compute_grade=None):
+    """
+    Return the same grade summary as grade(student, request, course), but read it
+    from the StudentGradeSummary table when an up to date summary is stored there.
+
+    Otherwise, the grade is computed and stored, so that subsequent calls are a
+    single row lookup until one of the student's problem grades changes (which
+    marks the row stale), the course's grading policy changes, anything in the
+    course's content changes (which gives the course a new version stamp), or part
+    of the course opens up (which may change what is graded).  Courses from
+    modulestores that don't keep version stamps are always graded afresh, since
+    changes to their content can't be detected.
+
+    compute_grade: if given, a function of no arguments which is called in place of
+        grade(student, request, course) to compute the grade summary
+
+    Note that the stored summary round-trips through JSON, so Scores in
+    'totaled_scores' are returned as lists.
+    """
+    if compute_grade is None:
+        compute_grade = lambda: grade(student, request, course)
+
+    # get the version before grading, so that changes made while grading cause
+    # the next call to grade again
+    course_version = modulestore().get_course_version(course.location)
+    if course_version is None:
+        return compute_grade()
+
+    policy_hash = grading_policy_hash(course)
+    try:
+        summary = StudentGradeSummary.objects.get(user=student, course_id=course.id)
+    except StudentGradeSummary.DoesNotExist:
+        summary = None
+    grade_summary = _stored_grade_summary(summary, course_version, policy_hash)
+    if grade_summary is not None:
+        return grade_summary
+
+    expires = _next_access_change(course)
+    grade_summary = compute_grade()
+    _store_grade_summary(student, course, summary, grade_summary, course_version, policy_hash, expires)
+    return grade_summary
+
+
+def iterate_materialized_grades_for(course, students, request, chunk_size=GRADING_CHUNK_SIZE):
+    """
+    Yields a (student, grade_summary) tuple for each student in `students`, in order,
+    as materialized_grade would return it: the students' stored grade summaries are
+    looked up `chunk_size` students at a time, and those that aren't up to date are
+    computed (as by iterate_grades_for) and stored.
+    """
+    course_version = modulestore().get_course_version(course.location)
+    if course_version is None:
+        for student, grade_summary in iterate_grades_for(course, students, request, chunk_size=chunk_size):
+            yield student, grade_summary
+        return
+
+    policy_hash = grading_policy_hash(course)
+    for student_chunk in chunks(students, chunk_size):
+        summaries = dict(
+            (summary.user_id, summary)
+            for summary in StudentGradeSummary.objects.filter(
+                course_id=course.id, user__in=[student.id for student in student_chunk])
+        )
+        grade_summaries = {}
+        to_grade = []
+        for student in student_chunk:
+            grade_summary = _stored_grade_summary(summaries.get(student.id), course_version, policy_hash)
+            if grade_summary is None:
+                to_grade.append(student)
+            else:
+                grade_summaries[student.id] = grade_summary
+
+        if to_grade:
+            expires = _next_access_change(course)
+            for student, grade_summary in iterate_grades_for(course, to_grade, request, chunk_size=chunk_size):
+                _store_grade_summary(student, course, summaries.get(student.id), grade_summary,
+                                     course_version, policy_hash, expires)
+                grade_summaries[student.id] = grade_summary
+
+        for student in student_chunk:
+            yield student, grade_summaries[student.id]
+
+
+def _next_access_change(course):
+    """
+    Returns the first start date after now of the course, its chapters or anything
+    that is graded (brought forward by their beta testing period, if any), or None
+    if there is none.  What students can access, and so what is graded, may change
+    at that time.
+    """
+    now = timezone.now()
+    starts = []
+    for descriptor in chain([course], course.get_children(), course.grading_context['all_descriptors']):
+        start = descriptor.lms.start
+        if start is None:
+            continue
+        if descriptor.lms.days_early_for_beta is not None:
+            start -= timedelta(descriptor.lms.days_early_for_beta)
+        if start > now:
+            starts.append(start)
+    return min(starts) if starts else None
+
+
+def _stored_grade_summary(summary, course_version, policy_hash):
+    """
+    Returns the grade summary stored in `summary` (a StudentGradeSummary, or None) if
+    it's up to date with the course's current version and grading policy, else None
+    """
+    if summary is None or summary.stale or summary.grade_summary is None:
+        return None
+    if summary.grading_policy_hash != policy_hash or summary.course_version != course_version:
+        return None
+    if summary.expires is not None and summary.expires <= timezone.now():
+        return None
+    return json.loads(summary.grade_summary)
+
+
+def _store_grade_summary(student, course, summary, grade_summary, course_version, policy_hash, expires):
+    """
+    Store grade_summary as the student's grade summary for the course, replacing
+    `summary` (the StudentGradeSummary that was read before grading, or None)
+    """
+    values = {
+        'grade_summary': json.dumps(grade_summary),
+        'grading_policy_hash': policy_hash,
+        'course_version': course_version,
+        'expires': expires,
+        'stale': False,
+    }
+    if summary is None:
+        savepoint = transaction.savepoint()
+        try:
+            StudentGradeSummary.objects.create(user=student, course_id=course.id, **values)
+        except IntegrityError:
+            # another request stored a summary first; it's as good as this one
+            transaction.savepoint_rollback(savepoint)
+        else:
+            transaction.savepoint_commit(savepoint)
+    else:
+        # only replace the row if it hasn't been invalidated since it was read, so
+        # that an invalidation made while grading isn't lost
+        StudentGradeSummary.objects.filter(pk=summary.pk, generation=summary.generation).update(
+            modified=timezone.now(), **values)
+
+
 def grade_for_percentage(grade_cutoffs, percentage):
     """
     Returns a letter grade as defined in grading_policy (e.g. 'A' 'B' 'C' for 6.002x) or None.
@@ -278,7 +482,33 @@ def progress_summary(student, request, course, model_data_cache):
     will return None.
 
     """
+    return _progress_summary(student, request, course, model_data_cache, _ScoreMemo())
 
+
+def progress_summary_and_grade(student, request, course, model_data_cache):
+    """
+    Returns (progress_summary(...), materialized_grade(...)) for student, computing
+    both in one walk of the course: the modules that are instantiated and the scores
+    that are looked up for the progress summary are reused for grading, if the stored
+    grade summary isn't up to date.
+
+    model_data_cache must hold all the student's state for the course (as for
+    progress_summary).
+    """
+    memo = _ScoreMemo()
+    courseware_summary = _progress_summary(student, request, course, model_data_cache, memo)
+    grade_summary = materialized_grade(
+        student, request, course,
+        compute_grade=lambda: _grade(student, request, course, model_data_cache, False, memo)
+    )
+    return courseware_summary, grade_summary
+
+
+def _progress_summary(student, request, course, model_data_cache, memo):
+    """
+    Implements progress_summary(), recording the modules and scores it computes in
+    memo (a _ScoreMemo)
+    """
     # TODO: We need the request to pass into here. If we could forego that, our arguments
     # would be simpler
     course_module = get_module(student, request, course.location, model_data_cache, course.id, depth=None)
@@ -303,12 +533,15 @@ def progress_summary(student, request, course, model_data_cache):
             graded = section_module.lms.graded
             scores = []
 
-            module_creator = section_module.system.get_module
+            memo.add_module(section_module)
+
+            def module_creator(descriptor, get_module=section_module.system.get_module):
+                return memo.get_module(descriptor, lambda: get_module(descriptor))
 
-            for module_descriptor in yield_dynamic_descriptor_descendents(section_module.descriptor, module_creator):
+            for module_descriptor in memo.descendents(section_module.descriptor, module_creator):
 
                 course_id = course.id
-                (correct, total) = get_score(course_id, student, module_descriptor, module_creator, model_data_cache)
+                (correct, total) = memo.get_score(course_id, student, module_descriptor, module_creator, model_data_cache)
                 if correct is None and total is None:
                     continue
 
@@ -337,6 +570,52 @@ def progress_summary(student, request, course, model_data_cache):
     return chapters
 
 
+class _ScoreMemo(object):
+    """
+    Remembers the modules, section descendents, and scores computed for one
+    student in one course, so that computing both their progress summary and
+    their grade doesn't compute any of them twice.
+    """
+    def __init__(self):
+        self._modules = {}
+        self._descendents = {}
+        self._scores = {}
+
+    def add_module(self, module):
+        """
+        Remembers an XModule that has already been created
+        """
+        self._modules[module.location.url()] = module
+
+    def get_module(self, descriptor, create):
+        """
+        Returns the module for descriptor, calling create() to make it if it hasn't
+        been made already
+        """
+        key = descriptor.location.url()
+        if key not in self._modules:
+            self._modules[key] = create()
+        return self._modules[key]
+
+    def descendents(self, section_descriptor, module_creator):
+        """
+        Returns the list of yield_dynamic_descriptor_descendents(section_descriptor, module_creator)
+        """
+        key = section_descriptor.location.url()
+        if key not in self._descendents:
+            self._descendents[key] = list(yield_dynamic_descriptor_descendents(section_descriptor, module_creator))
+        return self._descendents[key]
+
+    def get_score(self, course_id, user, problem_descriptor, module_creator, model_data_cache):
+        """
+        Returns get_score(course_id, user, problem_descriptor, module_creator, model_data_cache)
+        """
+        key = problem_descriptor.location.url()
+        if key not in self._scores:
+            self._scores[key] = get_score(course_id, user, problem_descriptor, module_creator, model_data_cache)
+        return self._scores[key]
+
+
 def get_score(course_id, user, problem_descriptor, module_creator, model_data_cache):
     """
     Return the score for a user on a problem, as a tuple (correct, total).
@@ -383,14 +662,10 @@ def get_score(course_id, user, problem_descriptor, module_creator, model_data_ca
         total = student_module.max_grade
     else:
         # If the problem was not in the cache, or hasn't been graded yet,
-        # we need to instantiate the problem.
-        # Otherwise, the max score (cached in student_module) won't be available
-        problem = module_creator(problem_descriptor)
-        if problem is None:
-            return (None, None)
-
+        # we need the max score of the problem. Look it up in the shared max score cache
+        # first, and only instantiate the problem if it isn't there.
         correct = 0.0
-        total = problem.max_score()
+        total = get_max_score(problem_descriptor, module_creator)
 
         # Problem may be an error module (if something in the problem builder failed)
         # In which case total might be None
@@ -407,3 +682,48 @@ def get_score(course_id, user, problem_descriptor, module_creator, model_data_ca
         total = weight
 
     return (correct, total)
+
+
+def max_score_cache_key(problem_descriptor):
+    """
+    Return the key under which the max score of `problem_descriptor` is cached,
+    or None if its max score can't be cached.
+
+    Only capa problems are cached: their max score depends only on the problem
+    xml, so the key combines the problem location with a hash of its content,
+    which means that editing the problem automatically invalidates the entry.
+    """
+    if not isinstance(problem_descriptor, CapaDescriptor):
+        return None
+
+    content_hash = hashlib.md5(problem_descriptor.data.encode('utf-8')).hexdigest()
+    return u'grades.max_score.{0}.{1}'.format(problem_descriptor.location.url(), content_hash)
+
+
+def get_max_score(problem_descriptor, module_creator):
+    """
+    Return the max score for `problem_descriptor`, or None if it couldn't be determined.
+
+    The max score is read from the cache if possible. Otherwise the problem is
+    instantiated using `module_creator`, and its max score is stored in the cache
+    so that no other student (or process) has to instantiate it again until the
+    problem content changes.
+    """
+    cache_key = max_score_cache_key(problem_descriptor)
+    if cache_key is not None:
+        total = cache.get(cache_key)
+        if total is not None:
+            return total
+
+    problem = module_creator(problem_descriptor)
+    if problem is None:
+        return None
+
+    total = problem.max_score()
+
+    # Problem may be an error module (if something in the problem builder failed)
+    # In which case total might be None, and shouldn't be cached
+    if total is not None and cache_key is not None:
+        cache.set(cache_key, total, MAX_SCORE_CACHE_TIMEOUT)
+
+    return total
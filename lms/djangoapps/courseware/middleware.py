@@ -0,0 +1,42 @@
+"""
+Middleware for the courseware app
+"""
+import logging
+
+from django.db import DatabaseError, transaction
+from django.http import HttpResponseServerError
+
+from courseware.model_data import FieldObjectWriteBuffer
+
+log = logging.getLogger(__name__)
+
+
+class FieldObjectWriteBufferMiddleware(object):
+    """
+    Buffers the writes of student state (StudentModules and field objects) made
+    while handling a request, and saves each changed object once when the
+    response is ready.
+
+    This must come after django.middleware.transaction.TransactionMiddleware in
+    MIDDLEWARE_CLASSES, so that the writes are made before the transaction is
+    committed. If the writes fail, the transaction is rolled back and a 500
+    response is returned in place of the view's.
+    """
+    def process_request(self, request):
+        FieldObjectWriteBuffer.start()
+
+    def process_response(self, request, response):
+        write_buffer = FieldObjectWriteBuffer.stop()
+        if write_buffer is not None:
+            try:
+                write_buffer.flush()
+            except DatabaseError:
+                log.exception("Error saving student state for %s", request.path)
+                if transaction.is_managed():
+                    transaction.rollback()
+                return HttpResponseServerError()
+        return response
+
+    def process_exception(self, request, exception):
+        # the transaction is rolled back, so drop the writes too
+        FieldObjectWriteBuffer.stop()
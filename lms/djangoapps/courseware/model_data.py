@@ -3,10 +3,11 @@ Classes to provide the LMS runtime data storage to XBlocks
 """
 
 import json
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, OrderedDict
 from itertools import chain
 from .models import (
     StudentModule,
+    StudentModuleHistory,
     XModuleContentField,
     XModuleSettingsField,
     XModuleStudentPrefsField,
@@ -16,6 +17,7 @@ import logging
 
 from django.db import DatabaseError
 
+from request_cache.middleware import RequestCache
 from xblock.runtime import KeyValueStore, InvalidScopeError
 from xblock.core import KeyValueMultiSaveError, Scope
 
@@ -29,6 +31,90 @@ class InvalidWriteError(Exception):
     """
 
 
+# the key that the current request's FieldObjectWriteBuffer is kept under in the request cache
+WRITE_BUFFER_KEY = 'courseware.write_buffer'
+
+
+class FieldObjectWriteBuffer(object):
+    """
+    Collects the model data objects (StudentModules and field objects) that are
+    changed while handling a request, so that each is saved once, at the end of
+    the request, however many times it was changed.
+    """
+    def __init__(self):
+        self._pending = OrderedDict()
+
+    def add(self, field_object):
+        """
+        Marks field_object as needing to be saved
+        """
+        self._pending[id(field_object)] = field_object
+
+    def discard(self, field_object):
+        """
+        Unmarks field_object (e.g. because it has been deleted)
+        """
+        self._pending.pop(id(field_object), None)
+
+    def flush(self):
+        """
+        Saves all the pending objects, inserting the StudentModuleHistory entries
+        for them all at once.
+        """
+        pending, self._pending = self._pending, OrderedDict()
+        with StudentModuleHistory.batched_history():
+            for field_object in pending.itervalues():
+                field_object.save()
+
+    def __len__(self):
+        return len(self._pending)
+
+    @staticmethod
+    def start():
+        """
+        Starts buffering the writes made while handling the current request
+        """
+        RequestCache.get_request_cache().data[WRITE_BUFFER_KEY] = FieldObjectWriteBuffer()
+
+    @staticmethod
+    def stop():
+        """
+        Stops buffering writes for the current request, and returns the buffer
+        (or None if writes weren't being buffered)
+        """
+        return RequestCache.get_request_cache().data.pop(WRITE_BUFFER_KEY, None)
+
+    @staticmethod
+    def current():
+        """
+        Returns the buffer for the current request, or None if writes aren't being buffered
+        """
+        return RequestCache.get_request_cache().data.get(WRITE_BUFFER_KEY)
+
+
+def save_field_object(field_object):
+    """
+    Saves field_object (a StudentModule or field object), or, if writes are being
+    buffered for the current request, marks it to be saved at the end of the request.
+    """
+    write_buffer = FieldObjectWriteBuffer.current()
+    if write_buffer is not None:
+        write_buffer.add(field_object)
+    else:
+        field_object.save()
+
+
+def flush_buffered_writes():
+    """
+    Saves the writes buffered so far for the current request, if writes are being
+    buffered, so that a failure to save them is raised to the caller rather than
+    after the response has been built. Buffering carries on for the rest of the request.
+    """
+    write_buffer = FieldObjectWriteBuffer.current()
+    if write_buffer is not None:
+        write_buffer.flush()
+
+
 def chunks(items, chunk_size):
     """
     Yields the values from items in chunks of size chunk_size
@@ -37,6 +123,30 @@ def chunks(items, chunk_size):
     return (items[i:i + chunk_size] for i in xrange(0, len(items), chunk_size))
 
 
+def descriptor_descendents(descriptor, depth=None, descriptor_filter=lambda descriptor: True):
+    """
+    Return a list of all child descriptors down to the specified depth
+    that match the descriptor filter. Includes `descriptor`
+
+    descriptor: The parent to search inside
+    depth: The number of levels to descend, or None for infinite depth
+    descriptor_filter(descriptor): A function that returns True
+        if descriptor should be included in the results
+    """
+    if descriptor_filter(descriptor):
+        descriptors = [descriptor]
+    else:
+        descriptors = []
+
+    if depth is None or depth > 0:
+        new_depth = depth - 1 if depth is not None else depth
+
+        for child in descriptor.get_children() + descriptor.get_required_module_descriptors():
+            descriptors.extend(descriptor_descendents(child, new_depth, descriptor_filter))
+
+    return descriptors
+
+
 class ModelDataCache(object):
     """
     A cache of django model objects needed to supply the data
@@ -80,33 +190,56 @@ class ModelDataCache(object):
             should be cached
         select_for_update: Flag indicating whether the rows should be locked until end of transaction
         """
+        descriptors = descriptor_descendents(descriptor, depth, descriptor_filter)
 
-        def get_child_descriptors(descriptor, depth, descriptor_filter):
-            """
-            Return a list of all child descriptors down to the specified depth
-            that match the descriptor filter. Includes `descriptor`
-
-            descriptor: The parent to search inside
-            depth: The number of levels to descend, or None for infinite depth
-            descriptor_filter(descriptor): A function that returns True
-                if descriptor should be included in the results
-            """
-            if descriptor_filter(descriptor):
-                descriptors = [descriptor]
-            else:
-                descriptors = []
-
-            if depth is None or depth > 0:
-                new_depth = depth - 1 if depth is not None else depth
+        return ModelDataCache(descriptors, course_id, user, select_for_update)
 
-                for child in descriptor.get_children() + descriptor.get_required_module_descriptors():
-                    descriptors.extend(get_child_descriptors(child, new_depth, descriptor_filter))
+    @classmethod
+    def cache_for_users(cls, descriptors, course_id, users, chunk_size=250):
+        """
+        Build a ModelDataCache for each user in `users` while issuing a single
+        set of queries for all of them, rather than one set per user.
 
-            return descriptors
+        Content and settings scoped fields don't depend on the user, so they are
+        loaded once and shared between the returned caches. StudentModules,
+        preferences and user info are loaded for all users at once and then
+        split by student.
 
-        descriptors = get_child_descriptors(descriptor, depth, descriptor_filter)
+        descriptors: A list of XModuleDescriptors.
+        course_id: The id of the current course
+        users: A list of django users for which to cache data
+        chunk_size: The maximum number of user ids to put into a single query
 
-        return ModelDataCache(descriptors, course_id, user, select_for_update)
+        Returns a dict mapping user ids to ModelDataCaches
+        """
+        users = [user for user in users if user.is_authenticated()]
+        caches = {}
+        for user in users:
+            model_data_cache = cls.__new__(cls)
+            model_data_cache.cache = {}
+            model_data_cache.descriptors = descriptors
+            model_data_cache.select_for_update = False
+            model_data_cache.course_id = course_id
+            model_data_cache.user = user
+            caches[user.id] = model_data_cache
+
+        if not caches:
+            return caches
+
+        # Any of the caches can be used to compute the queries, since they
+        # only differ in the user they are for
+        template = caches[users[0].id]
+        user_ids = [user.id for user in users]
+        for scope, fields in template._fields_to_cache().items():
+            for field_object in template._retrieve_fields_for_users(scope, fields, user_ids, chunk_size):
+                cache_key = template._cache_key_from_field_object(scope, field_object)
+                if scope in (Scope.content, Scope.settings):
+                    for model_data_cache in caches.itervalues():
+                        model_data_cache.cache[cache_key] = field_object
+                else:
+                    caches[field_object.student_id].cache[cache_key] = field_object
+
+        return caches
 
     def _query(self, model_class, **kwargs):
         """
@@ -181,6 +314,46 @@ class ModelDataCache(object):
         else:
             raise InvalidScopeError(scope)
 
+    def _retrieve_fields_for_users(self, scope, fields, user_ids, chunk_size):
+        """
+        Queries the database for all of the fields in the specified scope,
+        for all of the users in `user_ids` at once
+        """
+        if scope in (Scope.content, Scope.settings, Scope.children, Scope.parent):
+            return self._retrieve_fields(scope, fields)
+
+        def for_user_chunks(query):
+            """
+            Run `query` (a function taking a list of user ids) once per chunk of user_ids
+            """
+            return chain.from_iterable(query(user_chunk) for user_chunk in chunks(user_ids, chunk_size))
+
+        if scope == Scope.user_state:
+            locations = [descriptor.location.url() for descriptor in self.descriptors]
+            return for_user_chunks(lambda user_chunk: self._chunked_query(
+                StudentModule,
+                'module_state_key__in',
+                locations,
+                course_id=self.course_id,
+                student__in=user_chunk,
+            ))
+        elif scope == Scope.preferences:
+            return for_user_chunks(lambda user_chunk: self._chunked_query(
+                XModuleStudentPrefsField,
+                'module_type__in',
+                set(descriptor.module_class.__name__ for descriptor in self.descriptors),
+                student__in=user_chunk,
+                field_name__in=set(field.name for field in fields),
+            ))
+        elif scope == Scope.user_info:
+            return for_user_chunks(lambda user_chunk: self._query(
+                XModuleStudentInfoField,
+                student__in=user_chunk,
+                field_name__in=set(field.name for field in fields),
+            ))
+        else:
+            raise InvalidScopeError(scope)
+
     def _fields_to_cache(self):
         """
         Returns a map of scopes to fields in that scope that should be cached
@@ -346,6 +519,10 @@ class LmsKeyValueStore(KeyValueStore):
         `kv_dict`: A dictionary of dirty fields that maps
           xblock.DbModel._key : value
 
+        While writes are buffered for the current request (see FieldObjectWriteBuffer),
+        the field objects are only marked to be saved, so no KeyValueMultiSaveError
+        reporting which fields were saved is raised here: a failure to save them is
+        raised, as a DatabaseError, when the buffer is flushed.
         """
         saved_fields = []
         # field_objects maps a field_object to a list of associated fields
@@ -378,7 +555,7 @@ class LmsKeyValueStore(KeyValueStore):
         for field_object in field_objects:
             try:
                 # Save the field object that we made above
-                field_object.save()
+                save_field_object(field_object)
                 # If save is successful on this scope, add the saved fields to
                 # the list of successful saves
                 saved_fields.extend([field.field_name for field in field_objects[field_object]])
@@ -401,8 +578,11 @@ class LmsKeyValueStore(KeyValueStore):
             state = json.loads(field_object.state)
             del state[key.field_name]
             field_object.state = json.dumps(state)
-            field_object.save()
+            save_field_object(field_object)
         else:
+            write_buffer = FieldObjectWriteBuffer.current()
+            if write_buffer is not None:
+                write_buffer.discard(field_object)
             field_object.delete()
 
     def has(self, key):
@@ -12,8 +12,12 @@ file and check it in at the same time as your model changes. To do that,
 ASSUMPTIONS: modules have unique IDs, even across different module_types
 
 """
+import threading
+from contextlib import contextmanager
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
@@ -90,6 +94,9 @@ class StudentModuleHistory(models.Model):
     grade = models.FloatField(null=True, blank=True)
     max_grade = models.FloatField(null=True, blank=True)
 
+    # per thread, the list that history entries are collected in by batched_history
+    _pending = threading.local()
+
     @receiver(post_save, sender=StudentModule)
     def save_history(sender, instance, **kwargs):
         if instance.module_type in StudentModuleHistory.HISTORY_SAVING_TYPES:
@@ -99,7 +106,25 @@ class StudentModuleHistory(models.Model):
                                                  state=instance.state,
                                                  grade=instance.grade,
                                                  max_grade=instance.max_grade)
-            history_entry.save()
+            pending = getattr(StudentModuleHistory._pending, 'entries', None)
+            if pending is not None:
+                pending.append(history_entry)
+            else:
+                history_entry.save()
+
+    @staticmethod
+    @contextmanager
+    def batched_history():
+        """
+        A context manager that collects the history entries for the StudentModules
+        saved (by this thread) inside it, and inserts them all at once on the way out.
+        """
+        StudentModuleHistory._pending.entries = entries = []
+        try:
+            yield
+        finally:
+            StudentModuleHistory._pending.entries = None
+        StudentModuleHistory.objects.bulk_create(entries)
 
 
 class XModuleContentField(models.Model):
@@ -247,6 +272,52 @@ class OfflineComputedGrade(models.Model):
         return "[OfflineComputedGrade] %s: %s (%s) = %s" % (self.user, self.course_id, self.created, self.gradeset)
 
 
+class StudentGradeSummary(models.Model):
+    """
+    The most recently computed grade summary (the output of grades.grade) for
+    a given user and course.
+
+    Rows are marked stale whenever one of the user's problem grades in the
+    course changes, and are ignored if they were computed under a different
+    grading policy, or a different version of the course's content, than the
+    course's current one, or once the next start date in the course passes
+    (which may change what the user has access to, and so what is graded).
+    """
+    user = models.ForeignKey(User, db_index=True)
+    course_id = models.CharField(max_length=255, db_index=True)
+
+    # md5 of the grading policy in effect when the summary was computed
+    grading_policy_hash = models.CharField(max_length=32)
+    # the modulestore's version stamp of the course content the summary was computed from
+    course_version = models.CharField(max_length=255, default='')
+    stale = models.BooleanField(default=False)
+    # incremented by every invalidation, so that a summary computed from a row
+    # that has since been invalidated isn't written over it
+    generation = models.IntegerField(default=0)
+    # the first time after the summary was computed at which part of the course
+    # opens up, or null if there is none
+    expires = models.DateTimeField(null=True, blank=True)
+
+    grade_summary = models.TextField(null=True, blank=True)		# grade summary, stored as JSON
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = (('user', 'course_id'), )
+
+    @classmethod
+    def invalidate(cls, user_id, course_id):
+        """
+        Mark the grade summary for the given user and course (if any) as stale
+        """
+        cls.objects.filter(user=user_id, course_id=course_id).update(
+            stale=True, generation=F('generation') + 1)
+
+    def __unicode__(self):
+        return "[StudentGradeSummary] %s: %s (%s)" % (self.user, self.course_id, self.modified)
+
+
 class OfflineComputedGradeLog(models.Model):
     """
     Log of when offline grades are computed.
@@ -2,7 +2,7 @@ import json
 import logging
 import re
 import sys
-from functools import partial
+import weakref
 
 from django.conf import settings
 from django.contrib.auth.models import User
@@ -26,8 +26,8 @@ from xmodule.exceptions import NotFoundError, ProcessingError
 from xmodule.modulestore import Location
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
-from xmodule.x_module import ModuleSystem
-from xmodule_modifiers import replace_course_urls, replace_static_urls, add_histogram, wrap_xmodule, save_module  # pylint: disable=F0401
+from xmodule.x_module import ModuleSystem, XModule
+from xmodule_modifiers import rewrite_urls, add_histogram, wrap_xmodule, save_module  # pylint: disable=F0401
 
 import static_replace
 from psychometrics.psychoanalyze import make_psychometrics_data_update_handler
@@ -35,10 +35,10 @@ from student.models import unique_id_for_user
 
 from courseware.access import has_access
 from courseware.masquerade import setup_masquerade
-from courseware.model_data import LmsKeyValueStore, LmsUsage, ModelDataCache
+from courseware.model_data import LmsKeyValueStore, LmsUsage, ModelDataCache, flush_buffered_writes
 from xblock.runtime import KeyValueStore
 from xblock.core import Scope
-from courseware.models import StudentModule
+from courseware.models import StudentModule, StudentGradeSummary
 from util.sandboxing import can_execute_unsafe_code
 from util.json_request import JsonResponse
 
@@ -90,9 +90,127 @@ def toc_for_course(user, request, course, active_chapter, active_section, model_
     NOTE: assumes that if we got this far, user has access to course.  Returns
     None if this is not the case.
 
-    model_data_cache must include data from the course module and 2 levels of its descendents
+    The parts of the table of contents that are the same for every user are
+    computed once per course (see course_toc), so this only has to check which
+    chapters and sections the user has access to.  model_data_cache is only
+    used for courses whose table of contents varies by user in other ways, and
+    then must include data from the course module and 2 levels of its descendents
     '''
+    if not has_access(user, course, 'load', course.id):
+        return None
+
+    toc = course_toc(course)
+    if toc is None:
+        return _toc_for_course_modules(user, request, course, active_chapter, active_section, model_data_cache)
+
+    descriptors = {}
+    for chapter in course.get_children():
+        descriptors[chapter.location.url()] = chapter
+        for section in chapter.get_children():
+            descriptors[section.location.url()] = section
+
+    def can_load(location):
+        descriptor = descriptors.get(location)
+        return descriptor is not None and has_access(user, descriptor, 'load', course.id)
+
+    chapters = list()
+    for chapter_location, chapter, sections in toc:
+        if not can_load(chapter_location):
+            continue
+
+        chapters.append(dict(
+            chapter,
+            sections=[
+                dict(section, active=(chapter['url_name'] == active_chapter and
+                                      section['url_name'] == active_section))
+                for section_location, section in sections
+                if can_load(section_location)
+            ],
+            active=chapter['url_name'] == active_chapter,
+        ))
+    return chapters
+
+
+# the tables of contents of courses whose modulestore doesn't version them, by course descriptor
+_course_tocs = weakref.WeakKeyDictionary()
+
+
+def course_toc(course):
+    '''
+    Returns the parts of the table of contents of course that are the same for every
+    user, as a list of
+
+    (chapter location url, CHAPTER, [(section location url, SECTION), ...])
+
+    where CHAPTER and SECTION are the entries toc_for_course returns, without their
+    'sections' and 'active' keys.  Chapters and sections that are hidden from the
+    table of contents are left out, but ones that some users can't access aren't.
+
+    Returns None if the chapters or sections that are displayed vary by user (e.g.
+    because the course contains A/B tests).
 
+    If the modulestore versions courses, the result is cached for the version of
+    the course.  Otherwise, it's remembered for as long as the course descriptor is
+    around.
+    '''
+    course_version = modulestore().get_course_version(course.location)
+    if course_version is not None:
+        cache_key = 'courseware.toc.{0}.{1}'.format(course.id, course_version)
+        toc = cache.get(cache_key)
+        if toc is None:
+            toc = _compute_course_toc(course)
+            cache.set(cache_key, toc)
+    else:
+        toc = _course_tocs.get(course)
+        if toc is None:
+            toc = _course_tocs[course] = _compute_course_toc(course)
+
+    # False marks a table of contents that can't be shared between users
+    return toc if toc is not False else None
+
+
+def _compute_course_toc(course):
+    '''
+    Computes course_toc(course), returning False rather than None if it varies by user
+    '''
+    def displays_itself(descriptor):
+        # modules that override displayable_items (e.g. A/B tests) choose what to
+        # display for each user
+        return descriptor.module_class.displayable_items.im_func is XModule.displayable_items.im_func
+
+    toc = []
+    for chapter in course.get_children():
+        if not displays_itself(chapter):
+            return False
+        if chapter.lms.hide_from_toc:
+            continue
+
+        sections = []
+        for section in chapter.get_children():
+            if not displays_itself(section):
+                return False
+            if section.lms.hide_from_toc:
+                continue
+            sections.append((section.location.url(), {
+                'display_name': section.display_name_with_default,
+                'url_name': section.url_name,
+                'format': section.lms.format if section.lms.format is not None else '',
+                'due': section.lms.due,
+                'graded': section.lms.graded,
+            }))
+
+        toc.append((chapter.location.url(), {
+            'display_name': chapter.display_name_with_default,
+            'url_name': chapter.url_name,
+        }, sections))
+    return toc
+
+
+def _toc_for_course_modules(user, request, course, active_chapter, active_section, model_data_cache):
+    '''
+    Implements toc_for_course by instantiating the course, chapter, and section
+    modules for user, for courses whose table of contents varies by user.
+    '''
     course_module = get_module_for_descriptor(user, request, course, model_data_cache, course.id)
     if course_module is None:
         return None
@@ -308,6 +426,8 @@ def get_module_for_descriptor_internal(user, descriptor, model_data_cache, cours
         student_module.max_grade = event.get('max_value')
         # Save all changes to the underlying KeyValueStore
         student_module.save()
+        # The stored course grade summary no longer reflects this grade
+        StudentGradeSummary.invalidate(user.id, course_id)
 
         # Bin score into range and increment stats
         score_bucket = get_score_bucket(student_module.grade, student_module.max_grade)
@@ -336,10 +456,9 @@ def get_module_for_descriptor_internal(user, descriptor, model_data_cache, cours
                           user=user,
                           # TODO (cpennington): This should be removed when all html from
                           # a module is coming through get_html and is therefore covered
-                          # by the replace_static_urls code below
-                          replace_urls=partial(
-                              static_replace.replace_static_urls,
-                              data_directory=getattr(descriptor, 'data_dir', None),
+                          # by the rewrite_urls code below
+                          replace_urls=static_replace.get_url_rewriter(
+                              getattr(descriptor, 'data_dir', None),
                               course_namespace=descriptor.location._replace(category=None, name=None),
                           ),
                           node_path=settings.NODE_PATH,
@@ -384,14 +503,12 @@ def get_module_for_descriptor_internal(user, descriptor, model_data_cache, cours
     if wrap_xmodule_display == True:
         _get_html = wrap_xmodule(module.get_html, module, 'xmodule_display.html')
 
-    module.get_html = replace_static_urls(
-        _get_html,
+    # Rewrite /static/ urls, and allow URLs of the form '/course/' refer to the root
+    #   of multicourse directory hierarchy of this course
+    module.get_html = rewrite_urls(_get_html, static_replace.get_url_rewriter(
         getattr(descriptor, 'data_dir', None),
-        course_namespace=module.location._replace(category=None, name=None))
-
-    # Allow URLs of the form '/course/' refer to the root of multicourse directory
-    #   hierarchy of this course
-    module.get_html = replace_course_urls(module.get_html, course_id)
+        course_namespace=module.location._replace(category=None, name=None),
+        course_id=course_id))
 
     if settings.MITX_FEATURES.get('DISPLAY_HISTOGRAMS_TO_STAFF'):
         if has_access(user, module, 'staff', course_id):
@@ -526,6 +643,8 @@ def modx_dispatch(request, dispatch, location, course_id):
         ajax_return = instance.handle_ajax(dispatch, data)
         # Save any fields that have changed to the underlying KeyValueStore
         instance.save()
+        # and write them now, so that the response doesn't report a change that wasn't saved
+        flush_buffered_writes()
 
     # If we can't find the module, respond with a 404
     except NotFoundError:
@@ -4,7 +4,8 @@ from django.test import TestCase
 
 from xmodule.modulestore import Location
 import courseware.access as access
-from .factories import CourseEnrollmentAllowedFactory
+from request_cache.middleware import RequestCache
+from .factories import CourseEnrollmentAllowedFactory, GroupFactory, UserFactory
 import datetime
 from django.utils.timezone import UTC
 
@@ -106,3 +107,28 @@ class AccessTestCase(TestCase):
 
         # TODO:
         # Non-staff cannot enroll outside the open enrollment period if not specifically allowed
+
+    def test_has_access_memoized_per_request(self):
+        location = Location('i4x://edX/toy/course/2012_Fall')
+        user = UserFactory(is_staff=False)
+        staff_group = GroupFactory(name='staff_edX/toy/2012_Fall')
+
+        middleware = RequestCache()
+        middleware.process_request(None)
+        try:
+            self.assertFalse(access.has_access(user, location, 'staff'))
+
+            # group membership is only read once per request...
+            with self.assertNumQueries(0):
+                self.assertFalse(access.has_access(user, location, 'staff'))
+                self.assertFalse(access.has_access(user, location, 'instructor'))
+
+            # ...but changing it forgets the memoized decisions
+            user.groups.add(staff_group)
+            self.assertTrue(access.has_access(user, location, 'staff'))
+        finally:
+            middleware.process_response(None, None)
+
+        # outside of a request, nothing is memoized
+        user.groups.remove(staff_group)
+        self.assertFalse(access.has_access(user, location, 'staff'))
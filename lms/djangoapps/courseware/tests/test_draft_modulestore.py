@@ -1,5 +1,6 @@
 from django.test import TestCase
 from django.test.utils import override_settings
+from mock import patch
 
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore import Location
@@ -19,3 +20,34 @@ class TestDraftModuleStore(TestCase):
         # test success is just getting through the above statement.
         # The bug was that 'course_id' argument was
         # not allowed to be passed in (i.e. was throwing exception)
+
+    def test_draft_and_published_read_together(self):
+        store = modulestore()
+        location = Location('i4x', 'edX', 'drafts', 'html', 'merged_read')
+        store.create_and_save_xmodule(location, metadata={'display_name': 'Published'})
+        store.publish(location, 0)
+        store.update_metadata(location, {'display_name': 'Draft'})
+
+        def item_queries(find):
+            """
+            Returns the calls to find that looked for html modules
+            """
+            return [call for call in find.call_args_list if call[0][0].get('_id.category') == 'html']
+
+        with patch.object(store.collection, 'find', wraps=store.collection.find) as find:
+            item = store.get_item(location)
+            self.assertEqual(len(item_queries(find)), 1)
+        self.assertTrue(item.is_draft)
+        self.assertEqual(item.display_name, 'Draft')
+        self.assertEqual(item.location, location)
+
+        with patch.object(store.collection, 'find', wraps=store.collection.find) as find:
+            items = store.get_items(location.replace(name=None))
+            self.assertEqual(len(item_queries(find)), 1)
+        self.assertEqual([(item.location, item.is_draft) for item in items], [(location, True)])
+
+        # once the draft is published, the published item is read
+        store.publish(location, 0)
+        item = store.get_item(location)
+        self.assertFalse(item.is_draft)
+        self.assertEqual(item.display_name, 'Draft')
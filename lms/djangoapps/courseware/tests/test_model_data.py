@@ -6,8 +6,9 @@ from mock import Mock, patch
 from functools import partial
 
 from courseware.model_data import LmsKeyValueStore, InvalidWriteError
-from courseware.model_data import InvalidScopeError, ModelDataCache
-from courseware.models import StudentModule, XModuleContentField, XModuleSettingsField
+from courseware.model_data import InvalidScopeError, ModelDataCache, FieldObjectWriteBuffer
+from courseware.middleware import FieldObjectWriteBufferMiddleware
+from courseware.models import StudentModule, StudentModuleHistory, XModuleContentField, XModuleSettingsField
 from courseware.models import XModuleStudentInfoField, XModuleStudentPrefsField
 
 from student.tests.factories import UserFactory
@@ -19,6 +20,7 @@ from xblock.core import Scope, BlockScope
 from xmodule.modulestore import Location
 from django.test import TestCase
 from django.db import DatabaseError
+from django.http import HttpResponse
 from xblock.core import KeyValueMultiSaveError
 
 
@@ -181,6 +183,44 @@ class TestStudentModuleStorage(TestCase):
         self.assertEquals(len(exception_context.exception.saved_field_names), 0)
 
 
+class TestBufferedStudentModuleStorage(TestCase):
+
+    def setUp(self):
+        student_module = StudentModuleFactory(state=json.dumps({'a_field': 'a_value'}))
+        self.user = student_module.student
+        self.mdc = ModelDataCache([mock_descriptor([mock_field(Scope.user_state, 'a_field')])], course_id, self.user)
+        self.kvs = LmsKeyValueStore({}, self.mdc)
+        FieldObjectWriteBuffer.start()
+
+    def tearDown(self):
+        FieldObjectWriteBuffer.stop()
+
+    def test_buffered_writes(self):
+        "Test that buffered writes to a StudentModule are saved once, when the buffer is flushed"
+        history_count = StudentModuleHistory.objects.count()
+        self.kvs.set(user_state_key('a_field'), 'new_value')
+        self.kvs.set(user_state_key('b_field'), 'b_value')
+        self.assertEquals({'a_field': 'a_value'}, json.loads(StudentModule.objects.all()[0].state))
+        self.assertEquals(1, len(FieldObjectWriteBuffer.current()))
+
+        # the history entries are inserted all at once, not saved one by one
+        with patch.object(StudentModuleHistory, 'save') as mock_history_save:
+            FieldObjectWriteBuffer.stop().flush()
+            self.assertFalse(mock_history_save.called)
+
+        self.assertEquals({'a_field': 'new_value', 'b_field': 'b_value'}, json.loads(StudentModule.objects.all()[0].state))
+        self.assertEquals(history_count + 1, StudentModuleHistory.objects.count())
+
+    def test_failed_flush(self):
+        "Test that a failure to save the buffered writes at the end of a request gives a 500 response"
+        self.kvs.set(user_state_key('a_field'), 'new_value')
+        with patch.object(StudentModule, 'save', side_effect=DatabaseError):
+            response = FieldObjectWriteBufferMiddleware().process_response(Mock(path='/'), HttpResponse('success'))
+        self.assertEquals(500, response.status_code)
+        self.assertIsNone(FieldObjectWriteBuffer.current())
+        self.assertEquals({'a_field': 'a_value'}, json.loads(StudentModule.objects.all()[0].state))
+
+
 class TestMissingStudentModule(TestCase):
     def setUp(self):
         self.user = UserFactory.create(username='user')
@@ -217,6 +257,33 @@ class TestMissingStudentModule(TestCase):
         self.assertFalse(self.kvs.has(user_state_key('a_field')))
 
 
+class TestCacheForUsers(TestCase):
+    def setUp(self):
+        self.student_modules = [
+            StudentModuleFactory(state=json.dumps({'a_field': 'value_%d' % index}))
+            for index in range(3)
+        ]
+        self.users = [student_module.student for student_module in self.student_modules]
+        self.users.append(UserFactory.create(username='no_state_user'))
+        self.descriptors = [mock_descriptor([mock_field(Scope.user_state, 'a_field')])]
+
+    def test_cache_for_users(self):
+        "Test that a single bulk load finds the same StudentModules as per-user loads"
+        caches = ModelDataCache.cache_for_users(self.descriptors, course_id, self.users, chunk_size=2)
+        self.assertEquals(set(user.id for user in self.users), set(caches.keys()))
+
+        for index, user in enumerate(self.users[:3]):
+            kvs = LmsKeyValueStore({}, caches[user.id])
+            self.assertEquals('value_%d' % index, kvs.get(user_state_key('a_field')))
+
+        self.assertFalse(LmsKeyValueStore({}, caches[self.users[3].id]).has(user_state_key('a_field')))
+
+    def test_cache_for_users_queries(self):
+        "Test that the number of queries doesn't depend on the number of users"
+        with self.assertNumQueries(1):
+            ModelDataCache.cache_for_users(self.descriptors, course_id, self.users)
+
+
 class StorageTestBase(object):
     """
     A base class for that gets subclassed when testing each of the scopes.
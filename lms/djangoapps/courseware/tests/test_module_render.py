@@ -227,3 +227,20 @@ class TestTOC(TestCase):
 
         actual = render.toc_for_course(self.portal_user, request, self.toy_course, chapter, section, model_data_cache)
         assert reduce(lambda x, y: x and (y in actual), expected, True)
+
+    def test_toc_without_modules(self):
+        chapter = 'Overview'
+        section = 'Welcome'
+        request = RequestFactory().get('%s/%s/%s' % ('/courses', self.course_name, chapter))
+        model_data_cache = ModelDataCache.cache_for_descriptor_descendents(
+            self.toy_course.id, self.portal_user, self.toy_course, depth=2)
+
+        # the table of contents comes from the precomputed course structure, without loading any modules
+        with patch('courseware.module_render.get_module_for_descriptor') as mock_get_module:
+            actual = render.toc_for_course(self.portal_user, request, self.toy_course, chapter, section, model_data_cache)
+            self.assertFalse(mock_get_module.called)
+
+        expected = render._toc_for_course_modules(
+            self.portal_user, request, self.toy_course, chapter, section, model_data_cache)
+        self.assertEqual(expected, actual)
+        self.assertIsNotNone(render.course_toc(self.toy_course))
@@ -2,16 +2,20 @@
 
 # text processing dependancies
 import json
+from datetime import timedelta
+from mock import patch
 from textwrap import dedent
 
 from django.contrib.auth.models import User
 from django.test.client import RequestFactory
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
+from django.utils import timezone
 
 # Need access to internal func to put users in the right group
 from courseware import grades
 from courseware.model_data import ModelDataCache
+from courseware.models import StudentGradeSummary
 
 from xmodule.modulestore.django import modulestore
 
@@ -460,6 +464,125 @@ class TestCourseGrader(TestSubmittingProblems):
         self.check_grade_percent(1.0)
         self.assertEqual(self.get_grade_summary()['grade'], 'A')
 
+    def test_materialized_grade(self):
+        """
+        Check that the stored grade summary is reused until one of the student's grades changes.
+        """
+        self.basic_setup()
+        fake_request = self.factory.get(reverse('progress',
+                                        kwargs={'course_id': self.course.id}))
+
+        self.assertEqual(grades.materialized_grade(self.student_user, fake_request, self.course)['percent'], 0)
+
+        # With no grade changes, the summary shouldn't be recomputed
+        with patch('courseware.grades.grade') as mock_grade:
+            self.assertEqual(grades.materialized_grade(self.student_user, fake_request, self.course)['percent'], 0)
+            self.assertFalse(mock_grade.called)
+
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        summary = grades.materialized_grade(self.student_user, fake_request, self.course)
+        self.assertEqual(summary['percent'], 0.33)
+        self.assertEqual(summary['grade'], 'B')
+
+        # A change to the course's content means the summary has to be recomputed
+        modulestore().update_course_version(self.course.location)
+        with patch('courseware.grades.grade', return_value={'percent': 0.5}) as mock_grade:
+            self.assertEqual(grades.materialized_grade(self.student_user, fake_request, self.course)['percent'], 0.5)
+            self.assertTrue(mock_grade.called)
+
+    def test_materialized_grade_invalidated_while_grading(self):
+        """
+        Check that a grade change made while the summary is being computed isn't lost.
+        """
+        self.basic_setup()
+        fake_request = self.factory.get(reverse('progress',
+                                        kwargs={'course_id': self.course.id}))
+        grades.materialized_grade(self.student_user, fake_request, self.course)
+        StudentGradeSummary.invalidate(self.student_user.id, self.course.id)
+
+        def grade_and_invalidate(student, request, course):
+            """
+            Grades the student, as a problem is graded behind its back
+            """
+            StudentGradeSummary.invalidate(student.id, course.id)
+            return {'percent': 0.5}
+
+        with patch('courseware.grades.grade', side_effect=grade_and_invalidate):
+            self.assertEqual(grades.materialized_grade(self.student_user, fake_request, self.course)['percent'], 0.5)
+        self.assertTrue(StudentGradeSummary.objects.get(user=self.student_user, course_id=self.course.id).stale)
+
+    def test_materialized_grade_expires(self):
+        """
+        Check that the stored grade summary is recomputed once part of the course opens up.
+        """
+        self.basic_setup()
+        fake_request = self.factory.get(reverse('progress',
+                                        kwargs={'course_id': self.course.id}))
+        with patch('courseware.grades._next_access_change', return_value=timezone.now() + timedelta(days=1)):
+            grades.materialized_grade(self.student_user, fake_request, self.course)
+        with patch('courseware.grades.grade') as mock_grade:
+            grades.materialized_grade(self.student_user, fake_request, self.course)
+            self.assertFalse(mock_grade.called)
+
+        StudentGradeSummary.objects.filter(user=self.student_user, course_id=self.course.id).update(
+            expires=timezone.now() - timedelta(seconds=1))
+        with patch('courseware.grades.grade', return_value={'percent': 0.5}) as mock_grade:
+            self.assertEqual(grades.materialized_grade(self.student_user, fake_request, self.course)['percent'], 0.5)
+            self.assertTrue(mock_grade.called)
+
+    def test_next_access_change(self):
+        """
+        Check that the next start date of anything graded in the course is found.
+        """
+        self.basic_setup()
+        self.assertIsNone(grades._next_access_change(self.course))
+
+        later = timezone.now() + timedelta(days=2)
+        section = self.course.grading_context['all_descriptors'][-1]
+        section.lms.start = later
+        self.assertEqual(grades._next_access_change(self.course), later)
+
+        section.lms.days_early_for_beta = 1
+        self.assertEqual(grades._next_access_change(self.course), later - timedelta(days=1))
+
+    def test_iterate_materialized_grades_for(self):
+        """
+        Check that stored grade summaries are used when grading many students, and
+        that the rest are computed and stored.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        fake_request = self.factory.get(reverse('progress',
+                                        kwargs={'course_id': self.course.id}))
+
+        [(student, summary)] = grades.iterate_materialized_grades_for(self.course, [self.student_user], fake_request)
+        self.assertEqual(summary['percent'], 0.33)
+        self.assertTrue(StudentGradeSummary.objects.filter(user=self.student_user, course_id=self.course.id).exists())
+
+        with patch('courseware.grades.grade') as mock_grade:
+            [(student, summary)] = grades.iterate_materialized_grades_for(self.course, [self.student_user], fake_request)
+            self.assertFalse(mock_grade.called)
+        self.assertEqual(student, self.student_user)
+        self.assertEqual(summary['percent'], 0.33)
+
+    def test_progress_summary_and_grade(self):
+        """
+        Check that computing the progress summary and grade together gives the same
+        results as computing them separately.
+        """
+        self.weighted_setup()
+        self.submit_question_answer('H1P1', {'2_1': 'Correct', '2_2': 'Incorrect'})
+        model_data_cache = ModelDataCache.cache_for_descriptor_descendents(
+            self.course.id, self.student_user, self.course)
+        fake_request = self.factory.get(reverse('progress',
+                                        kwargs={'course_id': self.course.id}))
+
+        courseware_summary, grade_summary = grades.progress_summary_and_grade(
+            self.student_user, fake_request, self.course, model_data_cache)
+
+        self.assertEqual(self.get_progress_summary(), courseware_summary)
+        self.assertEqual(self.get_grade_summary(), grade_summary)
+
     def test_wrong_asnwers(self):
         """
         Check that answering incorrectly is graded properly.
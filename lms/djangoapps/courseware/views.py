@@ -712,9 +712,8 @@ def progress(request, course_id, student_id=None):
     model_data_cache = ModelDataCache.cache_for_descriptor_descendents(
         course_id, student, course, depth=None)
 
-    courseware_summary = grades.progress_summary(student, request, course,
-                                                 model_data_cache)
-    grade_summary = grades.grade(student, request, course, model_data_cache)
+    courseware_summary, grade_summary = grades.progress_summary_and_grade(
+        student, request, course, model_data_cache)
 
     if courseware_summary is None:
         #This means the student didn't have access to the course (which the instructor requested)
@@ -49,8 +49,7 @@ def offline_grade_calculation(course_id):
     print "%d enrolled students" % len(enrolled_students)
     course = get_course_by_id(course_id)
 
-    for student in enrolled_students:
-        gradeset = grades.grade(student, request, course, keep_raw_scores=True)
+    for student, gradeset in grades.iterate_grades_for(course, enrolled_students, request, keep_raw_scores=True):
         gs = enc.encode(gradeset)
         ocg, created = models.OfflineComputedGrade.objects.get_or_create(user=student, course_id=course_id)
         ocg.gradeset = gs
@@ -81,10 +80,14 @@ def student_grades(student, request, course, keep_raw_scores=False, use_offline=
     '''
     This is the main interface to get grades.  It has the same parameters as grades.grade, as well
     as use_offline.  If use_offline is True then this will look for an offline computed gradeset in the DB.
+    Otherwise, the student's stored grade summary is used if it's up to date (see grades.materialized_grade),
+    unless keep_raw_scores is True.
     '''
 
     if not use_offline:
-        return grades.grade(student, request, course, keep_raw_scores=keep_raw_scores)
+        if keep_raw_scores:
+            return grades.grade(student, request, course, keep_raw_scores=True)
+        return grades.materialized_grade(student, request, course)
 
     try:
         ocg = models.OfflineComputedGrade.objects.get(user=student, course_id=course.id)
@@ -93,3 +96,20 @@ def student_grades(student, request, course, keep_raw_scores=False, use_offline=
                     msg='Error: no offline gradeset available for %s, %s' % (student, course.id))
 
     return json.loads(ocg.gradeset)
+
+
+def iterate_student_grades(students, request, course, keep_raw_scores=False, use_offline=False):
+    '''
+    Yields (student, gradeset) for each of `students`, with the same parameters as student_grades.
+    When grades are computed online, students are graded in batches using grades.iterate_grades_for, or
+    grades.iterate_materialized_grades_for unless keep_raw_scores is True.
+    '''
+    if use_offline:
+        for student in students:
+            yield student, student_grades(student, request, course, keep_raw_scores=keep_raw_scores, use_offline=True)
+    elif not keep_raw_scores:
+        for student, gradeset in grades.iterate_materialized_grades_for(course, students, request):
+            yield student, gradeset
+    else:
+        for student, gradeset in grades.iterate_grades_for(course, students, request, keep_raw_scores=keep_raw_scores):
+            yield student, gradeset
@@ -30,13 +30,13 @@ from courseware import grades
 from courseware.access import (has_access, get_access_group_name,
                                course_beta_test_group_name)
 from courseware.courses import get_course_with_access
-from courseware.models import StudentModule
+from courseware.models import StudentModule, StudentGradeSummary
 from django_comment_common.models import (Role,
                                           FORUM_ROLE_ADMINISTRATOR,
                                           FORUM_ROLE_MODERATOR,
                                           FORUM_ROLE_COMMUNITY_TA)
 from django_comment_client.utils import has_forum_access
-from instructor.offline_gradecalc import student_grades, offline_grades_available
+from instructor.offline_gradecalc import student_grades, iterate_student_grades, offline_grades_available
 from instructor_task.api import (get_running_instructor_tasks,
                                  get_instructor_task_history,
                                  submit_rescore_problem_for_all_students,
@@ -330,6 +330,7 @@ def instructor_dashboard(request, course_id):
                 # delete the state
                 try:
                     student_module.delete()
+                    StudentGradeSummary.invalidate(student_module.student_id, course_id)
                     msg += "<font color='red'>Deleted student module state for %s!</font>" % module_state_key
                     event = {"problem": problem_url, "student": unique_student_identifier, "course": course_id}
                     track.views.server_track(request, "delete-student-module-state", event, page="idashboard")
@@ -972,20 +973,14 @@ def get_student_grade_summary_data(request, course, course_id, get_grades=True,
 
     header = ['ID', 'Username', 'Full Name', 'edX email', 'External email']
     assignments = []
-    if get_grades and enrolled_students.count() > 0:
-        # just to construct the header
-        gradeset = student_grades(enrolled_students[0], request, course, keep_raw_scores=get_raw_scores, use_offline=use_offline)
-        # log.debug('student {0} gradeset {1}'.format(enrolled_students[0], gradeset))
-        if get_raw_scores:
-            assignments += [score.section for score in gradeset['raw_scores']]
-        else:
-            assignments += [x['label'] for x in gradeset['section_breakdown']]
-    header += assignments
-
-    datatable = {'header': header, 'assignments': assignments, 'students': enrolled_students}
     data = []
 
-    for student in enrolled_students:
+    if get_grades:
+        gradesets = iterate_student_grades(enrolled_students, request, course, keep_raw_scores=get_raw_scores, use_offline=use_offline)
+    else:
+        gradesets = ((student, None) for student in enrolled_students)
+
+    for student, gradeset in gradesets:
         datarow = [student.id, student.username, student.profile.name, student.email]
         try:
             datarow.append(student.externalauthmap.external_email)
@@ -993,8 +988,13 @@ def get_student_grade_summary_data(request, course, course_id, get_grades=True,
             datarow.append('')
 
         if get_grades:
-            gradeset = student_grades(student, request, course, keep_raw_scores=get_raw_scores, use_offline=use_offline)
             log.debug('student={0}, gradeset={1}'.format(student, gradeset))
+            if not data:
+                # use the first student's gradeset to construct the header
+                if get_raw_scores:
+                    assignments += [score.section for score in gradeset['raw_scores']]
+                else:
+                    assignments += [x['label'] for x in gradeset['section_breakdown']]
             if get_raw_scores:
                 # TODO (ichuang) encode Score as dict instead of as list, so score[0] -> score['earned']
                 sgrades = [(getattr(score, 'earned', '') or score[0]) for score in gradeset['raw_scores']]
@@ -1004,6 +1004,9 @@ def get_student_grade_summary_data(request, course, course_id, get_grades=True,
             student.grades = sgrades  	# store in student object
 
         data.append(datarow)
+    header += assignments
+
+    datatable = {'header': header, 'assignments': assignments, 'students': enrolled_students}
     datatable['data'] = data
     return datatable
 
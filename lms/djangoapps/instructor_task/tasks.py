@@ -50,7 +50,8 @@ def rescore_problem(entry_id, xmodule_instance_args):
     filter_fcn = lambda(modules_to_update): modules_to_update.filter(state__contains='"done": true')
     return update_problem_module_state(entry_id,
                                        update_fcn, action_name, filter_fcn=filter_fcn,
-                                       xmodule_instance_args=xmodule_instance_args)
+                                       xmodule_instance_args=xmodule_instance_args,
+                                       prefetch_model_data=True)
 
 
 @task
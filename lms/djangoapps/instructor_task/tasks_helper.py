@@ -14,6 +14,7 @@ from celery.utils.log import get_task_logger
 from celery.signals import worker_process_init
 from celery.states import SUCCESS, FAILURE
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import transaction
 from dogapi import dog_stats_api
@@ -23,8 +24,8 @@ from xmodule.modulestore.django import modulestore
 import mitxmako.middleware as middleware
 from track.views import task_track
 
-from courseware.models import StudentModule
-from courseware.model_data import ModelDataCache
+from courseware.models import StudentModule, StudentGradeSummary
+from courseware.model_data import ModelDataCache, descriptor_descendents
 from courseware.module_render import get_module_for_descriptor_internal
 from instructor_task.models import InstructorTask, PROGRESS
 
@@ -71,7 +72,7 @@ def _get_current_task():
 
 
 def _perform_module_state_update(course_id, module_state_key, student_identifier, update_fcn, action_name, filter_fcn,
-                                 xmodule_instance_args):
+                                 xmodule_instance_args, prefetch_model_data=False):
     """
     Performs generic update by visiting StudentModule instances with the update_fcn provided.
 
@@ -89,6 +90,11 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
     the update is successful; False indicates the update on the particular student module failed.
     A raised exception indicates a fatal condition -- that no other student modules should be considered.
 
+    StudentModules are fetched (together with their students) INSTRUCTOR_TASK_CHUNK_SIZE at a time.
+    If `prefetch_model_data` is True, the model data needed to instantiate the module for each
+    student in a chunk is also loaded at once, and passed to the update_fcn in the
+    'model_data_caches' entry of the xmodule_instance_args (a dict mapping user ids to ModelDataCaches).
+
     The return value is a dict containing the task's results, with the following keys:
 
           'attempted': number of attempts made
@@ -148,25 +154,50 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
 
     task_progress = get_task_progress()
     _get_current_task().update_state(state=PROGRESS, meta=task_progress)
-    for module_to_update in modules_to_update:
-        num_attempted += 1
-        # There is no try here:  if there's an error, we let it throw, and the task will
-        # be marked as FAILED, with a stack trace.
-        with dog_stats_api.timer('instructor_tasks.module.time.step', tags=['action:{name}'.format(name=action_name)]):
-            if update_fcn(module_descriptor, module_to_update, xmodule_instance_args):
-                # If the update_fcn returns true, then it performed some kind of work.
-                # Logging of failures is left to the update_fcn itself.
-                num_updated += 1
-
-        # update task status:
-        task_progress = get_task_progress()
-        _get_current_task().update_state(state=PROGRESS, meta=task_progress)
-
-    return task_progress
+    last_progress_time = time()
+
+    if prefetch_model_data:
+        descriptors = descriptor_descendents(module_descriptor)
+
+    # Visit the modules a chunk at a time, in order of id.  Each chunk is fetched
+    # with its students, and (if requested) the model data that the update function
+    # needs for all of the chunk's students is loaded at once.
+    modules_to_update = modules_to_update.select_related('student').order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(modules_to_update.filter(id__gt=last_id)[:settings.INSTRUCTOR_TASK_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        chunk_instance_args = xmodule_instance_args
+        if prefetch_model_data:
+            chunk_instance_args = dict(xmodule_instance_args or {})
+            chunk_instance_args['model_data_caches'] = ModelDataCache.cache_for_users(
+                descriptors, course_id, [module_to_update.student for module_to_update in chunk]
+            )
+
+        for module_to_update in chunk:
+            num_attempted += 1
+            # There is no try here:  if there's an error, we let it throw, and the task will
+            # be marked as FAILED, with a stack trace.
+            with dog_stats_api.timer('instructor_tasks.module.time.step', tags=['action:{name}'.format(name=action_name)]):
+                if update_fcn(module_descriptor, module_to_update, chunk_instance_args):
+                    # If the update_fcn returns true, then it performed some kind of work.
+                    # Logging of failures is left to the update_fcn itself.
+                    num_updated += 1
+
+            # update task status, but not more often than every INSTRUCTOR_TASK_PROGRESS_INTERVAL seconds:
+            if time() - last_progress_time >= settings.INSTRUCTOR_TASK_PROGRESS_INTERVAL:
+                task_progress = get_task_progress()
+                _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+                last_progress_time = time()
+
+    return get_task_progress()
 
 
 def update_problem_module_state(entry_id, update_fcn, action_name, filter_fcn,
-                                xmodule_instance_args):
+                                xmodule_instance_args, prefetch_model_data=False):
     """
     Performs generic update by visiting StudentModule instances with the update_fcn provided.
 
@@ -233,7 +264,8 @@ def update_problem_module_state(entry_id, update_fcn, action_name, filter_fcn,
         # Now do the work:
         with dog_stats_api.timer('instructor_tasks.module.time.overall', tags=['action:{name}'.format(name=action_name)]):
             task_progress = _perform_module_state_update(course_id, module_state_key, student_ident, update_fcn,
-                                                         action_name, filter_fcn, xmodule_instance_args)
+                                                         action_name, filter_fcn, xmodule_instance_args,
+                                                         prefetch_model_data)
         # If we get here, we assume we've succeeded, so update the InstructorTask entry in anticipation.
         # But we do this within the try, in case creating the task_output causes an exception to be
         # raised.
@@ -271,8 +303,12 @@ def _get_module_instance_for_task(course_id, student, module_descriptor, xmodule
     These are passed, along with `grade_bucket_type`, to get_module_for_descriptor_internal, which sidesteps
     the need for a Request object when instantiating an xmodule instance.
     """
-    # reconstitute the problem's corresponding XModule:
-    model_data_cache = ModelDataCache.cache_for_descriptor_descendents(course_id, student, module_descriptor)
+    # reconstitute the problem's corresponding XModule, using the model data
+    # prefetched for the student if there is any:
+    model_data_caches = xmodule_instance_args.get('model_data_caches', {}) if xmodule_instance_args is not None else {}
+    model_data_cache = model_data_caches.get(student.id)
+    if model_data_cache is None:
+        model_data_cache = ModelDataCache.cache_for_descriptor_descendents(course_id, student, module_descriptor)
 
     # get request-related tracking information from args passthrough, and supplement with task-specific
     # information:
@@ -380,6 +416,7 @@ def delete_problem_module_state(_module_descriptor, student_module, xmodule_inst
     Always returns true, indicating success, if it doesn't raise an exception due to database error.
     """
     student_module.delete()
+    StudentGradeSummary.invalidate(student_module.student_id, student_module.course_id)
     # get request-related tracking information from args passthrough,
     # and supplement with task-specific information:
     request_info = xmodule_instance_args.get('request_info', {}) if xmodule_instance_args is not None else {}
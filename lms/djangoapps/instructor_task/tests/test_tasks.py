@@ -13,6 +13,8 @@ from mock import Mock, patch
 
 from celery.states import SUCCESS, FAILURE
 
+from django.test.utils import override_settings
+
 from xmodule.modulestore.exceptions import ItemNotFoundError
 
 from courseware.model_data import StudentModule
@@ -168,6 +170,38 @@ class TestInstructorTasks(InstructorTaskModuleTestCase):
         # check that entries were reset
         self._assert_num_attempts(students, 0)
 
+    @override_settings(INSTRUCTOR_TASK_CHUNK_SIZE=3)
+    def test_reset_with_some_state_in_chunks(self):
+        initial_attempts = 3
+        input_state = json.dumps({'attempts': initial_attempts})
+        num_students = 10
+        students = self._create_students_with_state(num_students, input_state)
+        self._test_run_with_task(reset_problem_attempts, 'reset', num_students)
+        self._assert_num_attempts(students, 0)
+
+    @override_settings(INSTRUCTOR_TASK_CHUNK_SIZE=3)
+    def test_prefetched_model_data(self):
+        # check that each update is passed model data prefetched for its own student
+        task_entry = self._create_input_entry()
+        students = self._create_students_with_state(7)
+        seen_students = []
+
+        def update_fcn(_module_descriptor, student_module, xmodule_instance_args):
+            """Record the student, after checking that a cache was prefetched for it"""
+            self.assertIn(student_module.student_id, xmodule_instance_args['model_data_caches'])
+            seen_students.append(student_module.student_id)
+            return True
+
+        task_function = (lambda entry_id, xmodule_instance_args:
+                         update_problem_module_state(entry_id,
+                                                     update_fcn, 'updated', filter_fcn=None,
+                                                     xmodule_instance_args=xmodule_instance_args,
+                                                     prefetch_model_data=True))
+        status = self._run_task_with_mock_celery(task_function, task_entry.id, task_entry.task_id)
+        self.assertEquals(status.get('attempted'), len(students))
+        self.assertEquals(status.get('updated'), len(students))
+        self.assertEquals(sorted(seen_students), sorted(student.id for student in students))
+
     def test_delete_with_some_state(self):
         # This will create StudentModule entries -- we don't have to worry about
         # the state inside them.
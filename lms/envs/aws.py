@@ -12,6 +12,7 @@ Common traits:
 # pylint: disable=W0401, W0614
 
 import json
+import multiprocessing
 
 from .common import *
 from logsettings import get_logger_config
@@ -206,6 +207,49 @@ XQUEUE_INTERFACE = AUTH_TOKENS['XQUEUE_INTERFACE']
 MODULESTORE = AUTH_TOKENS.get('MODULESTORE', MODULESTORE)
 CONTENTSTORE = AUTH_TOKENS.get('CONTENTSTORE', CONTENTSTORE)
 
+# The mongo modulestores keep the module data of the courses they load whole (e.g. for
+# the courseware) in memory, so that a course is only fetched once per process until
+# it's changed. This is the number of bytes each process may use for that.
+COURSE_DATA_CACHE_SIZE = ENV_TOKENS.get('COURSE_DATA_CACHE_SIZE', 50 * 1024 * 1024)
+MONGO_MODULESTORE_ENGINES = (
+    'xmodule.modulestore.mongo.MongoModuleStore',
+    'xmodule.modulestore.mongo.DraftMongoModuleStore',
+    'xmodule.modulestore.draft.DraftModuleStore',
+)
+
+
+def set_modulestore_options(modulestore_settings, engines, **options):
+    """
+    Sets options on each of the modulestores in modulestore_settings with one of
+    engines that doesn't have them set already
+    """
+    for store in modulestore_settings.values():
+        if store['ENGINE'] in engines:
+            for key, value in options.items():
+                store.setdefault('OPTIONS', {}).setdefault(key, value)
+
+
+def set_mongo_modulestore_options(modulestore_settings, **options):
+    """
+    Sets options on each of the mongo modulestores in modulestore_settings that
+    doesn't have them set already
+    """
+    set_modulestore_options(modulestore_settings, MONGO_MODULESTORE_ENGINES, **options)
+
+set_mongo_modulestore_options(MODULESTORE, course_data_cache_size=COURSE_DATA_CACHE_SIZE)
+
+# The xml modulestores load courses in a pool of XML_COURSE_LOAD_PROCESSES processes, and,
+# if XML_SNAPSHOT_DIR is set, keep a snapshot of each loaded course there to start up from
+# next time. Snapshots are pickles, and loading a pickle can run arbitrary code, so
+# XML_SNAPSHOT_DIR must only be writable by the user the LMS runs as.
+XML_COURSE_LOAD_PROCESSES = ENV_TOKENS.get('XML_COURSE_LOAD_PROCESSES', multiprocessing.cpu_count())
+XML_SNAPSHOT_DIR = ENV_TOKENS.get('XML_SNAPSHOT_DIR')
+set_modulestore_options(
+    MODULESTORE, ('xmodule.modulestore.xml.XMLModuleStore',),
+    course_load_processes=XML_COURSE_LOAD_PROCESSES,
+    snapshot_dir=XML_SNAPSHOT_DIR,
+)
+
 OPEN_ENDED_GRADING_INTERFACE = AUTH_TOKENS.get('OPEN_ENDED_GRADING_INTERFACE',
                                                OPEN_ENDED_GRADING_INTERFACE)
 
@@ -12,3 +12,4 @@ with open(ENV_ROOT / "cms.auth.json") as auth_file:
     CMS_AUTH_TOKENS = json.load(auth_file)
 
 MODULESTORE = CMS_AUTH_TOKENS['MODULESTORE']
+set_mongo_modulestore_options(MODULESTORE, course_data_cache_size=COURSE_DATA_CACHE_SIZE)
@@ -29,6 +29,7 @@ modulestore_options = {
     'collection': 'modulestore',
     'fs_root': DATA_DIR,
     'render_template': 'mitxmako.shortcuts.render_to_string',
+    'course_data_cache_size': 50 * 1024 * 1024,
 }
 
 MODULESTORE = {
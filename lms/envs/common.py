@@ -254,6 +254,17 @@ DEV_CONTENT = True
 TRACK_MAX_EVENT = 10000
 DEBUG_TRACK_LOG = False
 
+# Tracking events are queued and written out in batches by a background
+# thread, rather than on the thread that produced them.  When the queue is
+# full, events are dropped after waiting ENQUEUE_TIMEOUT seconds for room.
+TRACKING_PIPELINE = {
+    'ENABLED': True,
+    'MAX_QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+    'ENQUEUE_TIMEOUT': 0.01,
+}
+
 MITX_ROOT_URL = ''
 
 LOGIN_REDIRECT_URL = MITX_ROOT_URL + '/accounts/login'
@@ -488,6 +499,8 @@ MIDDLEWARE_CLASSES = (
     'course_wiki.course_nav.Middleware',
 
     'django.middleware.transaction.TransactionMiddleware',
+    # must come after TransactionMiddleware, so buffered writes are committed
+    'courseware.middleware.FieldObjectWriteBufferMiddleware',
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
 
     'django_comment_client.utils.ViewNameMiddleware',
@@ -691,6 +704,14 @@ CELERY_QUEUES = {
     DEFAULT_PRIORITY_QUEUE: {}
 }
 
+############################## INSTRUCTOR TASKS ###############################
+
+# Number of StudentModules that instructor tasks load (and prefetch data for) at once
+INSTRUCTOR_TASK_CHUNK_SIZE = 100
+
+# Minimum number of seconds between progress updates sent by a running instructor task
+INSTRUCTOR_TASK_PROGRESS_INTERVAL = 2
+
 ################################### APPS ######################################
 INSTALLED_APPS = (
     # Standard ones that are always installed...
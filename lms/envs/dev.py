@@ -32,6 +32,11 @@ MITX_FEATURES['ENABLE_HINTER_INSTRUCTOR_VIEW'] = True
 
 WIKI_ENABLED = True
 
+# Keep snapshots of the loaded xml courses, so that restarting the server doesn't parse
+# the courses that haven't changed again, and parse the rest in parallel
+MODULESTORE['default']['OPTIONS']['snapshot_dir'] = ENV_ROOT / "xml_snapshots"
+MODULESTORE['default']['OPTIONS']['course_load_processes'] = 4
+
 LOGGING = get_logger_config(ENV_ROOT / "log",
                             logging_env="dev",
                             local_loglevel="DEBUG",